@@ -13,6 +13,8 @@ from backend.models.users import User
 from backend.models.book_parts import BookPart
 from backend.models.kb_entries import KnowledgeBaseEntry
 from backend.models.summaries import Summary
+from backend.models.checkpoints import ExtractionCheckpoint
+from backend.models.entity_snapshots import EntityMention, EntitySnapshot
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
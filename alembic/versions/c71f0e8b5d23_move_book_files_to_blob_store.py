@@ -0,0 +1,59 @@
+"""move book files to blob store
+
+Revision ID: c71f0e8b5d23
+Revises: 9d4a7b2e6c15
+Create Date: 2026-10-18 11:26:37.551842
+
+"""
+import io
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from backend.storage import get_blob_store
+
+# revision identifiers, used by Alembic.
+revision: str = 'c71f0e8b5d23'
+down_revision: Union[str, None] = '9d4a7b2e6c15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.alter_column('book_files', 'file_data',
+               existing_type=postgresql.BYTEA(),
+               nullable=True)
+
+    # copy the files one at a time to the blob store, then free the column
+    connection = op.get_bind()
+    blob_store = get_blob_store()
+    book_ids = connection.execute(sa.text("SELECT id FROM book_files WHERE file_data IS NOT NULL")).scalars().all()
+    for book_id in book_ids:
+        data_hash, file_data = connection.execute(sa.text("SELECT data_hash, file_data FROM book_files WHERE id = :id"), {"id": book_id}).one()
+        blob_store.write_stream(data_hash, io.BytesIO(file_data))
+        connection.execute(sa.text("UPDATE book_files SET file_data = NULL WHERE id = :id"), {"id": book_id})
+
+
+def downgrade() -> None:
+    connection = op.get_bind()
+    blob_store = get_blob_store()
+    books = connection.execute(sa.text("SELECT id, data_hash FROM book_files WHERE file_data IS NULL")).all()
+
+    # the blobs of deleted books are removed, a book without its blob can't get its file back under NOT NULL
+    missing_books = [(book_id, data_hash) for book_id, data_hash in books if not blob_store.exists(data_hash)]
+    if missing_books:
+        raise RuntimeError(
+            f"Cannot restore book_files.file_data, the blobs of {len(missing_books)} books are missing : "
+            + ", ".join(f"{book_id} ({data_hash})" for book_id, data_hash in missing_books)
+            + ". Restore the blobs or delete these books, then run the downgrade again."
+        )
+
+    for book_id, data_hash in books:
+        with blob_store.open(data_hash) as f:
+            connection.execute(sa.text("UPDATE book_files SET file_data = :file_data WHERE id = :id"), {"id": book_id, "file_data": f.read()})
+
+    op.alter_column('book_files', 'file_data',
+               existing_type=postgresql.BYTEA(),
+               nullable=False)
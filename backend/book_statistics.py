@@ -0,0 +1,42 @@
+import math
+import uuid
+from sqlalchemy import Update, and_, func, select, update
+
+from backend.models.books import Book
+from backend.models.book_parts import BookPart
+
+# 1 token = 0.75 words
+WORDS_PER_TOKEN = 0.75
+
+
+def get_text_statistics(content: str) -> dict[str, int]:
+    """Return the word, character and estimated token counts of a book part content."""
+    word_count = len(content.split())
+    return {'word_count': word_count, 'char_count': len(content), 'token_count': math.ceil(word_count / WORDS_PER_TOKEN)}
+
+
+def refresh_book_statistics(book_id: uuid.UUID) -> Update:
+    """Statement recomputing the text statistics of a book from the counts of its parts."""
+    story_parts = and_(BookPart.book_id == book_id, BookPart.is_story_part == True)
+    extracted_story_parts = and_(story_parts, BookPart.is_entity_extracted == True)
+    return update(Book).where(Book.id == book_id).values(
+        story_char_count=select(func.coalesce(func.sum(BookPart.char_count), 0)).where(story_parts).scalar_subquery(),
+        story_token_count=select(func.coalesce(func.sum(BookPart.token_count), 0)).where(story_parts).scalar_subquery(),
+        extracted_char_count=select(func.coalesce(func.sum(BookPart.char_count), 0)).where(extracted_story_parts).scalar_subquery(),
+        extracted_token_count=select(func.coalesce(func.sum(BookPart.token_count), 0)).where(extracted_story_parts).scalar_subquery(),
+    )
+
+
+def update_book_statistics(book_id: uuid.UUID, book_part: BookPart, story: int = 0, extracted: int = 0) -> Update:
+    """Statement adding (1) or removing (-1) the counts of a book part to the story and extracted statistics of its book.
+
+    The counts are incremented by the database, concurrent updates of the same book are not lost.
+    """
+    values = {}
+    if story:
+        values[Book.story_char_count] = Book.story_char_count + story * book_part.char_count
+        values[Book.story_token_count] = Book.story_token_count + story * book_part.token_count
+    if extracted:
+        values[Book.extracted_char_count] = Book.extracted_char_count + extracted * book_part.char_count
+        values[Book.extracted_token_count] = Book.extracted_token_count + extracted * book_part.token_count
+    return update(Book).where(Book.id == book_id).values(values)
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import uuid
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer
+
+from backend.book_statistics import refresh_book_statistics
+from backend.database import lock_data_hash, try_advisory_xact_lock
+from backend.models.books import Book
+from backend.models.book_parts import BookPart
+from backend.models.kb_entries import KnowledgeBaseEntry
+from backend.models.summaries import Summary
+from backend.models.checkpoints import ExtractionCheckpoint
+from backend.models.entity_snapshots import EntityMention, EntitySnapshot
+from backend.storage import BlobStore
+from backend.tasks.chunking import get_splitter_config
+from backend.tasks.parsing import EXCLUDE_LABELS
+from backend.tasks.queue import JobQueue
+from core.config import parsing as parsing_config
+
+# Books uploaded by several users share a canonical book, a Book row without user identified by the file content
+# and the config that produces its parts. The user books reference it with canonical_book_id and read its parts,
+# entities and summaries until the user changes a part, the content is then copied to the user book (copy-on-write).
+
+
+def get_book_config_hash() -> str:
+    config = {'parsing': parsing_config, 'exclude_labels': EXCLUDE_LABELS, 'splitter': get_splitter_config()}
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get_content_book_id(book: Book) -> uuid.UUID:
+    """Id of the book holding the parts, entities and summaries of a user book."""
+    return book.canonical_book_id or book.id
+
+
+async def get_canonical_book(db: AsyncSession, data_hash: str) -> Book | None:
+    return await db.scalar(
+        select(Book).options(undefer(Book.cover_image_base64))
+        .filter(Book.user_id.is_(None), Book.data_hash == data_hash, Book.config_hash == get_book_config_hash())
+    )
+
+
+async def get_or_create_canonical_book(db: AsyncSession, data_hash: str, **book_fields) -> tuple[Book, bool]:
+    """Return the canonical book of a file content and whether it was created, the book fields are used on creation.
+
+    Nothing is committed, the book is created in the transaction of the user book that references it.
+    """
+    canonical_book = await get_canonical_book(db, data_hash)
+    if canonical_book:
+        return canonical_book, False
+
+    canonical_book = Book(user_id=None, data_hash=data_hash, config_hash=get_book_config_hash(), **book_fields)
+    try:
+        async with db.begin_nested():
+            db.add(canonical_book)
+    except IntegrityError:
+        # created by a concurrent upload of the same file
+        return await get_canonical_book(db, data_hash), False
+    await db.refresh(canonical_book)
+    return canonical_book, True
+
+
+async def get_user_book_of_content(db: AsyncSession, user_id: uuid.UUID, content_book_id: uuid.UUID):
+    """Return the id and user of the book of a user that owns or references the content of content_book_id."""
+    return (await db.execute(select(Book.id, Book.user_id).filter(
+        Book.user_id == user_id,
+        (Book.id == content_book_id) | (Book.canonical_book_id == content_book_id)
+    ))).first()
+
+
+async def delete_book_content(db: AsyncSession, book_id: uuid.UUID):
+    """Delete the entity snapshot and mentions, summaries, knowledge base entries, checkpoints and parts of a book, without committing."""
+    await db.execute(delete(EntityMention).filter(EntityMention.book_id == book_id))
+    await db.execute(delete(EntitySnapshot).filter(EntitySnapshot.book_id == book_id))
+    await db.execute(delete(Summary).filter(Summary.book_id == book_id))
+    await db.execute(delete(KnowledgeBaseEntry).filter(KnowledgeBaseEntry.book_id == book_id))
+    await db.execute(delete(ExtractionCheckpoint).filter(ExtractionCheckpoint.book_part_id.in_(select(BookPart.id).filter(BookPart.book_id == book_id))))
+    await db.execute(delete(BookPart).filter(BookPart.book_id == book_id))
+
+
+async def delete_unreferenced_blob(db: AsyncSession, blob_store: BlobStore, data_hash: str):
+    """Delete a stored file once no book references it, to call after the commit that removed the last reference.
+
+    The lock of the data hash is held by the uploads until their book is committed, a file that is being uploaded
+    again is either referenced here or written again by the upload once the lock is released.
+    """
+    await lock_data_hash(db, data_hash)
+    if not await db.scalar(select(Book.id).filter(Book.data_hash == data_hash).limit(1)):
+        await run_in_threadpool(blob_store.delete, data_hash)
+    await db.commit()
+
+
+async def release_canonical_book(db: AsyncSession, canonical_book_id: uuid.UUID, job_queue: JobQueue) -> str | None:
+    """Delete a canonical book and its content once no user book references it, without committing.
+
+    The tasks of the book hold its advisory lock while they write its content, the book is not deleted while one
+    of its jobs is queued or running (409), the lock is kept until the commit so that no task starts meanwhile.
+
+    Returns
+    -------
+    str | None
+        The data hash of the deleted book, its file is deleted by delete_unreferenced_blob after the commit.
+    """
+    # an upload attaching a user book to the canonical book is committed before or finds it deleted
+    await lock_data_hash(db, await db.scalar(select(Book.data_hash).filter(Book.id == canonical_book_id)))
+    if await db.scalar(select(Book.id).filter(Book.canonical_book_id == canonical_book_id).limit(1)):
+        return None
+
+    if not await try_advisory_xact_lock(db, canonical_book_id) or await run_in_threadpool(job_queue.get_active_job_ids, str(canonical_book_id)):
+        raise HTTPException(status_code=409, detail="The book is being processed, retry once its parsing or extraction is finished")
+
+    canonical_book = await db.scalar(select(Book).filter(Book.id == canonical_book_id))
+    await delete_book_content(db, canonical_book.id)
+    await db.delete(canonical_book)
+    return canonical_book.data_hash
+
+
+async def copy_on_write(db: AsyncSession, book: Book) -> dict[uuid.UUID, uuid.UUID]:
+    """Copy the shared content of a user book to the book itself and stop referencing the canonical book.
+
+    The parts are copied with the entities and summaries of the parts that were fully extracted, the unfinished
+    extraction work is not copied and is redone by the next extraction of the user book. Nothing is committed,
+    the canonical book is then released with release_canonical_book.
+
+    Returns
+    -------
+    dict[uuid.UUID, uuid.UUID]
+        The id of the copy of every part of the canonical book.
+    """
+
+    canonical_book_id = book.canonical_book_id
+    # the book stops referencing the canonical book first, a concurrent copy of the same book waits for this one and copies nothing
+    if not await db.scalar(
+        update(Book).where(Book.id == book.id, Book.canonical_book_id == canonical_book_id)
+        .values(canonical_book_id=None).returning(Book.id).execution_options(synchronize_session=False)
+    ):
+        raise HTTPException(status_code=409, detail="The book is already being changed")
+
+    # in reading order, parents are inserted before their children
+    book_parts = (await db.scalars(select(BookPart).filter(BookPart.book_id == canonical_book_id).order_by(BookPart.reading_order))).all()
+    part_ids = {book_part.id: uuid.uuid4() for book_part in book_parts}
+
+    if book_parts:
+        await db.execute(insert(BookPart), [
+            {**{column.key: getattr(book_part, column.key) for column in BookPart.__table__.columns},
+             'id': part_ids[book_part.id], 'book_id': book.id, 'parent_id': part_ids.get(book_part.parent_id)}
+            for book_part in book_parts
+        ])
+
+    extracted_part_ids = [book_part.id for book_part in book_parts if book_part.is_entity_extracted]
+    if extracted_part_ids:
+        for model in (KnowledgeBaseEntry, Summary):
+            rows = (await db.scalars(select(model).filter(model.book_id == canonical_book_id, model.book_part_id.in_(extracted_part_ids)))).all()
+            if rows:
+                await db.execute(insert(model), [
+                    {**{column.key: getattr(row, column.key) for column in model.__table__.columns},
+                     'id': uuid.uuid4(), 'book_id': book.id, 'book_part_id': part_ids[row.book_part_id]}
+                    for row in rows
+                ])
+
+    # the statistics of a user book are only kept once it owns its parts
+    await db.execute(refresh_book_statistics(book.id))
+    return part_ids
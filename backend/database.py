@@ -1,16 +1,40 @@
+import functools
 import os
+import uuid
+from contextlib import contextmanager
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 load_dotenv()
 SQLACHEMY_DATABASE_URL = f'postgresql+psycopg2://{os.getenv("POSTGRES_USER")}@{os.getenv("POSTGRES_HOST")}:{os.getenv("DATABASE_PORT")}/{os.getenv("POSTGRES_DB")}'
+ASYNC_SQLACHEMY_DATABASE_URL = f'postgresql+asyncpg://{os.getenv("POSTGRES_USER")}@{os.getenv("POSTGRES_HOST")}:{os.getenv("DATABASE_PORT")}/{os.getenv("POSTGRES_DB")}'
 
-engine = create_engine(SQLACHEMY_DATABASE_URL)
+# connection pool of each process, the timeouts are in seconds
+pool_config = {
+    'pool_size': int(os.getenv('DATABASE_POOL_SIZE', 5)),
+    'max_overflow': int(os.getenv('DATABASE_MAX_OVERFLOW', 10)),
+    'pool_timeout': float(os.getenv('DATABASE_POOL_TIMEOUT', 30)),
+    'pool_recycle': int(os.getenv('DATABASE_POOL_RECYCLE', 1800)),
+    'pool_pre_ping': True,
+}
+
+# synchronous engine, used by the worker tasks and the migrations
+engine = create_engine(SQLACHEMY_DATABASE_URL, **pool_config)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# asynchronous engine, used by the routers so that queries don't block the event loop
+async_engine = create_async_engine(
+    ASYNC_SQLACHEMY_DATABASE_URL,
+    connect_args={'timeout': float(os.getenv('DATABASE_CONNECT_TIMEOUT', 10)), 'command_timeout': float(os.getenv('DATABASE_COMMAND_TIMEOUT', 60))},
+    **pool_config
+)
+# objects stay usable after a commit, lazy loading is not available with asyncio
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 
 def get_db():
     db = SessionLocal()
@@ -18,3 +42,54 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_lock_id(key: uuid.UUID) -> int:
+    return key.int & 0x7fffffffffffffff
+
+
+@contextmanager
+def advisory_lock(key: uuid.UUID):
+    """Hold a postgres advisory lock on a dedicated connection, tasks working on the same book run one at a time."""
+    lock_id = get_lock_id(key)
+    with engine.connect() as connection:
+        connection.execute(text('SELECT pg_advisory_lock(:lock_id)'), {'lock_id': lock_id})
+        try:
+            yield
+        finally:
+            connection.execute(text('SELECT pg_advisory_unlock(:lock_id)'), {'lock_id': lock_id})
+
+
+async def try_advisory_xact_lock(db, key: uuid.UUID) -> bool:
+    """Take the advisory lock of a book until the end of the transaction of an async session, without waiting.
+
+    Returns False if a task holds it.
+    """
+    return await db.scalar(text('SELECT pg_try_advisory_xact_lock(:lock_id)'), {'lock_id': get_lock_id(key)})
+
+
+# the locks of the stored files use the two keys form of the advisory locks, they never conflict with the ones of the books
+BLOB_LOCK_NAMESPACE = 1
+
+
+async def lock_data_hash(db, data_hash: str):
+    """Take the advisory lock of a stored file until the end of the transaction of an async session, waiting for it.
+
+    The transactions adding the first or removing the last reference to a data hash hold it, so that a file is only
+    deleted when no committed or pending row references it.
+    """
+    await db.execute(text('SELECT pg_advisory_xact_lock(:namespace, :key)'), {'namespace': BLOB_LOCK_NAMESPACE, 'key': int(data_hash[:8], 16) - 2 ** 31})
+
+
+def book_lock(task):
+    """Decorator running a task with an advisory lock on its book_id argument."""
+    @functools.wraps(task)
+    def wrapper(book_id: str, *args, **kwargs):
+        with advisory_lock(uuid.UUID(str(book_id))):
+            return task(book_id, *args, **kwargs)
+    return wrapper
@@ -1,5 +1,12 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import cache
+from dotenv import load_dotenv
 from passlib.context import CryptContext
 
+load_dotenv()
+
 pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 
 
@@ -9,3 +16,28 @@ def hash_password(password: str):
 
 def verify_password(password: str, hashed_password: str):
     return pwd_context.verify(password, hashed_password)
+
+
+@cache
+def get_hashing_executor() -> Executor:
+    """Pool running the password hashing, a bcrypt call takes hundreds of milliseconds of CPU.
+
+    bcrypt releases the GIL, threads are enough unless the backend of passlib holds it. Calls beyond the
+    concurrency wait for a free worker, so a burst of logins uses at most that many cores.
+    """
+    concurrency = int(os.getenv('PASSWORD_HASHING_CONCURRENCY', os.cpu_count() or 1))
+    executor = os.getenv('PASSWORD_HASHING_EXECUTOR', 'thread')
+    if executor == 'thread':
+        return ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='password-hashing')
+    elif executor == 'process':
+        return ProcessPoolExecutor(max_workers=concurrency)
+    else:
+        raise ValueError(f"Unknown password hashing executor : {executor}")
+
+
+async def hash_password_async(password: str):
+    return await asyncio.get_running_loop().run_in_executor(get_hashing_executor(), hash_password, password)
+
+
+async def verify_password_async(password: str, hashed_password: str):
+    return await asyncio.get_running_loop().run_in_executor(get_hashing_executor(), verify_password, password, hashed_password)
@@ -1,6 +1,6 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from backend.routers import auth, users, books, book_parts, processes, entities
+from backend.routers import auth, users, books, book_parts, processes, entities, jobs
 
 app = FastAPI()
 
@@ -22,3 +22,4 @@ app.include_router(books.router, tags=['Books'], prefix='/api/books')
 app.include_router(book_parts.router, tags=['Book Parts'], prefix='/api/book_parts')
 app.include_router(processes.router, tags=['Processes'], prefix='/api/processes')
 app.include_router(entities.router, tags=['Entities'], prefix='/api/entities')
+app.include_router(jobs.router, tags=['Jobs'], prefix='/api/jobs')
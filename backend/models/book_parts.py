@@ -1,20 +1,37 @@
 from ..database import Base
-from sqlalchemy import TIMESTAMP, Boolean, Column, String, Integer, text
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import TIMESTAMP, Boolean, Column, Index, String, Integer, text
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
 from sqlalchemy.sql.schema import ForeignKey
 import uuid
 
 
 class BookPart(Base):
     __tablename__ = 'book_parts'
+    __table_args__ = (
+        Index('ix_book_parts_book_id_content_hash', 'book_id', 'content_hash'),
+        Index('ix_book_parts_book_id_reading_order', 'book_id', 'reading_order'),
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, nullable=False, default=uuid.uuid4)
     book_id = Column(UUID(as_uuid=True), ForeignKey('book_files.id'), nullable=False)
     parent_id = Column(UUID(as_uuid=True), ForeignKey('book_parts.id'), nullable=True)
     toc_id = Column(String, nullable=False)
     label = Column(String, nullable=False)
     content = Column(String, nullable=False)
+    # sha256 of the content, parts are matched on it instead of comparing the full content
+    content_hash = Column(String, nullable=True)
     sibling_index = Column(Integer, nullable=False)
+    # position in the table of contents : number of ancestors and index of the part in a depth first walk of the book
+    depth = Column(Integer, nullable=False)
+    reading_order = Column(Integer, nullable=False)
     is_story_part = Column(Boolean, nullable=False, server_default=text("true"))
     is_entity_extracted = Column(Boolean, nullable=False, server_default=text("false"))
     sub_parts_count = Column(Integer, nullable=False, server_default=text("1"))
+    # text statistics of the content, computed at parse time
+    word_count = Column(Integer, nullable=False, server_default=text("0"))
+    char_count = Column(Integer, nullable=False, server_default=text("0"))
+    token_count = Column(Integer, nullable=False, server_default=text("0"))
+    # offsets of the sub parts in the normalized content, computed with the splitter config of chunk_config_hash
+    chunk_starts = Column(ARRAY(Integer), nullable=True)
+    chunk_ends = Column(ARRAY(Integer), nullable=True)
+    chunk_config_hash = Column(String, nullable=True)
     created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text("now()"))
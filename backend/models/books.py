@@ -1,5 +1,6 @@
 from ..database import Base
-from sqlalchemy import TIMESTAMP, Boolean, Column, String, Integer, text
+from sqlalchemy import TIMESTAMP, Boolean, Column, Index, String, Integer, text
+from sqlalchemy.orm import deferred
 from sqlalchemy.dialects.postgresql import UUID, BYTEA
 from sqlalchemy.sql.schema import ForeignKey
 from sqlalchemy.sql.sqltypes import Enum
@@ -17,16 +18,28 @@ class FileType(enum.Enum):
 
 class Book(Base):
     __tablename__ = 'book_files'
+    # a single canonical book per file content and parsing config
+    __table_args__ = (Index('ix_book_files_canonical', 'data_hash', 'config_hash', unique=True, postgresql_where=text('user_id IS NULL')),)
     id = Column(UUID(as_uuid=True), primary_key=True, nullable=False, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
+    # canonical books have no user, they hold the parts, entities and summaries shared by the user books of the same file
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=True)
+    canonical_book_id = Column(UUID(as_uuid=True), ForeignKey('book_files.id'), nullable=True, index=True)
+    config_hash = Column(String, nullable=True)
     created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text("now()"))
     file_type = Column(Enum(FileType), nullable=False)
     original_file_name = Column(String, nullable=False)
     file_size = Column(Integer, nullable=False)
-    file_data = Column(BYTEA, nullable=False)
+    # large columns are only loaded when accessed or explicitly undeferred
+    # legacy storage of the uploaded file, new uploads are kept in the blob store under data_hash
+    file_data = deferred(Column(BYTEA, nullable=True))
     author = Column(String, nullable=False)
     title = Column(String, nullable=False)
     data_hash = Column(String, nullable=False)
-    cover_image_base64 = Column(String, nullable=True)
+    cover_image_base64 = deferred(Column(String, nullable=True))
     is_parsed = Column(Boolean, nullable=False, server_default=text("false"))
     extraction_start_time = Column(TIMESTAMP(timezone=True), nullable=True)
+    # text statistics of the story parts of the book and of the ones already extracted, see backend/book_statistics.py
+    story_char_count = Column(Integer, nullable=False, server_default=text("0"))
+    story_token_count = Column(Integer, nullable=False, server_default=text("0"))
+    extracted_char_count = Column(Integer, nullable=False, server_default=text("0"))
+    extracted_token_count = Column(Integer, nullable=False, server_default=text("0"))
@@ -0,0 +1,23 @@
+from backend.database import Base
+from sqlalchemy import TIMESTAMP, Column, String, Integer, UniqueConstraint, text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql.schema import ForeignKey
+import uuid
+
+
+class ExtractionStage:
+    ENTITY_EXTRACTION = 'entity_extraction'
+    SUMMARIZATION = 'summarization'
+    ENTITY_MERGING = 'entity_merging'
+    SUMMARY_MERGING = 'summary_merging'
+
+
+class ExtractionCheckpoint(Base):
+    __tablename__ = 'extraction_checkpoints'
+    __table_args__ = (UniqueConstraint('book_part_id', 'stage', 'sibling_index'),)
+    id = Column(UUID(as_uuid=True), primary_key=True, nullable=False, default=uuid.uuid4)
+    book_part_id = Column(UUID(as_uuid=True), ForeignKey('book_parts.id'), nullable=False, index=True)
+    stage = Column(String, nullable=False)
+    sibling_index = Column(Integer, nullable=True)
+    sibling_total = Column(Integer, nullable=True)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text("now()"))
@@ -0,0 +1,35 @@
+from backend.database import Base
+from sqlalchemy import TIMESTAMP, Column, Index, Integer, String, text
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, UUID
+from sqlalchemy.sql.schema import ForeignKey
+import uuid
+
+# version of the format of the serialized entities, snapshots of another version are rebuilt
+ENTITY_SNAPSHOT_VERSION = 2
+
+
+class EntitySnapshot(Base):
+    """Grouped entities of a book as served by the API, rebuilt at the end of every knowledge base building."""
+    __tablename__ = 'entity_snapshots'
+    id = Column(UUID(as_uuid=True), primary_key=True, nullable=False, default=uuid.uuid4)
+    book_id = Column(UUID(as_uuid=True), ForeignKey('book_files.id'), nullable=False, unique=True)
+    version = Column(Integer, nullable=False)
+    entities = Column(JSONB, nullable=False)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text("now()"))
+
+
+class EntityMention(Base):
+    """Offsets of the whole word mentions of an entity of the snapshot in a book part, written with the snapshot."""
+    __tablename__ = 'entity_mentions'
+    __table_args__ = (
+        Index('ix_entity_mentions_book_id_entity_name', 'book_id', 'entity_name'),
+        Index('ix_entity_mentions_book_part_id', 'book_part_id'),
+    )
+    id = Column(UUID(as_uuid=True), primary_key=True, nullable=False, default=uuid.uuid4)
+    book_id = Column(UUID(as_uuid=True), ForeignKey('book_files.id'), nullable=False)
+    book_part_id = Column(UUID(as_uuid=True), ForeignKey('book_parts.id'), nullable=False)
+    # name of the entity in the snapshot
+    entity_name = Column(String, nullable=False)
+    # start and end (exclusive) offsets in the content of the book part, in increasing order
+    starts = Column(ARRAY(Integer), nullable=False)
+    ends = Column(ARRAY(Integer), nullable=False)
@@ -4,7 +4,8 @@ from typing import Annotated
 from fastapi import APIRouter, Request, Response, status, Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import jwt, JWTError, ExpiredSignatureError
 
 from backend.models import users as user_models
@@ -12,7 +13,8 @@ from backend.models import users as user_models
 from backend.schemas import users as user_schemas
 
 from backend import hashing
-from backend.database import get_db
+from backend.database import get_async_db
+from backend.user_cache import UserCache, get_user_cache
 
 
 router = APIRouter()
@@ -27,7 +29,10 @@ def create_access_token(data: dict):
     return jwt.encode(to_encode, os.getenv('SECRET_KEY'), os.getenv('JWT_ALGORITHM'))
 
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Session = Depends(get_db)) -> user_schemas.UserResponseSchema:
+async def get_current_user(
+        token: Annotated[str, Depends(oauth2_scheme)],
+        db: AsyncSession = Depends(get_async_db),
+        user_cache: UserCache = Depends(get_user_cache)) -> user_schemas.UserResponseSchema:
     credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
     try:
         payload = jwt.decode(token, os.getenv('SECRET_KEY'), algorithms=[os.getenv('JWT_ALGORITHM')])
@@ -39,48 +44,63 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Se
     except JWTError:
         raise credentials_exception
 
-    user_in_db = db.query(user_models.User).filter(user_models.User.name == username).first()
+    # the balance of a cached user can be outdated, routes using it read the user from the database
+    cached_user = await user_cache.get(username)
+    if cached_user is not None:
+        return user_schemas.UserResponseSchema.model_validate(cached_user)
+
+    user_in_db = await db.scalar(select(user_models.User).filter(user_models.User.name == username))
 
     if not user_in_db:
         raise credentials_exception
 
-    return user_schemas.UserResponseSchema(name=user_in_db.name, email=user_in_db.email, id=user_in_db.id, role=user_in_db.role, balance=user_in_db.balance, created_at=user_in_db.created_at)
+    user = user_schemas.UserResponseSchema(name=user_in_db.name, email=user_in_db.email, id=user_in_db.id, role=user_in_db.role, balance=user_in_db.balance, created_at=user_in_db.created_at)
+    await user_cache.set(username, user.model_dump(mode='json'))
+    return user
+
+
+@router.get('/cache_stats')
+async def get_user_cache_stats(current_user: Annotated[user_schemas.UserResponseSchema, Depends(get_current_user)], user_cache: UserCache = Depends(get_user_cache)) -> dict:
+    if current_user.role != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Only administrators can read the cache statistics')
+    return user_cache.stats()
 
 
 @router.post('/register', status_code=status.HTTP_201_CREATED, response_model=user_schemas.UserResponseSchema)
-async def create_user(payload: user_schemas.CreateUserSchema, db: Session = Depends(get_db)):
-    user_in_db = db.query(user_models.User).filter(user_models.User.name == payload.name).first()
+async def create_user(payload: user_schemas.CreateUserSchema, db: AsyncSession = Depends(get_async_db)):
+    user_in_db = await db.scalar(select(user_models.User).filter(user_models.User.name == payload.name))
     if user_in_db:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f'User {payload.name} already exists')
 
-    user_in_db = db.query(user_models.User).filter(user_models.User.email == payload.email).first()
+    user_in_db = await db.scalar(select(user_models.User).filter(user_models.User.email == payload.email))
     if user_in_db:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f'Email {payload.email} is already used')
 
     if payload.password != payload.password_confirm:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Passwords do not match')
 
-    payload.password = hashing.hash_password(payload.password)
+    # bcrypt runs in the hashing pool, the event loop keeps serving the other requests
+    payload.password = await hashing.hash_password_async(payload.password)
     del payload.password_confirm
 
     new_user = user_models.User(**payload.model_dump())
 
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
     return new_user
 
 
 @router.post('/login', response_model=user_schemas.TokenSchema)
-async def read_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: Session = Depends(get_db)) -> user_schemas.TokenSchema:
+async def read_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: AsyncSession = Depends(get_async_db)) -> user_schemas.TokenSchema:
 
-    user_in_db = db.query(user_models.User).filter(user_models.User.name == form_data.username).first()
+    user_in_db = await db.scalar(select(user_models.User).filter(user_models.User.name == form_data.username))
 
     if not user_in_db:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f'User {form_data.username} does not exist')
 
-    if not hashing.verify_password(form_data.password, user_in_db.password):
+    if not await hashing.verify_password_async(form_data.password, user_in_db.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Wrong password')
 
     access_token = create_access_token({'sub': user_in_db.name})
@@ -1,15 +1,20 @@
 import uuid
 from backend.models.books import Book
 from backend.routers import auth
-from backend.schemas.book_parts import BookPartUpdateSchema, BookPartResponseSchema
-from fastapi import HTTPException
+from backend.schemas.book_parts import BookPartContentResponseSchema, BookPartTocEntrySchema, BookPartUpdateSchema, BookPartResponseSchema
+from fastapi import HTTPException, Query
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from backend.database import get_db
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.database import get_async_db
 from backend.models.book_parts import BookPart
 from typing import Annotated, List
 from backend.models.book_parts import BookPart
 from backend.schemas.users import UserResponseSchema
+from backend.storage import BlobStore, get_blob_store
+from backend.book_statistics import update_book_statistics
+from backend.canonical_books import copy_on_write, delete_unreferenced_blob, get_content_book_id, get_user_book_of_content, release_canonical_book
+from backend.tasks.queue import JobQueue, get_job_queue
 
 router = APIRouter()
 
@@ -18,27 +23,28 @@ router = APIRouter()
 async def get_book_part(
         book_part_id: str,
         current_user: Annotated[UserResponseSchema, Depends(auth.get_current_user)],
-        db: Session = Depends(get_db)) -> BookPartResponseSchema:
+        db: AsyncSession = Depends(get_async_db)) -> BookPartResponseSchema:
 
-    book_part = db.query(BookPart).filter(BookPart.id == book_part_id).first()
-    book = db.query(Book).filter(Book.id == book_part.book_id).first()
-
-    if (not book) or (not book_part):
-        raise HTTPException(status_code=404, detail="Book not found")
+    book_part = await db.scalar(select(BookPart).filter(BookPart.id == book_part_id))
+    if not book_part:
+        raise HTTPException(status_code=404, detail="Book part not found")
 
-    if book.user_id != current_user.id:
+    # the part can belong to the book of the user or to the canonical book it shares
+    book = await get_user_book_of_content(db, current_user.id, book_part.book_id)
+    if not book:
         raise HTTPException(status_code=403, detail="The book part does not belong to the current user")
 
     return BookPartResponseSchema(
         id=book_part.id,
-        book_id=book_part.book_id,
+        book_id=book.id,
         parent_id=book_part.parent_id,
         label=book_part.label,
         content=book_part.content,
         sibling_index=book_part.sibling_index,
         is_story_part=book_part.is_story_part,
         is_entity_extracted=book_part.is_entity_extracted,
-        created_at=book_part.created_at
+        created_at=book_part.created_at,
+        level=book_part.depth
     )
 
 
@@ -46,36 +52,100 @@ async def get_book_part(
 async def get_book_parts(
         book_id: str,
         current_user: Annotated[UserResponseSchema, Depends(auth.get_current_user)],
-        db: Session = Depends(get_db)) -> List[BookPartResponseSchema]:
+        db: AsyncSession = Depends(get_async_db)) -> List[BookPartResponseSchema]:
 
-    book_parts = db.query(BookPart).filter(BookPart.book_id == book_id).all()
-    book = db.query(Book).filter(Book.id == book_id).first()
+    book = (await db.execute(select(Book.id, Book.user_id, Book.canonical_book_id).filter(Book.id == book_id))).first()
+    book_parts = (await db.scalars(select(BookPart).filter(BookPart.book_id == get_content_book_id(book)).order_by(BookPart.reading_order))).all() if book else []
     if (not book) or (not book_parts):
         raise HTTPException(status_code=404, detail="Book parts not found")
 
     if book.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="The book parts do not belong to the current user")
 
-    def sort_book_parts(book_parts, parent_id=None, level=0):
-        result = []
-        parent_book_parts = sorted([bp for bp in book_parts if bp.parent_id == parent_id], key=lambda bp: bp.sibling_index)
-        for bp in parent_book_parts:
-            result.append(BookPartResponseSchema(
-                id=bp.id,
-                book_id=bp.book_id,
-                parent_id=bp.parent_id,
-                label=bp.label,
-                content=bp.content,
-                sibling_index=bp.sibling_index,
-                is_story_part=bp.is_story_part,
-                is_entity_extracted=bp.is_entity_extracted,
-                created_at=bp.created_at,
-                level=level
-            ))
-            result.extend(sort_book_parts(book_parts, bp.id, level + 1))
-        return result
-
-    return sort_book_parts(book_parts)
+    return [BookPartResponseSchema(
+        id=bp.id,
+        book_id=book.id,
+        parent_id=bp.parent_id,
+        label=bp.label,
+        content=bp.content,
+        sibling_index=bp.sibling_index,
+        is_story_part=bp.is_story_part,
+        is_entity_extracted=bp.is_entity_extracted,
+        created_at=bp.created_at,
+        level=bp.depth
+    ) for bp in book_parts]
+
+
+@router.get("/toc/{book_id}")
+async def get_table_of_contents(
+        book_id: uuid.UUID,
+        current_user: Annotated[UserResponseSchema, Depends(auth.get_current_user)],
+        preview_length: int = Query(default=100, ge=0, le=1000),
+        db: AsyncSession = Depends(get_async_db)) -> List[BookPartTocEntrySchema]:
+    """Return the parts of a book in reading order with the length and the first preview_length characters of their content."""
+
+    book = (await db.execute(select(Book.id, Book.user_id, Book.canonical_book_id).filter(Book.id == book_id))).first()
+    if not book:
+        raise HTTPException(status_code=404, detail="Book not found")
+
+    if book.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="The book does not belong to the current user")
+
+    # the content is not loaded, only its length and a preview, the entries are shown without one request per part
+    book_parts = (await db.execute(select(
+        BookPart.id, BookPart.parent_id, BookPart.label, BookPart.sibling_index, BookPart.is_story_part,
+        BookPart.is_entity_extracted, BookPart.sub_parts_count, BookPart.depth, BookPart.created_at, func.length(BookPart.content).label('length'),
+        func.substr(BookPart.content, 1, preview_length).label('preview')
+    ).filter(BookPart.book_id == get_content_book_id(book)).order_by(BookPart.reading_order))).all()
+    if not book_parts:
+        raise HTTPException(status_code=404, detail="Book parts not found")
+
+    return [BookPartTocEntrySchema(
+        id=bp.id,
+        book_id=book.id,
+        parent_id=bp.parent_id,
+        label=bp.label,
+        sibling_index=bp.sibling_index,
+        is_story_part=bp.is_story_part,
+        is_entity_extracted=bp.is_entity_extracted,
+        sub_parts_count=bp.sub_parts_count,
+        length=bp.length,
+        preview=bp.preview,
+        created_at=bp.created_at,
+        level=bp.depth
+    ) for bp in book_parts]
+
+
+@router.get("/content/{book_part_id}")
+async def get_book_part_content(
+        book_part_id: uuid.UUID,
+        current_user: Annotated[UserResponseSchema, Depends(auth.get_current_user)],
+        offset: int = Query(default=0, ge=0),
+        limit: int | None = Query(default=None, ge=1),
+        db: AsyncSession = Depends(get_async_db)) -> BookPartContentResponseSchema:
+    """Return the content of a book part, or the limit characters starting at offset."""
+
+    # only the requested range of the content is sent by the database, substr positions start at 1
+    content = func.substr(BookPart.content, offset + 1) if limit is None else func.substr(BookPart.content, offset + 1, limit)
+    book_part = (await db.execute(
+        select(BookPart.id, BookPart.book_id, content.label('content'), func.length(BookPart.content).label('length')).filter(BookPart.id == book_part_id)
+    )).first()
+    if not book_part:
+        raise HTTPException(status_code=404, detail="Book part not found")
+
+    book = await get_user_book_of_content(db, current_user.id, book_part.book_id)
+    if not book:
+        raise HTTPException(status_code=403, detail="The book part does not belong to the current user")
+
+    end = offset + len(book_part.content)
+    return BookPartContentResponseSchema(
+        id=book_part.id,
+        book_id=book.id,
+        offset=offset,
+        content=book_part.content,
+        length=book_part.length,
+        next_offset=end if end < book_part.length else None
+    )
 
 
 @router.put("/update/{book_part_id}")
@@ -83,33 +153,46 @@ async def update_book_part(
     book_part_id: uuid.UUID,
     book_part_update: BookPartUpdateSchema,
     current_user: Annotated[UserResponseSchema, Depends(auth.get_current_user)],
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    blob_store: BlobStore = Depends(get_blob_store),
+    job_queue: JobQueue = Depends(get_job_queue)
 ) -> BookPartResponseSchema:
 
-    book_part = db.query(BookPart).filter(BookPart.id == book_part_id).first()
+    book_part = await db.scalar(select(BookPart).filter(BookPart.id == book_part_id))
     if not book_part:
         raise HTTPException(status_code=404, detail="Book part not found")
 
-    book = db.query(Book).filter(Book.id == book_part.book_id).first()
+    book = await get_user_book_of_content(db, current_user.id, book_part.book_id)
     if not book:
-        raise HTTPException(status_code=404, detail="Book not found")
-
-    if book.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="The book part does not belong to the current user")
 
-    book_part.is_story_part = book_part_update.is_story_part
-    db.commit()
-    db.refresh(book_part)
-
-    level = 0
-    parent_book_part = db.query(BookPart).filter(BookPart.id == book_part.parent_id).first()
-    while parent_book_part:
-        level += 1
-        parent_book_part = db.query(BookPart).filter(BookPart.id == parent_book_part.parent_id).first()
+    released_data_hash = None
+    if book.id != book_part.book_id and book_part.is_story_part != book_part_update.is_story_part:
+        # the part belongs to a shared canonical book, the book of the user gets its own copy of the content before being changed
+        part_ids = await copy_on_write(db, await db.scalar(select(Book).filter(Book.id == book.id)))
+        released_data_hash = await release_canonical_book(db, book_part.book_id, job_queue)
+        book_part = await db.scalar(select(BookPart).filter(BookPart.id == part_ids[book_part.id]))
+
+    # only the request that actually changes the flag updates the statistics, concurrent identical requests wait for it and change nothing
+    changed_book_part = (await db.execute(
+        update(BookPart)
+        .where(BookPart.id == book_part.id, BookPart.is_story_part != book_part_update.is_story_part)
+        .values(is_story_part=book_part_update.is_story_part)
+        .returning(BookPart.book_id, BookPart.is_entity_extracted, BookPart.char_count, BookPart.token_count)
+        .execution_options(synchronize_session=False)
+    )).first()
+    if changed_book_part:
+        # the counts of the part are added to or removed from the statistics of its book
+        change = 1 if book_part_update.is_story_part else -1
+        await db.execute(update_book_statistics(changed_book_part.book_id, changed_book_part, story=change, extracted=change if changed_book_part.is_entity_extracted else 0))
+    await db.commit()
+    if released_data_hash:
+        await delete_unreferenced_blob(db, blob_store, released_data_hash)
+    await db.refresh(book_part)
 
     return BookPartResponseSchema(
         id=book_part.id,
-        book_id=book_part.book_id,
+        book_id=book.id,
         parent_id=book_part.parent_id,
         label=book_part.label,
         content=book_part.content,
@@ -117,5 +200,5 @@ async def update_book_part(
         is_story_part=book_part.is_story_part,
         is_entity_extracted=book_part.is_entity_extracted,
         created_at=book_part.created_at,
-        level=level
+        level=book_part.depth
     )
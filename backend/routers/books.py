@@ -1,36 +1,45 @@
-import hashlib
-import io
 import os
-from typing import Annotated
+from typing import Annotated, BinaryIO
 import uuid
 import dotenv
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, UploadFile, status
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
 from ebooklib import epub
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer
 
-from backend.models.kb_entries import KnowledgeBaseEntry
-from backend.models.summaries import Summary
 from core.parsing import extract_book_metadata, get_cover_image_as_base64
-from backend.tasks.parsing import extract_book_parts_task
+from backend.tasks.queue import JobQueue, get_job_queue
 
 from backend.schemas import books as book_schemas
 from backend.schemas import users as user_schemas
-from backend.database import get_db
+from backend.database import get_async_db, lock_data_hash
 from backend.routers import auth
 from backend.models.books import Book, FileType
-from backend.models.book_parts import BookPart
+from backend.storage import BlobStore, get_blob_store, hash_stream
+from backend.canonical_books import delete_book_content, delete_unreferenced_blob, get_canonical_book, get_or_create_canonical_book, release_canonical_book
 
 dotenv.load_dotenv()
 
 router = APIRouter()
 
 
+def inspect_epub(file: BinaryIO) -> tuple[str, str, str | None]:
+    """Return the author, title and base64 cover image of an EPUB file."""
+    file.seek(0)
+    book = epub.read_epub(file)
+    book_metadata = extract_book_metadata(book)
+    return book_metadata["creator"], book_metadata["title"], get_cover_image_as_base64(book)
+
+
 @router.post("/upload/")
 async def create_upload_file(
         uploaded_file: UploadFile,
-        background_tasks: BackgroundTasks,
         current_user: Annotated[user_schemas.UserResponseSchema, Depends(auth.get_current_user)],
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db),
+        job_queue: JobQueue = Depends(get_job_queue),
+        blob_store: BlobStore = Depends(get_blob_store)
 ) -> book_schemas.BookUploadResponseSchema:
 
     if uploaded_file.content_type != 'application/epub+zip':
@@ -40,40 +49,65 @@ async def create_upload_file(
     if uploaded_file.size > max_file_size:
         raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail='File size exceeds the maximum limit of 100 MB')
 
-    file_data = uploaded_file.file.read()
+    # The request body is already spooled to a temporary file, the file is only read in chunks out of the event loop
+    data_hash = await run_in_threadpool(hash_stream, uploaded_file.file)
 
-    try:
-        book = epub.read_epub(io.BytesIO(file_data))
-        book_metadata = extract_book_metadata(book)
-        cover_image_base64 = get_cover_image_as_base64(book)
-    except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Error processing the file: {str(e)}')
-
-    data_hash = hashlib.sha256(file_data).hexdigest()
+    # held until the book is committed, the file of a book being deleted is not removed from under this upload
+    await lock_data_hash(db, data_hash)
 
     # Check if the file has been already uploaded by the user
-    existing_book = db.query(Book).filter(Book.user_id == current_user.id, Book.data_hash == data_hash).first()
+    existing_book = await db.scalar(select(Book.id).filter(Book.user_id == current_user.id, Book.data_hash == data_hash))
     if existing_book:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='File has been already uploaded by this user')
 
+    # Books with the same content share a canonical book, they are parsed and their entities extracted only once
+    canonical_book = await get_canonical_book(db, data_hash)
+    if canonical_book:
+        # the file has already been inspected
+        author, title, cover_image_base64 = canonical_book.author, canonical_book.title, canonical_book.cover_image_base64
+    else:
+        try:
+            author, title, cover_image_base64 = await run_in_threadpool(inspect_epub, uploaded_file.file)
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f'Error processing the file: {str(e)}')
+
+        # Store the file content outside of the database, identical files share the same blob
+        uploaded_file.file.seek(0)
+        await run_in_threadpool(blob_store.write_stream, data_hash, uploaded_file.file)
+
+        canonical_book, _ = await get_or_create_canonical_book(
+            db,
+            data_hash,
+            file_type=FileType.epub,
+            original_file_name=uploaded_file.filename,
+            file_size=uploaded_file.size,
+            author=author,
+            title=title,
+            cover_image_base64=cover_image_base64
+        )
+
     # Create a new BookFile instance and save it to the database
     new_book_file = Book(
         user_id=current_user.id,
+        canonical_book_id=canonical_book.id,
         file_type=FileType.epub,
         original_file_name=uploaded_file.filename,
         file_size=uploaded_file.size,
-        file_data=file_data,
-        author=book_metadata["creator"],
-        title=book_metadata["title"],
+        author=author,
+        title=title,
         data_hash=data_hash,
-        cover_image_base64=cover_image_base64
+        cover_image_base64=cover_image_base64,
+        is_parsed=canonical_book.is_parsed
     )
     db.add(new_book_file)
-    db.commit()
-    db.refresh(new_book_file)
+    await db.commit()
+    await db.refresh(new_book_file)
 
-    # Add a task to parse and extract book text_parts
-    background_tasks.add_task(extract_book_parts_task, book_id=str(new_book_file.id))
+    # Enqueue a job to parse and extract book text_parts, unless the canonical book is already parsed
+    # parsing it again while a job is pending is harmless, the parsing tasks of a book run one at a time and skip the existing parts
+    parsing_job_id = None
+    if not new_book_file.is_parsed:
+        parsing_job_id = await run_in_threadpool(job_queue.enqueue, 'extract_book_parts', {'book_id': str(canonical_book.id), 'user_id': str(current_user.id)}, user_id=current_user.id)
 
     return book_schemas.BookUploadResponseSchema(
         id=new_book_file.id,
@@ -85,15 +119,16 @@ async def create_upload_file(
         original_file_name=new_book_file.original_file_name,
         file_size=new_book_file.file_size,
         is_parsed=new_book_file.is_parsed,
+        parsing_job_id=parsing_job_id,
     )
 
 
 @router.get("/")
 async def get_books(
     current_user: Annotated[user_schemas.UserResponseSchema, Depends(auth.get_current_user)],
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> list[book_schemas.BookResponseSchema]:
-    books = db.query(Book).filter(Book.user_id == current_user.id).all()
+    books = (await db.scalars(select(Book).options(undefer(Book.cover_image_base64)).filter(Book.user_id == current_user.id))).all()
 
     return [book_schemas.BookResponseSchema(
         id=book.id,
@@ -111,24 +146,32 @@ async def get_books(
 async def delete_book(
     book_id: uuid.UUID,
     current_user: Annotated[user_schemas.UserResponseSchema, Depends(auth.get_current_user)],
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    blob_store: BlobStore = Depends(get_blob_store),
+    job_queue: JobQueue = Depends(get_job_queue)
 ) -> book_schemas.BookResponseSchema:
-    book = db.query(Book).filter(Book.id == book_id, Book.user_id == current_user.id).first()
+    book = await db.scalar(select(Book).options(undefer(Book.cover_image_base64)).filter(Book.id == book_id, Book.user_id == current_user.id))
 
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
 
-    # Delete all the summaries associated with the book
-    db.query(Summary).filter(Summary.book_id == book_id).delete()
-
-    # Delete all the knowledge_base_entries associated with the book
-    db.query(KnowledgeBaseEntry).filter(KnowledgeBaseEntry.book_id == book_id).delete()
-
-    # Delete all the book_parts associated with the book
-    db.query(BookPart).filter(BookPart.book_id == book_id).delete()
-
-    db.delete(book)
-    db.commit()
+    if book.canonical_book_id:
+        # the shared content is deleted with the last book referencing it
+        canonical_book_id = book.canonical_book_id
+        await db.delete(book)
+        await db.flush()
+        released_data_hash = await release_canonical_book(db, canonical_book_id, job_queue)
+        await db.commit()
+        if released_data_hash:
+            await delete_unreferenced_blob(db, blob_store, released_data_hash)
+    else:
+        # Delete the summaries, knowledge_base_entries, extraction checkpoints and book_parts associated with the book
+        await delete_book_content(db, book_id)
+
+        await db.delete(book)
+        await db.commit()
+        # Delete the stored file if no other book shares it
+        await delete_unreferenced_blob(db, blob_store, book.data_hash)
 
     return book_schemas.BookResponseSchema(
         id=book.id,
@@ -147,9 +190,9 @@ async def update_book(
     book_id: uuid.UUID,
     book_update: book_schemas.BookUpdateSchema,
     current_user: Annotated[user_schemas.UserResponseSchema, Depends(auth.get_current_user)],
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> book_schemas.BookResponseSchema:
-    book = db.query(Book).filter(Book.id == book_id, Book.user_id == current_user.id).first()
+    book = await db.scalar(select(Book).options(undefer(Book.cover_image_base64)).filter(Book.id == book_id, Book.user_id == current_user.id))
 
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
@@ -159,8 +202,8 @@ async def update_book(
     if book_update.title is not None:
         book.title = book_update.title
 
-    db.commit()
-    db.refresh(book)
+    await db.commit()
+    await db.refresh(book)
 
     return book_schemas.BookResponseSchema(
         id=book.id,
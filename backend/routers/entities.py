@@ -1,61 +1,128 @@
+import json
+import uuid
 from backend.models.book_parts import BookPart
 from backend.models.books import Book
+from backend.canonical_books import get_content_book_id, get_user_book_of_content
+from backend.models.entity_snapshots import ENTITY_SNAPSHOT_VERSION, EntityMention, EntitySnapshot
 from backend.models.kb_entries import KnowledgeBaseEntry
-from sqlalchemy import func
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from backend.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import String, and_, cast, delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.database import get_async_db
 from typing import Annotated, List
 from backend.routers import auth
-from backend.schemas.entities import EntityResponseSchema, Fact
+from backend.schemas.entities import EntityHeatmapEntrySchema, EntityMentionsSchema, EntityResponseSchema
 from backend.schemas.users import UserResponseSchema
-from backend.tasks.knowledge_base_building import group_knowledge_base_entries
+from backend.tasks.knowledge_base_building import get_entities_snapshot, get_entity_mention_rows
 
 router = APIRouter()
 
 
-@router.get("/book_id/{book_id}")
-async def get_book_entities(book_id: str, current_user: Annotated[UserResponseSchema, Depends(auth.get_current_user)], db: Session = Depends(get_db)) -> List[EntityResponseSchema]:
-    kb_entries = db.query(KnowledgeBaseEntry).filter(
+async def create_entity_snapshot(db: AsyncSession, book_id: uuid.UUID) -> str:
+    """Build and store the entity snapshot and mentions of a book that has none, e.g. extracted before the snapshots existed."""
+    kb_entries = (await db.scalars(select(KnowledgeBaseEntry).filter(
         KnowledgeBaseEntry.book_id == book_id,
         KnowledgeBaseEntry.sibling_index.is_(None),
         KnowledgeBaseEntry.sibling_total.is_(None)
-    ).order_by(KnowledgeBaseEntry.created_at).all()
-    book = db.query(Book).filter(Book.id == book_id).first()
+    ).order_by(KnowledgeBaseEntry.created_at))).all()
+    book_parts_content = dict((await db.execute(select(BookPart.id, BookPart.content).filter(BookPart.book_id == book_id))).all())
+    entities, mentions = await run_in_threadpool(get_entities_snapshot, kb_entries, book_parts_content)
+
+    # a snapshot written meanwhile by the knowledge base building is more recent, it is kept
+    written = await db.scalar(insert(EntitySnapshot).values(id=uuid.uuid4(), book_id=book_id, version=ENTITY_SNAPSHOT_VERSION, entities=entities).on_conflict_do_update(
+        index_elements=[EntitySnapshot.book_id],
+        set_={'version': ENTITY_SNAPSHOT_VERSION, 'entities': entities},
+        where=EntitySnapshot.version != ENTITY_SNAPSHOT_VERSION
+    ).returning(EntitySnapshot.id))
+    if written:
+        await db.execute(delete(EntityMention).filter(EntityMention.book_id == book_id))
+        if mentions:
+            await db.execute(insert(EntityMention), get_entity_mention_rows(book_id, mentions))
+    await db.commit()
+    return json.dumps(entities)
+
+
+async def ensure_entity_snapshot(db: AsyncSession, book_id: uuid.UUID):
+    """Create the entity snapshot of a book if it has none, only its id is read so the entities JSON isn't loaded."""
+    snapshot_id = await db.scalar(select(EntitySnapshot.id).filter(
+        EntitySnapshot.book_id == book_id,
+        EntitySnapshot.version == ENTITY_SNAPSHOT_VERSION
+    ))
+    if snapshot_id is None:
+        await create_entity_snapshot(db, book_id)
+
+
+async def get_entity_snapshot(db: AsyncSession, book_id: uuid.UUID) -> str:
+    """Return the serialized entities of a book, the mentions are available once it is returned."""
+    entities = await db.scalar(select(cast(EntitySnapshot.entities, String)).filter(
+        EntitySnapshot.book_id == book_id,
+        EntitySnapshot.version == ENTITY_SNAPSHOT_VERSION
+    ))
+    if entities is None:
+        entities = await create_entity_snapshot(db, book_id)
+    return entities
+
+
+async def get_user_book(db: AsyncSession, book_id: uuid.UUID, user_id: uuid.UUID):
+    book = (await db.execute(select(Book.id, Book.user_id, Book.canonical_book_id).filter(Book.id == book_id))).first()
 
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
 
-    if not kb_entries:
+    if book.user_id != user_id:
+        raise HTTPException(status_code=403, detail="The book does not belong to the current user")
+
+    return book
+
+
+@router.get("/book_id/{book_id}", response_model=List[EntityResponseSchema])
+async def get_book_entities(book_id: uuid.UUID, current_user: Annotated[UserResponseSchema, Depends(auth.get_current_user)], db: AsyncSession = Depends(get_async_db)) -> Response:
+    book = await get_user_book(db, book_id, current_user.id)
+
+    # the entities are grouped once per extraction, the stored JSON is sent as is
+    entities = await get_entity_snapshot(db, get_content_book_id(book))
+
+    if entities == '[]':
         raise HTTPException(status_code=404, detail="Knowledge base entries not found")
 
-    if book.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="The book does not belong to the current user")
+    return Response(content=entities, media_type='application/json')
 
-    book_parts = db.query(BookPart).filter(BookPart.book_id == book_id).all()
-
-    if not book_parts:
-        raise HTTPException(status_code=404, detail="Book parts not found")
-
-    book_parts_content = {bp.id: bp.content for bp in book_parts}
-
-    # Group the entries
-    grouped_kb_entries = group_knowledge_base_entries(kb_entries)
-
-    entities = []
-    for entity_name, v in grouped_kb_entries.items():
-        entity = EntityResponseSchema(
-            name=entity_name,
-            alternative_names=v["alternative_names"],
-            category=v["category"],
-            facts=[Fact(
-                book_part_id=entry.book_part_id,
-                content=entry.fact,
-                # TODO : avoid overlaps in the occurrences
-                occurrences=sum([book_parts_content[entry.book_part_id].lower().count(name.lower()) for name in [entity_name] + v["alternative_names"]]),
-                sibling_index=None,
-                sibling_total=None
-            ) for entry in v["entries"]]
-        )
-        entities.append(entity)
-    return entities
+
+@router.get("/heatmap/{book_id}")
+async def get_entity_heatmap(book_id: uuid.UUID, name: str, current_user: Annotated[UserResponseSchema, Depends(auth.get_current_user)], db: AsyncSession = Depends(get_async_db)) -> List[EntityHeatmapEntrySchema]:
+    """Return the number of mentions of an entity in every book part, in reading order."""
+    book = await get_user_book(db, book_id, current_user.id)
+    content_book_id = get_content_book_id(book)
+    await ensure_entity_snapshot(db, content_book_id)
+
+    # only the number of mentions is read from the offsets arrays
+    rows = (await db.execute(
+        select(BookPart.id, BookPart.label, BookPart.depth, func.coalesce(func.cardinality(EntityMention.starts), 0).label('occurrences'))
+        .outerjoin(EntityMention, and_(EntityMention.book_part_id == BookPart.id, EntityMention.entity_name == name))
+        .filter(BookPart.book_id == content_book_id)
+        .order_by(BookPart.reading_order)
+    )).all()
+
+    return [EntityHeatmapEntrySchema(book_part_id=row.id, label=row.label, level=row.depth, occurrences=row.occurrences) for row in rows]
+
+
+@router.get("/mentions/{book_part_id}")
+async def get_book_part_mentions(book_part_id: uuid.UUID, current_user: Annotated[UserResponseSchema, Depends(auth.get_current_user)], name: str | None = None, db: AsyncSession = Depends(get_async_db)) -> List[EntityMentionsSchema]:
+    """Return the offsets of the mentions of every entity, or of the named entity, in the content of a book part."""
+    content_book_id = await db.scalar(select(BookPart.book_id).filter(BookPart.id == book_part_id))
+    if not content_book_id:
+        raise HTTPException(status_code=404, detail="Book part not found")
+
+    if not await get_user_book_of_content(db, current_user.id, content_book_id):
+        raise HTTPException(status_code=403, detail="The book part does not belong to the current user")
+
+    await ensure_entity_snapshot(db, content_book_id)
+
+    query = select(EntityMention.entity_name, EntityMention.starts, EntityMention.ends).filter(EntityMention.book_part_id == book_part_id)
+    if name is not None:
+        query = query.filter(EntityMention.entity_name == name)
+    rows = (await db.execute(query.order_by(EntityMention.entity_name))).all()
+
+    return [EntityMentionsSchema(name=row.entity_name, starts=row.starts, ends=row.ends) for row in rows]
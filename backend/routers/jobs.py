@@ -0,0 +1,37 @@
+from typing import Annotated
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from backend.routers import auth
+from backend.schemas.jobs import JobResponseSchema
+from backend.schemas.users import UserResponseSchema
+from backend.tasks.queue import JobQueue, get_job_queue
+
+router = APIRouter()
+
+
+def job_to_schema(job: dict) -> JobResponseSchema:
+    return JobResponseSchema(
+        id=job['id'],
+        task=job['task'],
+        status=job['status'],
+        attempts=job['attempts'],
+        max_retries=job['max_retries'],
+        error=job['error'] or None,
+        created_at=job['created_at'],
+        updated_at=job['updated_at']
+    )
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str, current_user: Annotated[UserResponseSchema, Depends(auth.get_current_user)], job_queue: JobQueue = Depends(get_job_queue)) -> JobResponseSchema:
+    # the redis client of the queue is synchronous, it is shared with the workers
+    job = await run_in_threadpool(job_queue.get_job, job_id)
+
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if job['user_id'] != str(current_user.id):
+        raise HTTPException(status_code=403, detail="The job does not belong to the current user")
+
+    return job_to_schema(job)
@@ -1,34 +1,40 @@
 import math
-from backend.models.book_parts import BookPart
 from typing import Annotated
 from backend.models.users import User
 from backend.schemas.processes import BookProcessResponseSchema
 from backend.schemas.users import UserResponseSchema
-from backend.tasks.knowledge_base_building import build_knowledge_base
+from backend.tasks.queue import JobQueue, get_job_queue
+from backend.user_cache import UserCache, get_user_cache
+from backend.routers.jobs import job_to_schema
+from backend.schemas.jobs import JobResponseSchema
 from backend.routers import auth
 from backend.models.books import Book
-from backend.database import get_db
+from backend.canonical_books import get_content_book_id
+from backend.database import get_async_db
 import uuid
 from datetime import datetime, timezone
-from sqlalchemy.orm import Session
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi import APIRouter
 
 
 router = APIRouter()
 
 
-def estimate_cost(db: Session, book_id: uuid.UUID):
-    story_parts = db.query(BookPart).filter(BookPart.book_id == book_id, BookPart.is_story_part == True).all()
-    # 1 token = 0.75 words, 2 times the number of tokens for question and answer, cost per 1M tokens is $0.20
+async def estimate_cost(db: AsyncSession, book_id: uuid.UUID):
+    # the parts already extracted, possibly for another user sharing the same book, are free
+    statistics = (await db.execute(select(Book.story_token_count, Book.extracted_token_count).filter(Book.id == book_id))).one()
+    # 2 times the number of tokens for question and answer, cost per 1M tokens is $0.20
     # 1$ = 100 coins
-    estimated_cost = math.ceil(sum(len(part.content.split(" ")) for part in story_parts) * (1/0.75) / 1e6 * 2 * 0.2 * 100)
+    estimated_cost = math.ceil((statistics.story_token_count - statistics.extracted_token_count) / 1e6 * 2 * 0.2 * 100)
     return estimated_cost
 
 
 @router.post("/trigger_extraction/{book_id}")
-async def trigger_extraction(book_id: uuid.UUID, background_tasks: BackgroundTasks, current_user: Annotated[UserResponseSchema, Depends(auth.get_current_user)], db: Session = Depends(get_db)):
-    book = db.query(Book).filter(Book.id == book_id).first()
+async def trigger_extraction(book_id: uuid.UUID, current_user: Annotated[UserResponseSchema, Depends(auth.get_current_user)], db: AsyncSession = Depends(get_async_db), job_queue: JobQueue = Depends(get_job_queue), user_cache: UserCache = Depends(get_user_cache)) -> JobResponseSchema:
+    book = await db.scalar(select(Book).filter(Book.id == book_id))
 
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
@@ -39,23 +45,29 @@ async def trigger_extraction(book_id: uuid.UUID, background_tasks: BackgroundTas
     if not book.is_parsed:
         raise HTTPException(status_code=400, detail="Book has not been parsed yet")
 
-    estimated_cost = estimate_cost(db, book_id)
+    # the extraction runs on the canonical book when the book is shared
+    content_book_id = get_content_book_id(book)
+    estimated_cost = await estimate_cost(db, content_book_id)
 
-    user = db.query(User).filter(User.id == current_user.id).first()
+    # current_user can come from the user cache, the balance is read from the database
+    user = await db.scalar(select(User).filter(User.id == current_user.id))
     if user.balance < estimated_cost:
         raise HTTPException(status_code=400, detail="Insufficient balance for entity extraction")
 
     book.extraction_start_time = datetime.now(timezone.utc)
-    db.commit()
+    await db.commit()
 
-    background_tasks.add_task(build_knowledge_base, book_id=str(book_id))
+    job_id = await run_in_threadpool(job_queue.enqueue, 'build_knowledge_base', {'book_id': str(content_book_id), 'user_id': str(current_user.id)}, user_id=current_user.id)
     user.balance -= estimated_cost
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(user.name)
+
+    return job_to_schema(await run_in_threadpool(job_queue.get_job, job_id))
 
 
 @router.get("/extraction/{book_id}")
-async def get_entity_extraction_process(book_id: uuid.UUID, current_user: Annotated[UserResponseSchema, Depends(auth.get_current_user)], db: Session = Depends(get_db)):
-    book = db.query(Book).filter(Book.id == book_id).first()
+async def get_entity_extraction_process(book_id: uuid.UUID, current_user: Annotated[UserResponseSchema, Depends(auth.get_current_user)], db: AsyncSession = Depends(get_async_db)):
+    book = await db.scalar(select(Book).filter(Book.id == book_id))
 
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
@@ -63,16 +75,13 @@ async def get_entity_extraction_process(book_id: uuid.UUID, current_user: Annota
     if book.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="The book does not belong to the current user")
 
-    estimated_cost = estimate_cost(db, book_id)
+    content_book_id = get_content_book_id(book)
+    estimated_cost = await estimate_cost(db, content_book_id)
 
     if book.extraction_start_time is None:
         return BookProcessResponseSchema(book_id=book_id, is_requested=False, estimated_cost=estimated_cost, requested_at=None, completeness=None)
 
-    story_parts = db.query(BookPart).filter(BookPart.book_id == book_id, BookPart.is_story_part == True)
-    extracted_story_parts = db.query(BookPart).filter(BookPart.book_id == book_id, BookPart.is_story_part == True, BookPart.is_entity_extracted == True)
-    story_parts_total_length = sum([len(part.content) for part in story_parts])
-    extracted_story_parts_total_length = sum([len(part.content) for part in extracted_story_parts])
-
-    completeness = extracted_story_parts_total_length / story_parts_total_length if story_parts_total_length > 0 else 1
+    statistics = (await db.execute(select(Book.story_char_count, Book.extracted_char_count).filter(Book.id == content_book_id))).one()
+    completeness = statistics.extracted_char_count / statistics.story_char_count if statistics.story_char_count > 0 else 1
 
     return BookProcessResponseSchema(book_id=book_id, is_requested=True, estimated_cost=estimated_cost, requested_at=book.extraction_start_time, completeness=completeness)
@@ -19,5 +19,23 @@ class BookPartResponseSchema(LightBookPartResponseSchema):
     content: str
 
 
+class BookPartTocEntrySchema(LightBookPartResponseSchema):
+    sub_parts_count: int
+    # number of characters of the content
+    length: int
+    # beginning of the content
+    preview: str
+
+
+class BookPartContentResponseSchema(BaseModel):
+    id: uuid.UUID
+    book_id: uuid.UUID
+    offset: int
+    content: str
+    # number of characters of the whole content, next_offset is None once the end is reached
+    length: int
+    next_offset: int | None
+
+
 class BookPartUpdateSchema(BaseModel):
     is_story_part: bool
@@ -18,6 +18,7 @@ class BookUploadResponseSchema(BookBaseSchema):
     original_file_name: str
     file_size: int
     is_parsed: bool
+    parsing_job_id: Optional[uuid.UUID] = None
 
 
 class BookResponseSchema(BookBaseSchema):
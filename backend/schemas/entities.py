@@ -18,3 +18,17 @@ class EntityResponseSchema(BaseModel):
     alternative_names: List[str]
     category: str
     facts: List[Fact]
+
+
+class EntityHeatmapEntrySchema(BaseModel):
+    book_part_id: uuid.UUID
+    label: str
+    level: int
+    occurrences: int
+
+
+class EntityMentionsSchema(BaseModel):
+    name: str
+    # start and end (exclusive) offsets of the mentions in the content of the book part
+    starts: List[int]
+    ends: List[int]
@@ -0,0 +1,14 @@
+from datetime import datetime
+import uuid
+from pydantic import BaseModel
+
+
+class JobResponseSchema(BaseModel):
+    id: uuid.UUID
+    task: str
+    status: str
+    attempts: int
+    max_retries: int
+    error: str | None
+    created_at: datetime
+    updated_at: datetime
@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from functools import cache
+from typing import BinaryIO, Iterator
+from dotenv import load_dotenv
+
+from core.hashing import hash_stream
+
+load_dotenv()
+
+
+class BlobStore(ABC):
+    """Content-addressed storage of uploaded files, blobs are keyed by the sha256 of their content (Book.data_hash)."""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        pass
+
+    @abstractmethod
+    def write_stream(self, key: str, stream: BinaryIO):
+        """Store the content of a binary stream, read in chunks. Writing an existing key is a no-op."""
+
+    @abstractmethod
+    def open(self, key: str) -> Iterator[BinaryIO]:
+        """Context manager yielding a seekable binary file-like object with the content of a blob."""
+
+    @abstractmethod
+    def delete(self, key: str):
+        pass
+
+
+class FileSystemBlobStore(BlobStore):
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        # two levels of directories keep the number of files per directory low
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def write_stream(self, key: str, stream: BinaryIO):
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first so that a blob is either complete or missing
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as temp_file:
+            try:
+                shutil.copyfileobj(stream, temp_file)
+            except BaseException:
+                os.remove(temp_file.name)
+                raise
+        os.replace(temp_file.name, path)
+
+    @contextmanager
+    def open(self, key: str) -> Iterator[BinaryIO]:
+        # the file is read on demand, zip readers only load the members they need
+        with open(self._path(key), 'rb') as f:
+            yield f
+
+    def delete(self, key: str):
+        if os.path.exists(self._path(key)):
+            os.remove(self._path(key))
+
+
+class S3BlobStore(BlobStore):
+    """Blob store for any S3 compatible service (AWS S3, MinIO, moto in tests ...)."""
+
+    def __init__(self, bucket: str, client=None, endpoint_url: str | None = None, spool_max_size: int = 16 * 1024 * 1024):
+        if client is None:
+            import boto3
+            client = boto3.client('s3', endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+        self.spool_max_size = spool_max_size
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except self.client.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def write_stream(self, key: str, stream: BinaryIO):
+        if self.exists(key):
+            return
+        # multipart upload, the stream is read in chunks
+        self.client.upload_fileobj(stream, self.bucket, key)
+
+    @contextmanager
+    def open(self, key: str) -> Iterator[BinaryIO]:
+        with tempfile.SpooledTemporaryFile(max_size=self.spool_max_size) as f:
+            self.client.download_fileobj(self.bucket, key, f)
+            f.seek(0)
+            yield f
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+
+@cache
+def get_blob_store() -> BlobStore:
+    backend = os.getenv('BLOB_STORE', 'filesystem')
+    if backend == 'filesystem':
+        return FileSystemBlobStore(os.getenv('BLOB_STORE_PATH', 'data/blobs'))
+    elif backend == 's3':
+        return S3BlobStore(os.getenv('S3_BUCKET'), endpoint_url=os.getenv('S3_ENDPOINT_URL'))
+    else:
+        raise ValueError(f"Unknown blob store : {backend}")
@@ -0,0 +1,67 @@
+import hashlib
+import json
+import os
+import re
+from dotenv import load_dotenv
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from backend.models.book_parts import BookPart
+
+load_dotenv()
+
+
+def get_splitter_config() -> dict:
+    return {
+        'chunk_size': int(os.environ.get("CHUNK_SIZE")),
+        'chunk_overlap': int(os.environ.get("CHUNK_OVERLAP")),
+        'separators': ["\n\n\n", "\n\n", "\n", ".", ",", " ", ""],
+        'keep_separator': True,
+    }
+
+
+def get_splitter_config_hash(splitter_config: dict | None = None) -> str:
+    splitter_config = splitter_config or get_splitter_config()
+    return hashlib.sha256(json.dumps(splitter_config, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def normalize_content(content: str) -> str:
+    return re.sub(r'\n{4,}', '\n\n\n', content)
+
+
+def compute_chunk_offsets(content: str, splitter_config: dict | None = None) -> tuple[list[int], list[int]]:
+    """Split the normalized content and return the start and end offsets of every chunk in it."""
+    normalized_content = normalize_content(content)
+    text_splitter = RecursiveCharacterTextSplitter(length_function=len, **(splitter_config or get_splitter_config()))
+
+    starts, ends = [], []
+    search_start = 0
+    for chunk in text_splitter.split_text(normalized_content):
+        # chunks are stripped substrings of the content, in order, possibly overlapping
+        start = normalized_content.find(chunk, search_start)
+        if start == -1:
+            start = normalized_content.find(chunk)
+        starts.append(start)
+        ends.append(start + len(chunk))
+        search_start = start + 1
+
+    return starts, ends
+
+
+def set_book_part_chunks(book_part: BookPart, content: str | None = None):
+    """Store the chunk offsets of a book part, content can be given when the content of the part is not loaded."""
+    splitter_config = get_splitter_config()
+    book_part.chunk_starts, book_part.chunk_ends = compute_chunk_offsets(book_part.content if content is None else content, splitter_config)
+    book_part.chunk_config_hash = get_splitter_config_hash(splitter_config)
+    book_part.sub_parts_count = len(book_part.chunk_starts)
+
+
+def get_book_part_chunks(book_part: BookPart) -> list[str]:
+    """Return the chunks of a book part, sliced from its stored offsets when they match the current splitter config."""
+    if book_part.chunk_starts is not None and book_part.chunk_config_hash == get_splitter_config_hash():
+        starts, ends = book_part.chunk_starts, book_part.chunk_ends
+    else:
+        # parsed before the offsets were stored or with another config
+        starts, ends = compute_chunk_offsets(book_part.content)
+
+    normalized_content = normalize_content(book_part.content)
+    return [normalized_content[start:end] for start, end in zip(starts, ends)]
@@ -1,37 +1,46 @@
-from collections import Counter
 import json
-import os
-import re
 import time
+import uuid
 from dotenv import load_dotenv
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langfuse import Langfuse
 from langfuse.decorators import langfuse_context, observe
-from langfuse.openai import OpenAI
+from sqlalchemy import insert
 from tqdm import tqdm
-import networkx as nx
 
-from backend.database import SessionLocal
+from backend.book_statistics import update_book_statistics
+from backend.database import SessionLocal, book_lock
 from backend.models.summaries import Summary
 from backend.models.users import User
 from backend.models.books import Book
 from backend.models.book_parts import BookPart
 from backend.models.kb_entries import KnowledgeBaseEntry
+from backend.models.checkpoints import ExtractionCheckpoint, ExtractionStage
+from backend.models.entity_snapshots import ENTITY_SNAPSHOT_VERSION, EntityMention, EntitySnapshot
+from backend.schemas.entities import EntityResponseSchema, Fact
+from backend.tasks.chunking import get_book_part_chunks
+from backend.tasks.llm import chat_completion, get_llm_cache, get_llm_concurrency, run_concurrently
+from core.grouping import group_knowledge_base_entries
+from core.matching import AhoCorasick
 
 load_dotenv(override=True)
-client = OpenAI()
 languse = Langfuse()
 
 
 @observe()
-def build_knowledge_base(book_id: str):
+@book_lock
+def build_knowledge_base(book_id: str, user_id: str | None = None):
+    """Extract the entities and summaries of a book, user_id is the user requesting it when the book is a shared canonical book."""
     print(f'[Starting knowledge building task] book_id : {book_id}')
 
+    # the counters of the cache are kept by the process, the stats of this build are taken from them
+    llm_cache = get_llm_cache()
+    llm_cache_stats = llm_cache.stats() if llm_cache is not None else None
+
     db = SessionLocal()
 
     try:
         book = db.query(Book).filter(Book.id == book_id).first()
-        user = db.query(User).filter(User.id == book.user_id).first()
+        user = db.query(User).filter(User.id == (user_id or book.user_id)).first()
 
         langfuse_context.update_current_trace(
             metadata={"book_id": book_id, "book_title": book.title, "user_id": user.id, "user_name": user.name},
@@ -39,312 +48,452 @@ def build_knowledge_base(book_id: str):
             user_id=user.name,
         )
 
-        book_parts = db.query(BookPart).filter(BookPart.book_id == book_id).all()
-        sorted_book_parts = sort_book_parts(book_parts)
+        sorted_book_parts = db.query(BookPart).filter(BookPart.book_id == book_id).order_by(BookPart.reading_order).all()
+        # labels used in the prompts, the parts of the book are already loaded
+        book_part_labels = {book_part.id: book_part.label.strip() for book_part in sorted_book_parts}
 
+        # delete the unfinished work of previous runs, completed stages are resumed from their checkpoints
+        checkpoints = {}
         for book_part in sorted_book_parts:
             if book_part.is_story_part and not book_part.is_entity_extracted:
+                checkpoints[book_part.id] = clean_unfinished_work(db, book_part)
 
-                # delete existing entities and summaries from previous runs
-                db.query(KnowledgeBaseEntry).filter(KnowledgeBaseEntry.book_part_id == book_part.id).delete()
-                db.query(Summary).filter(Summary.book_part_id == book_part.id).delete()
-                db.commit()
+        # the entities served by the API are outdated until the end of the run
+        if checkpoints:
+            delete_entity_snapshot(db, book_id)
+            db.commit()
 
-                extract_entities_from_sub_parts(book_part)
-                extract_summaries_from_sub_parts(book_part)
-                merge_book_part_entities(book_part)
-                merge_book_part_summaries(book_part)
+        # name index of the sub part entries, kept up to date during the whole run
+        kb_index = KnowledgeBaseIndex(query_knowledge_base_entries(db, book_id))
+
+        for book_part in sorted_book_parts:
+            if book_part.id in checkpoints:
+                completed = checkpoints[book_part.id]
+
+                extract_entities_from_sub_parts(book_part, kb_index, book_part_labels, completed[ExtractionStage.ENTITY_EXTRACTION])
+                extract_summaries_from_sub_parts(book_part, completed[ExtractionStage.SUMMARIZATION])
+                if not completed[ExtractionStage.ENTITY_MERGING]:
+                    merge_book_part_entities(book_part)
+                if not completed[ExtractionStage.SUMMARY_MERGING]:
+                    merge_book_part_summaries(book_part)
                 # OTHER EXTRACTIONS
 
+                # checkpoints are only needed until the whole book part is extracted
+                db.query(ExtractionCheckpoint).filter(ExtractionCheckpoint.book_part_id == book_part.id).delete()
                 book_part.is_entity_extracted = True
+                db.execute(update_book_statistics(book_id, book_part, extracted=1))
                 db.commit()
             else:
                 print(f"Skipping book part : {book_part.label}")
+
+        write_entity_snapshot(db, book_id)
+
+        if llm_cache is not None:
+            print(f"[Knowledge building task] LLM cache stats : {llm_cache.stats(since=llm_cache_stats)}")
     finally:
         db.close()
 
 
-def extract_entities_from_sub_parts(book_part: BookPart):
-    print(f"[Knowledge building task] Extracting entities for book part : {book_part.label}")
+def clean_unfinished_work(db, book_part: BookPart) -> dict[str, set[int | None]]:
+    """Delete the entities and summaries of a book part that are not covered by a checkpoint.
 
-    db = SessionLocal()
+    Returns
+    -------
+    dict[str, set]
+        The completed sibling indexes of each stage, merging stages use a None sibling index.
+    """
 
-    # split content into sub parts
-    content = re.sub(r'\n{4,}', '\n\n\n', book_part.content)
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=int(os.environ.get("CHUNK_SIZE")),
-        chunk_overlap=int(os.environ.get("CHUNK_OVERLAP")),
-        length_function=len,
-        separators=["\n\n\n", "\n\n", "\n", ".", ",", " ", ""],
-        keep_separator=True,
-    )
+    checkpoints = db.query(ExtractionCheckpoint).filter(ExtractionCheckpoint.book_part_id == book_part.id).all()
 
-    sub_parts = text_splitter.split_text(content)
+    # sub part checkpoints are only valid if the book part is split the same way
+    sub_parts_count = len(get_book_part_chunks(book_part))
+    if any(checkpoint.sibling_total is not None and checkpoint.sibling_total != sub_parts_count for checkpoint in checkpoints):
+        db.query(ExtractionCheckpoint).filter(ExtractionCheckpoint.book_part_id == book_part.id).delete()
+        checkpoints = []
 
-    for i, sub_part in enumerate(sub_parts):
-        filtered_kb = get_knowledge_base_entries(book_part.book_id, sub_part)
-        merged_kb = group_knowledge_base_entries(filtered_kb)
-        kb_str = format_knowledge_base_entities(merged_kb, max_entries_per_name=5)
+    completed = {stage: set() for stage in (ExtractionStage.ENTITY_EXTRACTION, ExtractionStage.SUMMARIZATION, ExtractionStage.ENTITY_MERGING, ExtractionStage.SUMMARY_MERGING)}
+    for checkpoint in checkpoints:
+        completed[checkpoint.stage].add(checkpoint.sibling_index)
 
-        prompt = languse.get_prompt("sub_part_entity_extraction", label="latest")
-        computed_prompt = prompt.compile(knowledge_base=kb_str, text_part=sub_part)
+    # a merge is outdated if some of its sub parts have to be extracted again
+    if completed[ExtractionStage.ENTITY_EXTRACTION] != set(range(sub_parts_count)):
+        completed[ExtractionStage.ENTITY_MERGING] = set()
+    if completed[ExtractionStage.SUMMARIZATION] != set(range(sub_parts_count)):
+        completed[ExtractionStage.SUMMARY_MERGING] = set()
 
-        for attempt in range(3):
-            try:
-                completion = client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "user", "content": computed_prompt}
-                    ],
-                    response_format={"type": "json_object"}
-                )
-                json_output = json.loads(completion.choices[0].message.content)
-                if 'entities' in json_output:
-                    if json_output['entities']:
-                        for entry in json_output['entities']:
-                            new_entry = KnowledgeBaseEntry(
-                                book_id=book_part.book_id,
-                                book_part_id=book_part.id,
-                                entity_name=entry['entity_name'],
-                                alternative_names='|'.join(entry['alternative_names']) if entry.get('alternative_names', []) else None,
-                                referenced_entity_name=entry.get('referenced_entity') if (entry.get('referenced_entity') and entry['referenced_entity'] != "") else None,
-                                category=entry['category'],
-                                fact=entry['summary'],
-                                sibling_index=i,
-                                sibling_total=len(sub_parts)
-                            )
-                            db.add(new_entry)
-                            db.commit()
-                break
-            except Exception as e:
-                print(f"Attempt {attempt + 1} failed. Error: {str(e)}")
-                if attempt < 2:
-                    time.sleep(2)
-                else:
-                    print("All attempts failed. Please check the prompt or the model.")
-
-
-def extract_summaries_from_sub_parts(book_part: BookPart):
-    print(f"[Knowledge building task] Summarizing sub parts for book part : {book_part.label}")
+    for model, sub_stage, merging_stage in ((KnowledgeBaseEntry, ExtractionStage.ENTITY_EXTRACTION, ExtractionStage.ENTITY_MERGING),
+                                            (Summary, ExtractionStage.SUMMARIZATION, ExtractionStage.SUMMARY_MERGING)):
+        db.query(model).filter(
+            model.book_part_id == book_part.id,
+            model.sibling_index.isnot(None),
+            model.sibling_index.notin_(list(completed[sub_stage]))
+        ).delete(synchronize_session=False)
+        if not completed[merging_stage]:
+            db.query(model).filter(model.book_part_id == book_part.id, model.sibling_index.is_(None)).delete(synchronize_session=False)
+    db.commit()
 
-    db = SessionLocal()
-
-    # split content into sub parts
-    content = re.sub(r'\n{4,}', '\n\n\n', book_part.content)
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=int(os.environ.get("CHUNK_SIZE")),
-        chunk_overlap=int(os.environ.get("CHUNK_OVERLAP")),
-        length_function=len,
-        separators=["\n\n\n", "\n\n", "\n", ".", ",", " ", ""],
-        keep_separator=True,
-    )
-
-    sub_parts = text_splitter.split_text(content)
-
-    for i, sub_part in enumerate(sub_parts):
-        prompt = languse.get_prompt("sub_part_summarization", label="latest")
-        computed_prompt = prompt.compile(text_part=sub_part)
-
-        completion = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "user", "content": computed_prompt}
-            ]
-        )
-        summary = completion.choices[0].message.content.strip()
-
-        if summary != "":
-            new_summary = Summary(
-                book_id=book_part.book_id,
-                book_part_id=book_part.id,
-                content=summary,
-                sibling_index=i,
-                sibling_total=len(sub_parts)
-            )
-            db.add(new_summary)
-            db.commit()
+    if checkpoints:
+        print(f"[Knowledge building task] Resuming book part : {book_part.label}")
 
+    return completed
 
-def merge_book_part_entities(book_part: BookPart):
-    print(f"[Knowledge building task] Merging entities for book part : {book_part.label}")
 
-    db = SessionLocal()
+def extract_entities_from_sub_parts(book_part: BookPart, kb_index: 'KnowledgeBaseIndex | None' = None, book_part_labels: dict | None = None, completed_sub_parts: set[int] = frozenset()):
+    print(f"[Knowledge building task] Extracting entities for book part : {book_part.label}")
 
-    kb_entries = db.query(KnowledgeBaseEntry).filter(
-        KnowledgeBaseEntry.book_part_id == book_part.id,
-        KnowledgeBaseEntry.sibling_index.isnot(None),
-        KnowledgeBaseEntry.sibling_total.isnot(None)
-    ).order_by(KnowledgeBaseEntry.sibling_index).all()
+    # new entries are kept in kb_index, they must stay readable after the commit
+    db = SessionLocal(expire_on_commit=False)
 
-    grouped_kb_entries = group_knowledge_base_entries(kb_entries)
+    try:
+        if kb_index is None:
+            kb_index = KnowledgeBaseIndex(query_knowledge_base_entries(db, book_part.book_id))
+        if book_part_labels is None:
+            book_part_labels = get_book_part_labels(db, book_part.book_id)
+
+        sub_parts = get_book_part_chunks(book_part)
+
+        for i, sub_part in enumerate(sub_parts):
+            if i in completed_sub_parts:
+                continue
+
+            filtered_kb = kb_index.match(sub_part)
+            merged_kb = group_knowledge_base_entries(filtered_kb)
+            kb_str = format_knowledge_base_entities(merged_kb, max_entries_per_name=5, book_part_labels=book_part_labels)
+
+            prompt = languse.get_prompt("sub_part_entity_extraction", label="latest")
+            computed_prompt = prompt.compile(knowledge_base=kb_str, text_part=sub_part)
+
+            for attempt in range(3):
+                try:
+                    # a retry must not be served the cached answer that just failed
+                    json_output = json.loads(chat_completion(computed_prompt, response_format={"type": "json_object"},
+                                                             prompt_name=prompt.name, prompt_version=prompt.version, refresh=attempt > 0))
+                    new_entries = []
+                    if 'entities' in json_output:
+                        if json_output['entities']:
+                            for entry in json_output['entities']:
+                                new_entries.append(KnowledgeBaseEntry(
+                                    book_id=book_part.book_id,
+                                    book_part_id=book_part.id,
+                                    entity_name=entry['entity_name'],
+                                    alternative_names='|'.join(entry['alternative_names']) if entry.get('alternative_names', []) else None,
+                                    referenced_entity_name=entry.get('referenced_entity') if (entry.get('referenced_entity') and entry['referenced_entity'] != "") else None,
+                                    category=entry['category'],
+                                    fact=entry['summary'],
+                                    sibling_index=i,
+                                    sibling_total=len(sub_parts)
+                                ))
+
+                    # the entries and the checkpoint of the sub part are committed together
+                    db.add_all(new_entries)
+                    db.add(ExtractionCheckpoint(book_part_id=book_part.id, stage=ExtractionStage.ENTITY_EXTRACTION, sibling_index=i, sibling_total=len(sub_parts)))
+                    db.commit()
+                    for new_entry in new_entries:
+                        kb_index.add(new_entry)
+                    break
+                except Exception as e:
+                    db.rollback()
+                    print(f"Attempt {attempt + 1} failed. Error: {str(e)}")
+                    if attempt < 2:
+                        time.sleep(2)
+                    else:
+                        print("All attempts failed. Please check the prompt or the model.")
+    finally:
+        db.close()
 
-    # For each entity, generate a summary from all the facts
-    for entity_name, entity_data in grouped_kb_entries.items():
-        facts = [entry.fact for entry in entity_data['entries']]
-        facts_str = '\n'.join(facts)
 
-        prompt = languse.get_prompt("entity_merging", label="latest")
-        computed_prompt = prompt.compile(name=entity_name, type=entity_data["category"], facts=facts_str)
+def extract_summaries_from_sub_parts(book_part: BookPart, completed_sub_parts: set[int] = frozenset()):
+    print(f"[Knowledge building task] Summarizing sub parts for book part : {book_part.label}")
 
-        completion = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "user", "content": computed_prompt}
-            ]
-        )
-        summary = completion.choices[0].message.content.strip()
-
-        # Create a new KnowledgeBaseEntry with the merged summary
-        new_entry = KnowledgeBaseEntry(
-            book_id=book_part.book_id,
-            book_part_id=book_part.id,
-            entity_name=entity_name,
-            alternative_names='|'.join(entity_data['alternative_names']) if entity_data.get('alternative_names', []) else None,
-            category=entity_data['category'],
-            fact=summary,
-            sibling_index=None,
-            sibling_total=None
-        )
-        db.add(new_entry)
-        db.commit()
+    sub_parts = get_book_part_chunks(book_part)
+    remaining_sub_parts = [(i, sub_part) for i, sub_part in enumerate(sub_parts) if i not in completed_sub_parts]
 
+    prompt = languse.get_prompt("sub_part_summarization", label="latest")
 
-def merge_book_part_summaries(book_part: BookPart):
-    print(f"[Knowledge building task] Merging summaries for book part : {book_part.label}")
+    def summarize_sub_part(indexed_sub_part: tuple[int, str]) -> str:
+        return chat_completion(prompt.compile(text_part=indexed_sub_part[1]), prompt_name=prompt.name, prompt_version=prompt.version).strip()
 
     db = SessionLocal()
+    try:
+        # sub parts are summarized independently, each batch is checkpointed in sibling_index order
+        batch_size = get_llm_concurrency()
+        for batch_start in range(0, len(remaining_sub_parts), batch_size):
+            batch = remaining_sub_parts[batch_start:batch_start + batch_size]
+            summaries = run_concurrently(summarize_sub_part, batch)
+
+            for (i, _), summary in zip(batch, summaries):
+                if summary != "":
+                    new_summary = Summary(
+                        book_id=book_part.book_id,
+                        book_part_id=book_part.id,
+                        content=summary,
+                        sibling_index=i,
+                        sibling_total=len(sub_parts)
+                    )
+                    db.add(new_summary)
+                db.add(ExtractionCheckpoint(book_part_id=book_part.id, stage=ExtractionStage.SUMMARIZATION, sibling_index=i, sibling_total=len(sub_parts)))
+            db.commit()
+    finally:
+        db.close()
 
-    summaries = db.query(Summary).filter(
-        Summary.book_part_id == book_part.id,
-        Summary.sibling_index.isnot(None),
-        Summary.sibling_total.isnot(None)
-    ).order_by(Summary.sibling_index).all()
 
-    if summaries:
-        # Merge all the summaries into one
-        summaries = '\n'.join([summary.content for summary in summaries])
+def merge_book_part_entities(book_part: BookPart):
+    print(f"[Knowledge building task] Merging entities for book part : {book_part.label}")
 
-        prompt = languse.get_prompt("summary_merging", label="latest")
-        computed_prompt = prompt.compile(summaries=summaries)
+    db = SessionLocal()
 
-        completion = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "user", "content": computed_prompt}
-            ]
-        )
-        merged_content = completion.choices[0].message.content.strip()
-
-        # Create a new Summary with the merged content
-        new_summary = Summary(
-            book_id=book_part.book_id,
-            book_part_id=book_part.id,
-            content=merged_content,
-            sibling_index=None,
-            sibling_total=None
-        )
-        db.add(new_summary)
-        db.commit()
+    try:
+        kb_entries = db.query(KnowledgeBaseEntry).filter(
+            KnowledgeBaseEntry.book_part_id == book_part.id,
+            KnowledgeBaseEntry.sibling_index.isnot(None),
+            KnowledgeBaseEntry.sibling_total.isnot(None)
+        ).order_by(KnowledgeBaseEntry.sibling_index).all()
 
+        grouped_kb_entries = group_knowledge_base_entries(kb_entries)
 
-def sort_book_parts(book_parts: list[BookPart]):
-    sorted_book_parts = []
-    root_book_parts = [book_part for book_part in book_parts if book_part.parent_id is None]
-    root_book_parts = sorted(root_book_parts, key=lambda x: x.sibling_index)
+        prompt = languse.get_prompt("entity_merging", label="latest")
 
-    for root_book_part in root_book_parts:
-        sorted_book_parts.append(root_book_part)
-        sorted_book_parts.extend(sort_book_parts_recursive(root_book_part, book_parts))
-    return sorted_book_parts
+        def merge_entity_facts(entity: tuple[str, dict]) -> str:
+            entity_name, entity_data = entity
+            facts_str = '\n'.join([entry.fact for entry in entity_data['entries']])
+            computed_prompt = prompt.compile(name=entity_name, type=entity_data["category"], facts=facts_str)
+            return chat_completion(computed_prompt, prompt_name=prompt.name, prompt_version=prompt.version).strip()
 
+        # For each entity, generate a summary from all the facts, entities are merged independently
+        merged_facts = run_concurrently(merge_entity_facts, grouped_kb_entries.items())
 
-def sort_book_parts_recursive(book_part: BookPart, book_parts: list[BookPart]):
-    child_book_parts = [child for child in book_parts if child.parent_id == book_part.id]
-    child_book_parts = sorted(child_book_parts, key=lambda x: x.sibling_index)
-    sorted_book_parts = []
+        for (entity_name, entity_data), summary in zip(grouped_kb_entries.items(), merged_facts):
+            # Create a new KnowledgeBaseEntry with the merged summary
+            new_entry = KnowledgeBaseEntry(
+                book_id=book_part.book_id,
+                book_part_id=book_part.id,
+                entity_name=entity_name,
+                alternative_names='|'.join(entity_data['alternative_names']) if entity_data.get('alternative_names', []) else None,
+                category=entity_data['category'],
+                fact=summary,
+                sibling_index=None,
+                sibling_total=None
+            )
+            db.add(new_entry)
+        db.add(ExtractionCheckpoint(book_part_id=book_part.id, stage=ExtractionStage.ENTITY_MERGING))
+        db.commit()
+    finally:
+        db.close()
 
-    for child_book_part in child_book_parts:
-        sorted_book_parts.append(child_book_part)
-        sorted_book_parts.extend(sort_book_parts_recursive(child_book_part, book_parts))
-    return sorted_book_parts
 
+def merge_book_part_summaries(book_part: BookPart):
+    print(f"[Knowledge building task] Merging summaries for book part : {book_part.label}")
 
-def get_knowledge_base_entries(book_id: str, content: str, sub=True):
     db = SessionLocal()
+
     try:
-        filtered_kb_entries = []
-
-        if sub:
-            kb_entries = db.query(KnowledgeBaseEntry).filter(
-                KnowledgeBaseEntry.book_id == book_id,
-                KnowledgeBaseEntry.sibling_index.isnot(None),
-                KnowledgeBaseEntry.sibling_total.isnot(None)
-            ).order_by(KnowledgeBaseEntry.created_at).all()
-        else:
-            kb_entries = db.query(KnowledgeBaseEntry).filter(
-                KnowledgeBaseEntry.book_id == book_id,
-                KnowledgeBaseEntry.sibling_index.is_(None),
-                KnowledgeBaseEntry.sibling_total.is_(None)
-            ).order_by(KnowledgeBaseEntry.created_at).all()
+        summaries = db.query(Summary).filter(
+            Summary.book_part_id == book_part.id,
+            Summary.sibling_index.isnot(None),
+            Summary.sibling_total.isnot(None)
+        ).order_by(Summary.sibling_index).all()
 
-        for kb_entry in kb_entries:
-            if (kb_entry.entity_name.strip().lower() in content.lower()
-                or (kb_entry.referenced_entity_name and kb_entry.referenced_entity_name.strip().lower() in content.lower())
-                    or (kb_entry.alternative_names and any(name.strip().lower() in content.lower() for name in kb_entry.alternative_names.split("|")))):
-                filtered_kb_entries.append(kb_entry)
-        return filtered_kb_entries
+        if summaries:
+            # Merge all the summaries into one
+            summaries = '\n'.join([summary.content for summary in summaries])
+
+            prompt = languse.get_prompt("summary_merging", label="latest")
+            computed_prompt = prompt.compile(summaries=summaries)
+
+            merged_content = chat_completion(computed_prompt, prompt_name=prompt.name, prompt_version=prompt.version).strip()
+
+            # Create a new Summary with the merged content
+            new_summary = Summary(
+                book_id=book_part.book_id,
+                book_part_id=book_part.id,
+                content=merged_content,
+                sibling_index=None,
+                sibling_total=None
+            )
+            db.add(new_summary)
+        db.add(ExtractionCheckpoint(book_part_id=book_part.id, stage=ExtractionStage.SUMMARY_MERGING))
+        db.commit()
     finally:
         db.close()
 
 
-def group_knowledge_base_entries(kb_entries: list[KnowledgeBaseEntry]):
-    G = nx.Graph()
+class KnowledgeBaseIndex:
+    """Name index of the knowledge base entries of a book, matching entries are found in a single pass over a text.
 
-    for i in range(len(kb_entries)):
-        G.add_node(i)
+    An entry matches a text if its name, referenced name or one of its alternative names appears in it, case insensitively.
+    """
 
-    # Add edges to the graph
-    for i in range(len(kb_entries)):
-        name_i = kb_entries[i].entity_name.strip().lower()
-        alt_i = [name.strip().lower() for name in kb_entries[i].alternative_names.split("|")] if kb_entries[i].alternative_names else []
-        ref_i = kb_entries[i].referenced_entity_name.strip().lower() if kb_entries[i].referenced_entity_name else None
+    def __init__(self, kb_entries: list[KnowledgeBaseEntry] = ()):
+        self.automaton = AhoCorasick()
+        self.entries: list[KnowledgeBaseEntry] = []
+        # entries with an empty name match any text
+        self.always_matching: set[int] = set()
 
-        for j in range(i+1, len(kb_entries)):
-            name_j = kb_entries[j].entity_name.strip().lower()
-            alt_j = [name.strip().lower() for name in kb_entries[j].alternative_names.split("|")] if kb_entries[j].alternative_names else []
-            ref_j = kb_entries[j].referenced_entity_name.strip().lower() if kb_entries[j].referenced_entity_name else None
+        for kb_entry in kb_entries:
+            self.add(kb_entry)
+
+    def add(self, kb_entry: KnowledgeBaseEntry):
+        position = len(self.entries)
+        self.entries.append(kb_entry)
+
+        names = [kb_entry.entity_name]
+        if kb_entry.referenced_entity_name:
+            names.append(kb_entry.referenced_entity_name)
+        if kb_entry.alternative_names:
+            names.extend(kb_entry.alternative_names.split("|"))
+
+        for name in names:
+            name = name.strip().lower()
+            if name == "":
+                self.always_matching.add(position)
+            else:
+                self.automaton.add(name, position)
 
-            if name_i == name_j or (
-                    ref_i and ref_i == name_j) or (
-                    ref_j and name_i == ref_j) or (
-                    ref_i and ref_j and ref_i == ref_j) or any(
-                    name_i == alt_name for alt_name in alt_j) or any(
-                    name_j == alt_name for alt_name in alt_i):
-                G.add_edge(i, j)
+    def match(self, content: str, whole_words: bool = False) -> list[KnowledgeBaseEntry]:
+        positions = set(self.always_matching)
+        for _, _, matched_positions in self.automaton.iter_matches(content.lower(), whole_words=whole_words):
+            positions.update(matched_positions)
 
-    groups = list(nx.connected_components(G))
+        return [self.entries[position] for position in sorted(positions)]
 
-    merged_kb_entries = {}
 
-    for i, group in enumerate(groups):
-        names = [kb_entries[node_index].entity_name for node_index in group]
-        referenced_names = [kb_entries[node_index].referenced_entity_name for node_index in group if kb_entries[node_index].referenced_entity_name]
-        alternative_names = [name.strip() for node_index in group for name in (kb_entries[node_index].alternative_names.split('|') if kb_entries[node_index].alternative_names else [])]
-        categories = [kb_entries[node_index].category for node_index in group]
+def query_knowledge_base_entries(db, book_id: str, sub=True) -> list[KnowledgeBaseEntry]:
+    if sub:
+        return db.query(KnowledgeBaseEntry).filter(
+            KnowledgeBaseEntry.book_id == book_id,
+            KnowledgeBaseEntry.sibling_index.isnot(None),
+            KnowledgeBaseEntry.sibling_total.isnot(None)
+        ).order_by(KnowledgeBaseEntry.created_at).all()
+    else:
+        return db.query(KnowledgeBaseEntry).filter(
+            KnowledgeBaseEntry.book_id == book_id,
+            KnowledgeBaseEntry.sibling_index.is_(None),
+            KnowledgeBaseEntry.sibling_total.is_(None)
+        ).order_by(KnowledgeBaseEntry.created_at).all()
 
-        most_used_name = Counter(names + referenced_names).most_common(1)[0][0]
-        most_used_category = Counter(categories).most_common(1)[0][0]
 
-        merged_kb_entries[most_used_name] = {
-            "alternative_names": list(set(names + referenced_names + alternative_names) - {most_used_name}),
-            "category": most_used_category,
-            "entries": [kb_entries[node_index] for node_index in group]
-        }
+def get_knowledge_base_entries(book_id: str, content: str, sub=True, whole_words=False):
+    db = SessionLocal()
+    try:
+        return KnowledgeBaseIndex(query_knowledge_base_entries(db, book_id, sub)).match(content, whole_words=whole_words)
+    finally:
+        db.close()
 
-    return merged_kb_entries
 
+def lower_same_length(text: str) -> str:
+    """Lowercase a text without changing the offset of any character."""
+    lower_text = text.lower()
+    if len(lower_text) == len(text):
+        return lower_text
+    # a few characters lowercase to several ones
+    return ''.join(char.lower() if len(char.lower()) == 1 else char for char in text)
+
+
+def find_entity_mentions(entity_names: dict[str, list[str]], book_parts_content: dict) -> dict[tuple, tuple[list[int], list[int]]]:
+    """Find the mentions of entities in book parts, scanning each book part once.
+
+    Parameters
+    ----------
+    entity_names : dict[str, list[str]]
+        The names of each entity, matched as whole words case insensitively.
+    book_parts_content : dict
+        The content of each book part.
+
+    Returns
+    -------
+    dict[tuple, tuple[list[int], list[int]]]
+        The start and end offsets of the mentions of each (entity, book part) pair with at least one mention.
+        The mentions of an entity don't overlap, the longest name is kept at a given position.
+    """
+
+    automaton = AhoCorasick()
+    for entity_name, names in entity_names.items():
+        for name in {name.strip().lower() for name in names} - {''}:
+            automaton.add(name, entity_name)
+
+    mentions = {}
+    for book_part_id, content in book_parts_content.items():
+        spans = {}
+        for start, end, matched_entity_names in automaton.iter_matches(lower_same_length(content), whole_words=True):
+            for entity_name in matched_entity_names:
+                spans.setdefault(entity_name, []).append((start, -end))
+
+        for entity_name, entity_spans in spans.items():
+            starts, ends = [], []
+            for start, end in sorted(entity_spans):
+                if not ends or start >= ends[-1]:
+                    starts.append(start)
+                    ends.append(-end)
+            mentions[entity_name, book_part_id] = (starts, ends)
+    return mentions
+
+
+def get_entities_snapshot(kb_entries: list[KnowledgeBaseEntry], book_parts_content: dict) -> tuple[list[dict], dict]:
+    """Group the merged entries of a book into the serialized entities served by the API and find their mentions.
+
+    The occurrences of a fact are the mentions of its entity in its book part, see find_entity_mentions.
+    """
+    grouped_kb_entries = group_knowledge_base_entries(kb_entries)
+    mentions = find_entity_mentions({entity_name: [entity_name] + v["alternative_names"] for entity_name, v in grouped_kb_entries.items()}, book_parts_content)
+
+    entities = []
+    for entity_name, v in grouped_kb_entries.items():
+        entities.append(EntityResponseSchema(
+            name=entity_name,
+            alternative_names=v["alternative_names"],
+            category=v["category"],
+            facts=[Fact(
+                book_part_id=entry.book_part_id,
+                content=entry.fact,
+                occurrences=len(mentions.get((entity_name, entry.book_part_id), ((), ()))[0]),
+                sibling_index=None,
+                sibling_total=None
+            ) for entry in v["entries"]]
+        ).model_dump(mode='json'))
+    return entities, mentions
+
+
+def get_entity_mention_rows(book_id, mentions: dict) -> list[dict]:
+    return [
+        {'id': uuid.uuid4(), 'book_id': book_id, 'book_part_id': book_part_id, 'entity_name': entity_name, 'starts': starts, 'ends': ends}
+        for (entity_name, book_part_id), (starts, ends) in mentions.items()
+    ]
+
+
+def write_entity_snapshot(db, book_id: str):
+    """Replace the entity snapshot and the entity mentions of a book with its current knowledge base entries."""
+    kb_entries = query_knowledge_base_entries(db, book_id, sub=False)
+    book_parts_content = dict(db.query(BookPart.id, BookPart.content).filter(BookPart.book_id == book_id))
+    entities, mentions = get_entities_snapshot(kb_entries, book_parts_content)
+
+    delete_entity_snapshot(db, book_id)
+    db.add(EntitySnapshot(book_id=book_id, version=ENTITY_SNAPSHOT_VERSION, entities=entities))
+    if mentions:
+        db.execute(insert(EntityMention), get_entity_mention_rows(book_id, mentions))
+    db.commit()
+
+
+def delete_entity_snapshot(db, book_id: str):
+    db.query(EntityMention).filter(EntityMention.book_id == book_id).delete()
+    db.query(EntitySnapshot).filter(EntitySnapshot.book_id == book_id).delete()
+
+
+def get_book_part_labels(db, book_id: str) -> dict:
+    return {book_part_id: label.strip() for book_part_id, label in db.query(BookPart.id, BookPart.label).filter(BookPart.book_id == book_id)}
+
+
+def format_knowledge_base_entities(merged_kb_entries: dict[str, dict], max_entries_per_name: int = 3, book_part_labels: dict | None = None) -> str:
+    if book_part_labels is None:
+        # fetch the labels of every referenced book part in a single query
+        book_part_ids = {entry.book_part_id for v in merged_kb_entries.values() for entry in v['entries'][-max_entries_per_name:]}
+        book_part_labels = {}
+        if book_part_ids:
+            db = SessionLocal()
+            try:
+                book_part_labels = {book_part_id: label.strip() for book_part_id, label in db.query(BookPart.id, BookPart.label).filter(BookPart.id.in_(book_part_ids))}
+            finally:
+                db.close()
 
-def format_knowledge_base_entities(merged_kb_entries: dict[str, dict], max_entries_per_name: int = 3) -> str:
     output_dict = {}
     for k, v in merged_kb_entries.items():
         output_dict[k] = {
@@ -354,16 +503,9 @@ def format_knowledge_base_entities(merged_kb_entries: dict[str, dict], max_entri
 
         entries = []
         for entry in v['entries'][-max_entries_per_name:]:
-            # get the associated book_part label
-            db = SessionLocal()
-            try:
-                book_part_label = db.query(BookPart).filter(BookPart.id == entry.book_part_id).first().label.strip()
-            finally:
-                db.close()
-
             entries.append({
                 "fact": entry.fact,
-                "chapter_name": book_part_label,
+                "chapter_name": book_part_labels[entry.book_part_id],
                 "chapter_sub_part": f"{entry.sibling_index+1}/{entry.sibling_total}"
             })
         output_dict[k]["facts"] = entries
@@ -0,0 +1,201 @@
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from typing import Callable, Iterable, TypeVar
+from dotenv import load_dotenv
+from langfuse.openai import OpenAI
+
+load_dotenv(override=True)
+# OPENAI_BASE_URL can point this client to a local stub server
+client = OpenAI()
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+def get_llm_concurrency() -> int:
+    return max(1, int(os.environ.get("LLM_CONCURRENCY", 8)))
+
+
+class LLMResponseCache:
+    """Content-addressed SQLite store of completions, evicted by age and by total size (least recently used first).
+
+    The database file is shared by the API and the worker processes. Errors of the database are logged and handled
+    as a miss or a skipped store, the cache never fails a completion.
+    """
+
+    def __init__(self, path: str, max_size_bytes: int, max_age_seconds: float, eviction_interval: int = 100, busy_timeout_ms: int = 5000):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.max_size_bytes = max_size_bytes
+        self.max_age_seconds = max_age_seconds
+        self.eviction_interval = eviction_interval
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=busy_timeout_ms / 1000)
+        # readers don't block the writer of another process, and a locked database is waited for
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS llm_responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS ix_llm_responses_accessed_at ON llm_responses (accessed_at)")
+        self._connection.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(model: str, prompt_name: str | None, prompt_version: int | None, prompt: str, response_format: dict | None) -> str:
+        key_data = json.dumps([model, prompt_name, prompt_version, prompt, response_format], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(key_data.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            now = time.time()
+            try:
+                row = self._connection.execute(
+                    "SELECT response FROM llm_responses WHERE key = ? AND created_at >= ?",
+                    (key, now - self.max_age_seconds)
+                ).fetchone()
+            except sqlite3.Error as e:
+                print(f"[LLM cache] Lookup failed, handled as a miss : {e}")
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            try:
+                self._connection.execute("UPDATE llm_responses SET accessed_at = ? WHERE key = ?", (now, key))
+                self._connection.commit()
+            except sqlite3.Error as e:
+                # the response is still served, it only looks older to the eviction
+                self._connection.rollback()
+                print(f"[LLM cache] Access time not updated : {e}")
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, response: str):
+        with self._lock:
+            now = time.time()
+            try:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO llm_responses (key, response, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, response, len(response.encode('utf-8')), now, now)
+                )
+                self._connection.commit()
+            except sqlite3.Error as e:
+                self._connection.rollback()
+                print(f"[LLM cache] Store skipped : {e}")
+                return
+            self._writes += 1
+            if self._writes % self.eviction_interval != 0:
+                return
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            try:
+                self._connection.execute("DELETE FROM llm_responses WHERE created_at < ?", (time.time() - self.max_age_seconds,))
+                # keep the most recently used responses that fit in max_size_bytes
+                self._connection.execute(
+                    "DELETE FROM llm_responses WHERE key IN ("
+                    "SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC, key) AS cumulative_size FROM llm_responses) "
+                    "WHERE cumulative_size > ?)",
+                    (self.max_size_bytes,)
+                )
+                self._connection.commit()
+            except sqlite3.Error as e:
+                # retried at the next eviction
+                self._connection.rollback()
+                print(f"[LLM cache] Eviction skipped : {e}")
+
+    def stats(self, since: dict | None = None) -> dict[str, int | float]:
+        """Hits and misses of this process, counted from a previous result of stats when since is given."""
+        with self._lock:
+            try:
+                entries, size = self._connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_responses").fetchone()
+            except sqlite3.Error:
+                entries, size = None, None
+        hits = self.hits - (since["hits"] if since else 0)
+        misses = self.misses - (since["misses"] if since else 0)
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / lookups if lookups > 0 else 0,
+            "entries": entries,
+            "size_bytes": size
+        }
+
+
+@cache
+def get_llm_cache() -> LLMResponseCache | None:
+    """Cache of the process, opened at the first completion so that importing this module doesn't open the database."""
+    if os.environ.get("LLM_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    try:
+        return LLMResponseCache(
+            path=os.environ.get("LLM_CACHE_PATH", "data/llm_cache.sqlite"),
+            max_size_bytes=int(float(os.environ.get("LLM_CACHE_MAX_SIZE_MB", 512)) * 1024 * 1024),
+            max_age_seconds=float(os.environ.get("LLM_CACHE_MAX_AGE_DAYS", 90)) * 24 * 3600,
+            busy_timeout_ms=int(os.environ.get("LLM_CACHE_BUSY_TIMEOUT_MS", 5000))
+        )
+    except sqlite3.Error as e:
+        print(f"[LLM cache] Disabled, the database could not be opened : {e}")
+        return None
+
+
+def chat_completion(prompt: str, model: str = "gpt-4o-mini", response_format: dict | None = None,
+                    prompt_name: str | None = None, prompt_version: int | None = None, refresh: bool = False) -> str:
+    """Return the completion of a single user prompt, served from llm_cache when possible.
+    refresh skips the cache lookup (e.g. when retrying after an unusable answer) but still stores the new answer."""
+    key = None
+    llm_cache = get_llm_cache()
+    if llm_cache is not None:
+        key = LLMResponseCache.make_key(model, prompt_name, prompt_version, prompt, response_format)
+        if not refresh:
+            cached_response = llm_cache.get(key)
+            if cached_response is not None:
+                return cached_response
+
+    kwargs = {"response_format": response_format} if response_format else {}
+    completion = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "user", "content": prompt}
+        ],
+        **kwargs
+    )
+    response = completion.choices[0].message.content
+
+    if key is not None and response is not None:
+        llm_cache.set(key, response)
+    return response
+
+
+def run_concurrently(func: Callable[[T], R], items: Iterable[T], max_workers: int | None = None) -> list[R]:
+    """Apply func to every item using a bounded thread pool, results are returned in the order of items."""
+    items = list(items)
+    if not items:
+        return []
+
+    max_workers = min(max_workers or get_llm_concurrency(), len(items))
+    if max_workers == 1:
+        return [func(item) for item in items]
+
+    # each call runs in a copy of the caller context so that the langfuse trace is kept
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, func, item) for item in items]
+        return [future.result() for future in futures]
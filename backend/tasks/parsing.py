@@ -1,14 +1,17 @@
-import io
-import os
+import hashlib
+import uuid
 from dotenv import load_dotenv
 from ebooklib import epub
 import re
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langfuse.decorators import langfuse_context, observe
-from backend.database import SessionLocal
+from sqlalchemy.orm import load_only
+from backend.database import SessionLocal, book_lock
 from backend.models.users import User
 from backend.models.books import Book
 from backend.models.book_parts import BookPart
+from backend.book_statistics import get_text_statistics, refresh_book_statistics
+from backend.storage import get_blob_store
+from backend.tasks.chunking import get_splitter_config_hash, set_book_part_chunks
 from core.parsing import extract_structured_toc
 
 EXCLUDE_LABELS = [r'^couverture$', r'^titre$', r'^avant-propos', r'^préface', r'^postface', r'^biographie$', r'^bibliographie$', r'^du même auteur$', r'^mentions légales$',
@@ -17,15 +20,21 @@ EXCLUDE_LABELS = [r'^couverture$', r'^titre$', r'^avant-propos', r'^préface', r
 load_dotenv()
 
 
+def get_content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
 @observe()
-def extract_book_parts_task(book_id: str):
+@book_lock
+def extract_book_parts_task(book_id: str, user_id: str | None = None):
+    """Parse the parts of a book, user_id is the user requesting it when the book is a shared canonical book."""
     print(f'[Starting extraction task] book_id : {book_id}')
 
     db = SessionLocal()
 
     try:
         book_file = db.query(Book).filter(Book.id == book_id).first()
-        user = db.query(User).filter(User.id == book_file.user_id).first()
+        user = db.query(User).filter(User.id == (user_id or book_file.user_id)).first()
 
         langfuse_context.update_current_trace(
             metadata={"book_id": book_id, "book_title": book_file.title, "user_id": user.id, "user_name": user.name},
@@ -34,69 +43,75 @@ def extract_book_parts_task(book_id: str):
         )
 
         if book_file:
-            book = epub.read_epub(io.BytesIO(book_file.file_data))
+            with get_blob_store().open(book_file.data_hash) as f:
+                book = epub.read_epub(f)
         else:
             raise ValueError("Book with the provided ID was not found in the database.")
 
         content = extract_structured_toc(book)
 
-        def iterate_text_parts(node, sibling_index, parent_id=None):
+        # Index the parts already stored for this book, their content is not loaded
+        existing_book_parts = {
+            (part.parent_id, part.toc_id, part.label, part.content_hash, part.sibling_index): part
+            for part in db.query(BookPart).options(load_only(
+                BookPart.id, BookPart.parent_id, BookPart.toc_id, BookPart.label, BookPart.content_hash, BookPart.sibling_index, BookPart.chunk_config_hash,
+                BookPart.depth, BookPart.reading_order
+            )).filter(BookPart.book_id == book_id)
+        }
+        new_book_parts = []
+        # the parts are visited in reading order
+        reading_order = 0
+
+        def iterate_text_parts(node, sibling_index, parent_id=None, depth=0):
+            nonlocal reading_order
             # Check the part label to infer if it's part of the story
             is_story_part = not any(re.match(pattern, node['label'], re.IGNORECASE) for pattern in EXCLUDE_LABELS)
+            content_hash = get_content_hash(node['content'])
 
             # Check if the text_part is already present in the database
-            existing_book_part = db.query(BookPart).filter(
-                BookPart.book_id == book_id,
-                BookPart.parent_id == parent_id,
-                BookPart.toc_id == node['id'],
-                BookPart.label == node['label'],
-                BookPart.content == node['content'],
-                BookPart.sibling_index == sibling_index,
-            ).first()
-
-            if not existing_book_part:
-                # Compute the number of sub parts
-                node_content = re.sub(r'\n{4,}', '\n\n\n', node['content'])
-                text_splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=int(os.environ.get("CHUNK_SIZE")),
-                    chunk_overlap=int(os.environ.get("CHUNK_OVERLAP")),
-                    length_function=len,
-                    separators=["\n\n\n", "\n\n", "\n", ".", ",", " ", ""],
-                    keep_separator=True,
-                )
-
-                sub_parts = text_splitter.split_text(node_content)
+            book_part = existing_book_parts.get((parent_id, node['id'], node['label'], content_hash, sibling_index))
 
+            if not book_part:
                 book_part = BookPart(
+                    # the id is set here so that the children can reference it before the insert
+                    id=uuid.uuid4(),
                     book_id=book_id,
                     parent_id=parent_id,
                     toc_id=node['id'],
                     label=node['label'],
                     content=node['content'],
+                    content_hash=content_hash,
                     sibling_index=sibling_index,
+                    depth=depth,
+                    reading_order=reading_order,
                     is_story_part=is_story_part,
-                    sub_parts_count=len(sub_parts)
+                    **get_text_statistics(node['content'])
                 )
-
-                db.add(book_part)
-                db.commit()
+                # Compute the sub parts once, every extraction stage slices them from the stored offsets
+                set_book_part_chunks(book_part)
+                new_book_parts.append(book_part)
             else:
-                book_part = existing_book_part
                 print(f"BookPart with toc_id : {node['id']}, label : {node['label']} already exists in the database.")
+                if book_part.chunk_config_hash != get_splitter_config_hash():
+                    set_book_part_chunks(book_part, node['content'])
+                if (book_part.depth, book_part.reading_order) != (depth, reading_order):
+                    book_part.depth, book_part.reading_order = depth, reading_order
+            reading_order += 1
 
             for i, child in enumerate(node['children']):
-                iterate_text_parts(child, i, parent_id=book_part.id)
+                iterate_text_parts(child, i, parent_id=book_part.id, depth=depth + 1)
 
         for i, part in enumerate(content):
             iterate_text_parts(part, i)
 
-        # Update the is_parsed property
-        book_to_update = db.query(Book).filter(Book.id == book_id).first()
-        if book_to_update:
-            book_to_update.is_parsed = True
-            db.commit()
-        else:
-            raise ValueError("Book with the provided ID was not found in the database.")
+        # Insert the new parts in batches, parents come before their children, and update the is_parsed property in the same transaction
+        db.add_all(new_book_parts)
+        db.flush()
+        db.execute(refresh_book_statistics(book_id))
+        book_file.is_parsed = True
+        # the user books sharing this canonical book are parsed as well
+        db.query(Book).filter(Book.canonical_book_id == book_id).update({Book.is_parsed: True})
+        db.commit()
 
     finally:
         db.close()
@@ -0,0 +1,193 @@
+from functools import cache
+import importlib
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+import redis
+
+load_dotenv()
+
+# tasks that can be enqueued, imported by the workers only
+TASKS = {
+    'extract_book_parts': 'backend.tasks.parsing:extract_book_parts_task',
+    'build_knowledge_base': 'backend.tasks.knowledge_base_building:build_knowledge_base',
+}
+
+
+class JobStatus:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+
+# remove a reserved job from the processing list and requeue it, only if it was still there and, when a deadline
+# is given, only if its visibility deadline has passed. Running it atomically makes sure that two workers reaping
+# the same job, or a worker failing a job that was already reaped, do not run it twice.
+RELEASE_SCRIPT = """
+if ARGV[3] ~= '' then
+    local deadline = redis.call('ZSCORE', KEYS[2], ARGV[1])
+    if not deadline or tonumber(deadline) >= tonumber(ARGV[3]) then
+        return 0
+    end
+end
+local removed = redis.call('LREM', KEYS[1], 0, ARGV[1])
+if removed == 0 then
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+if ARGV[2] == '1' then
+    redis.call('LPUSH', KEYS[3], ARGV[1])
+end
+return removed
+"""
+
+
+def resolve_task(task_name: str):
+    module_name, function_name = TASKS[task_name].split(':')
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+class JobQueue:
+    """Durable job queue stored in Redis.
+
+    Pending job ids are kept in a list. A reserved job is moved atomically to a processing list and gets a
+    visibility deadline in a sorted set. Jobs whose deadline has passed (e.g. their worker died) are put back
+    in the pending list by reap_expired_jobs, until they run out of attempts.
+    Any redis-py compatible client with Lua scripting can be used, for instance fakeredis[lua] in tests.
+    """
+
+    def __init__(self, client: redis.Redis, name: str = 'jobs', visibility_timeout: int = 300, max_retries: int = 2):
+        self.client = client
+        self.visibility_timeout = visibility_timeout
+        self.max_retries = max_retries
+        self.pending_key = f'{name}:pending'
+        self.processing_key = f'{name}:processing'
+        self.deadlines_key = f'{name}:deadlines'
+        self.job_key_prefix = f'{name}:job:'
+        self.book_jobs_key_prefix = f'{name}:book:'
+        self._release_script = client.register_script(RELEASE_SCRIPT)
+
+    def _job_key(self, job_id: str) -> str:
+        return self.job_key_prefix + job_id
+
+    def enqueue(self, task_name: str, kwargs: dict, user_id: str | None = None, max_retries: int | None = None) -> str:
+        if task_name not in TASKS:
+            raise ValueError(f"Unknown task : {task_name}")
+
+        job_id = str(uuid.uuid4())
+        pipeline = self.client.pipeline()
+        pipeline.hset(self._job_key(job_id), mapping={
+            'id': job_id,
+            'task': task_name,
+            'kwargs': json.dumps(kwargs),
+            'user_id': str(user_id) if user_id else '',
+            'status': JobStatus.QUEUED,
+            'attempts': 0,
+            'max_retries': self.max_retries if max_retries is None else max_retries,
+            'error': '',
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'updated_at': datetime.now(timezone.utc).isoformat(),
+        })
+        pipeline.lpush(self.pending_key, job_id)
+        if 'book_id' in kwargs:
+            pipeline.sadd(self.book_jobs_key_prefix + str(kwargs['book_id']), job_id)
+        pipeline.execute()
+        return job_id
+
+    def get_job(self, job_id: str) -> dict | None:
+        job = self.client.hgetall(self._job_key(job_id))
+        if not job:
+            return None
+        job = {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v) for k, v in job.items()}
+        job['kwargs'] = json.loads(job['kwargs'])
+        job['attempts'] = int(job['attempts'])
+        job['max_retries'] = int(job['max_retries'])
+        return job
+
+    def get_active_job_ids(self, book_id: str) -> list[str]:
+        """Ids of the queued and running jobs of a book."""
+        job_ids = [job_id.decode() if isinstance(job_id, bytes) else job_id for job_id in self.client.smembers(self.book_jobs_key_prefix + str(book_id))]
+        jobs = [self.get_job(job_id) for job_id in job_ids]
+        return [job['id'] for job in jobs if job and job['status'] in (JobStatus.QUEUED, JobStatus.RUNNING)]
+
+    def _finish(self, job_id: str, status: str, **fields):
+        """Set the final status of a job, it is not active anymore."""
+        job = self.get_job(job_id)
+        self._set_status(job_id, status, **fields)
+        if job and 'book_id' in job['kwargs']:
+            self.client.srem(self.book_jobs_key_prefix + str(job['kwargs']['book_id']), job_id)
+
+    def _set_status(self, job_id: str, status: str, **fields):
+        self.client.hset(self._job_key(job_id), mapping={'status': status, 'updated_at': datetime.now(timezone.utc).isoformat(), **fields})
+
+    def reserve(self, timeout: int = 5) -> dict | None:
+        """Block until a job is available and reserve it for visibility_timeout seconds."""
+        job_id = self.client.blmove(self.pending_key, self.processing_key, timeout, 'RIGHT', 'LEFT')
+        if job_id is None:
+            return None
+        job_id = job_id.decode() if isinstance(job_id, bytes) else job_id
+
+        self.client.zadd(self.deadlines_key, {job_id: time.time() + self.visibility_timeout})
+        self.client.hincrby(self._job_key(job_id), 'attempts', 1)
+        self._set_status(job_id, JobStatus.RUNNING)
+        return self.get_job(job_id)
+
+    def heartbeat(self, job_id: str):
+        """Extend the visibility deadline of a job that is still running."""
+        self.client.zadd(self.deadlines_key, {job_id: time.time() + self.visibility_timeout}, xx=True)
+
+    def _release(self, job_id: str, requeue: bool, expired_before: float | None = None) -> bool:
+        """Remove a job from the processing list, return False if it was not reserved (anymore) or has not expired."""
+        return self._release_script(
+            keys=[self.processing_key, self.deadlines_key, self.pending_key],
+            args=[job_id, '1' if requeue else '0', '' if expired_before is None else repr(expired_before)]
+        ) > 0
+
+    def complete(self, job_id: str) -> bool:
+        """Mark the job as succeeded, nothing is done if it is not reserved anymore, e.g. it expired and was requeued."""
+        if not self._release(job_id, requeue=False):
+            return False
+        self._finish(job_id, JobStatus.SUCCEEDED, error='')
+        return True
+
+    def fail(self, job_id: str, error: str, expired_before: float | None = None) -> bool:
+        """Requeue the job if it has attempts left, mark it as failed otherwise.
+
+        Nothing is done if the job is not reserved anymore, e.g. it was already released by another worker.
+        """
+        job = self.get_job(job_id)
+        can_retry = job is not None and job['attempts'] <= job['max_retries']
+        if not self._release(job_id, requeue=can_retry, expired_before=expired_before):
+            return False
+        if can_retry:
+            self._set_status(job_id, JobStatus.QUEUED, error=error)
+        else:
+            self._finish(job_id, JobStatus.FAILED, error=error)
+        return True
+
+    def reap_expired_jobs(self) -> list[str]:
+        """Release the reserved jobs whose visibility deadline has passed."""
+        expired_job_ids = []
+        now = time.time()
+        for job_id in self.client.lrange(self.processing_key, 0, -1):
+            job_id = job_id.decode() if isinstance(job_id, bytes) else job_id
+            deadline = self.client.zscore(self.deadlines_key, job_id)
+            if deadline is None:
+                # reserved but the deadline is not set yet
+                self.client.zadd(self.deadlines_key, {job_id: now + self.visibility_timeout}, nx=True)
+            elif deadline < now and self.fail(job_id, 'Visibility timeout expired', expired_before=now):
+                expired_job_ids.append(job_id)
+        return expired_job_ids
+
+
+@cache
+def get_job_queue() -> JobQueue:
+    return JobQueue(
+        redis.Redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0')),
+        visibility_timeout=int(os.getenv('JOB_VISIBILITY_TIMEOUT', 300)),
+        max_retries=int(os.getenv('JOB_MAX_RETRIES', 2)),
+    )
@@ -0,0 +1,115 @@
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import cache
+from dotenv import load_dotenv
+import redis.asyncio
+
+load_dotenv()
+
+
+class UserCache(ABC):
+    """Cache of the authenticated users, keyed by the subject of their token (the user name).
+
+    The cached users are served without reading the database until they expire or are invalidated, routes
+    that need an up to date balance must read it from the database. Hits and misses are counted per process.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, name: str) -> dict | None:
+        user = await self._get(name)
+        if user is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return user
+
+    @abstractmethod
+    async def _get(self, name: str) -> dict | None:
+        pass
+
+    @abstractmethod
+    async def set(self, name: str, user: dict):
+        pass
+
+    @abstractmethod
+    async def invalidate(self, name: str):
+        """Remove a user from the cache, to call when its balance or role change."""
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_ratio': self.hits / lookups if lookups else None}
+
+
+class MemoryUserCache(UserCache):
+    """LRU cache of the process, entries expire ttl seconds after being set."""
+
+    def __init__(self, ttl: float = 60, max_size: int = 10000):
+        super().__init__()
+        self.ttl = ttl
+        self.max_size = max_size
+        self._users: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def _get(self, name: str) -> dict | None:
+        with self._lock:
+            entry = self._users.get(name)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._users[name]
+                return None
+            self._users.move_to_end(name)
+            return entry[1]
+
+    async def set(self, name: str, user: dict):
+        with self._lock:
+            self._users[name] = (time.monotonic() + self.ttl, user)
+            self._users.move_to_end(name)
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+
+    async def invalidate(self, name: str):
+        with self._lock:
+            self._users.pop(name, None)
+
+    def stats(self) -> dict:
+        return {**super().stats(), 'size': len(self._users)}
+
+
+class RedisUserCache(UserCache):
+    """Cache shared by the API processes, an invalidation is seen by all of them."""
+
+    def __init__(self, client: redis.asyncio.Redis, ttl: float = 60, prefix: str = 'users:'):
+        super().__init__()
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def _get(self, name: str) -> dict | None:
+        user = await self.client.get(self.prefix + name)
+        return None if user is None else json.loads(user)
+
+    async def set(self, name: str, user: dict):
+        await self.client.set(self.prefix + name, json.dumps(user), px=int(self.ttl * 1000))
+
+    async def invalidate(self, name: str):
+        await self.client.delete(self.prefix + name)
+
+
+@cache
+def get_user_cache() -> UserCache:
+    backend = os.getenv('USER_CACHE', 'memory')
+    ttl = float(os.getenv('USER_CACHE_TTL', 60))
+    if backend == 'memory':
+        return MemoryUserCache(ttl=ttl, max_size=int(os.getenv('USER_CACHE_MAX_SIZE', 10000)))
+    elif backend == 'redis':
+        return RedisUserCache(redis.asyncio.Redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0')), ttl=ttl)
+    else:
+        raise ValueError(f"Unknown user cache : {backend}")
@@ -0,0 +1,60 @@
+import argparse
+import multiprocessing
+import os
+import threading
+import traceback
+from dotenv import load_dotenv
+
+from backend.tasks.queue import JobQueue, get_job_queue, resolve_task
+
+load_dotenv()
+
+
+def run_job(job_queue: JobQueue, job: dict):
+    print(f"[Worker {os.getpid()}] Running job {job['id']} : {job['task']} {job['kwargs']}")
+
+    # keep the job reserved while it runs, the deadline only expires if this process dies
+    stop_heartbeat = threading.Event()
+
+    def heartbeat():
+        while not stop_heartbeat.wait(job_queue.visibility_timeout / 3):
+            job_queue.heartbeat(job['id'])
+
+    heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+    heartbeat_thread.start()
+
+    try:
+        resolve_task(job['task'])(**job['kwargs'])
+    except Exception as e:
+        traceback.print_exc()
+        job_queue.fail(job['id'], f'{type(e).__name__}: {e}')
+    else:
+        job_queue.complete(job['id'])
+    finally:
+        stop_heartbeat.set()
+        heartbeat_thread.join()
+
+
+def work(job_queue: JobQueue | None = None, max_jobs: int | None = None):
+    """Process jobs until max_jobs have been run, forever if max_jobs is None."""
+    job_queue = job_queue or get_job_queue()
+    jobs_count = 0
+    while max_jobs is None or jobs_count < max_jobs:
+        job_queue.reap_expired_jobs()
+        job = job_queue.reserve()
+        if job is None:
+            continue
+        run_job(job_queue, job)
+        jobs_count += 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the background job workers')
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('WORKER_CONCURRENCY', 2)), help='Number of worker processes')
+    args = parser.parse_args()
+
+    processes = [multiprocessing.Process(target=work, name=f'worker-{i}') for i in range(args.concurrency)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
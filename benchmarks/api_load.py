@@ -0,0 +1,110 @@
+"""Load test of the read endpoints of the API, in requests per second.
+
+Start the API, then run from the repository root :
+    uvicorn backend.main:app --port 8000
+    python -m benchmarks.api_load [--url http://localhost:8000] [--clients 8 12 64] [--duration 10] [--books-only]
+
+A book of --parts parts of 10 KB with a few entities is written to the configured database for a new benchmark user.
+Each client sends GETs in a loop, cycling through /api/books/, /api/book_parts/book_id/{id},
+/api/processes/extraction/{id} and /api/entities/book_id/{id}, or only /api/books/ with --books-only. The book and the
+user are deleted at the end. The synchronous session is measured by running the server from the commit before the
+async engine.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import httpx
+
+from backend.database import SessionLocal
+from backend.models.book_parts import BookPart
+from backend.models.books import Book, FileType
+from backend.models.entity_snapshots import EntityMention, EntitySnapshot
+from backend.models.kb_entries import KnowledgeBaseEntry
+from backend.models.users import User
+
+PASSWORD = 'benchmark-password'
+
+
+def create_book(user_name: str, parts: int) -> uuid.UUID:
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.name == user_name).one()
+        book = Book(user_id=user.id, file_type=FileType.epub, original_file_name='benchmark.epub', file_size=parts * 10240, author='Author',
+                    title='Benchmark', data_hash=uuid.uuid4().hex, is_parsed=True)
+        db.add(book)
+        db.flush()
+        book_parts = [BookPart(book_id=book.id, toc_id=str(i), label=f'Chapter {i}', content=f'Winston met Julia in chapter {i}. ' * 320,
+                               sibling_index=i, depth=0, reading_order=i, is_story_part=True) for i in range(parts)]
+        db.add_all(book_parts)
+        db.flush()
+        db.add_all([KnowledgeBaseEntry(book_id=book.id, book_part_id=book_part.id, entity_name=name, category='PERSON', fact=f'{name} appears in {book_part.label}')
+                    for book_part in book_parts for name in ['Winston', 'Julia']])
+        db.commit()
+        return book.id
+    finally:
+        db.close()
+
+
+def delete_user(user_name: str):
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.name == user_name).one()
+        book_ids = [book_id for book_id, in db.query(Book.id).filter(Book.user_id == user.id)]
+        for model in [EntityMention, EntitySnapshot, KnowledgeBaseEntry, BookPart]:
+            db.query(model).filter(model.book_id.in_(book_ids)).delete(synchronize_session=False)
+        db.query(Book).filter(Book.id.in_(book_ids)).delete(synchronize_session=False)
+        db.delete(user)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def send_requests(client: httpx.AsyncClient, paths: list[str], token: str, deadline: float, counts: dict):
+    i = 0
+    while time.perf_counter() < deadline:
+        try:
+            response = await client.get(paths[i % len(paths)], headers={'Authorization': f'Bearer {token}'})
+            counts[response.status_code] = counts.get(response.status_code, 0) + 1
+        except httpx.TimeoutException:
+            counts['timeout'] = counts.get('timeout', 0) + 1
+        i += 1
+
+
+async def run(url: str, clients_counts: list[int], duration: float, parts: int, books_only: bool, timeout: float):
+    user_name = 'benchmark_' + uuid.uuid4().hex[:12]
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=httpx.Limits(max_connections=None)) as client:
+        response = await client.post('/api/auth/register', json={'name': user_name, 'email': f'{user_name}@example.com', 'password': PASSWORD, 'password_confirm': PASSWORD})
+        response.raise_for_status()
+        try:
+            book_id = create_book(user_name, parts)
+            response = await client.post('/api/auth/login', data={'username': user_name, 'password': PASSWORD})
+            response.raise_for_status()
+            token = response.json()['access_token']
+
+            paths = ['/api/books/']
+            if not books_only:
+                paths += [f'/api/book_parts/book_id/{book_id}', f'/api/processes/extraction/{book_id}', f'/api/entities/book_id/{book_id}']
+
+            for clients in clients_counts:
+                counts = {}
+                deadline = time.perf_counter() + duration
+                await asyncio.gather(*[send_requests(client, paths[i % len(paths):] + paths[:i % len(paths)], token, deadline, counts) for i in range(clients)])
+                served = sum(count for status, count in counts.items() if status != 'timeout')
+                print(f'{clients} clients : {served / duration:.1f} rps, responses {dict(sorted(counts.items(), key=str))}')
+        finally:
+            delete_user(user_name)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test the read endpoints of the API')
+    parser.add_argument('--url', default='http://localhost:8000', help='URL of the running API')
+    parser.add_argument('--clients', type=int, nargs='*', default=[8, 12, 64], help='Numbers of concurrent clients')
+    parser.add_argument('--duration', type=float, default=10, help='Duration of each run in seconds')
+    parser.add_argument('--parts', type=int, default=30, help='Number of parts of the book')
+    parser.add_argument('--books-only', action='store_true', help='Only request /api/books/')
+    parser.add_argument('--timeout', type=float, default=30, help='Timeout of a request in seconds')
+    args = parser.parse_args()
+
+    asyncio.run(run(args.url, args.clients, args.duration, args.parts, args.books_only, args.timeout))
@@ -0,0 +1,129 @@
+"""Benchmark of the grouping of knowledge base entries against the previous pairwise networkx version.
+
+Run from the repository root :
+    python -m benchmarks.entry_grouping [--entries 500 2000 5000] [--repeat 3]
+
+The entries are generated with shared names, alternative names and references, the groups of both versions are compared.
+"""
+import argparse
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+import networkx as nx
+
+from core.grouping import group_knowledge_base_entries
+
+
+@dataclass
+class Entry:
+    """Fields of a KnowledgeBaseEntry read by the grouping."""
+    entity_name: str
+    alternative_names: str | None
+    referenced_entity_name: str | None
+    category: str
+
+
+def generate_entries(count: int, seed: int = 0) -> list[Entry]:
+    """Entries on count // 4 entities, with case and spacing variants of their names and a few links between entities."""
+    rng = random.Random(seed)
+    entity_count = max(1, count // 4)
+
+    def variant(name: str) -> str:
+        return rng.choice([name, name.lower(), name.upper(), f' {name} '])
+
+    entries = []
+    for _ in range(count):
+        entity = rng.randrange(entity_count)
+        # an entity is named by its name or its nickname, some entries link it to another entity
+        names = [f'Entity {entity}', f'Nickname {entity}']
+        other_entity = rng.randrange(entity_count)
+        entity_name = variant(rng.choice(names))
+        alternative_names = '|'.join(variant(name) for name in names if name.lower() != entity_name.strip().lower()) if rng.random() < 0.5 else None
+        if rng.random() < 0.02:
+            alternative_names = '|'.join(filter(None, [alternative_names, variant(f'Entity {other_entity}')]))
+        referenced_entity_name = variant(f'Nickname {other_entity}') if rng.random() < 0.02 else None
+        entries.append(Entry(entity_name, alternative_names, referenced_entity_name, rng.choice(['PERSON', 'LOCATION', 'OBJECT'])))
+    return entries
+
+
+def group_knowledge_base_entries_pairwise(kb_entries: list[Entry]):
+    """Previous implementation, every pair of entries is compared and linked in a networkx graph."""
+    G = nx.Graph()
+
+    for i in range(len(kb_entries)):
+        G.add_node(i)
+
+    for i in range(len(kb_entries)):
+        name_i = kb_entries[i].entity_name.strip().lower()
+        alt_i = [name.strip().lower() for name in kb_entries[i].alternative_names.split("|")] if kb_entries[i].alternative_names else []
+        ref_i = kb_entries[i].referenced_entity_name.strip().lower() if kb_entries[i].referenced_entity_name else None
+
+        for j in range(i+1, len(kb_entries)):
+            name_j = kb_entries[j].entity_name.strip().lower()
+            alt_j = [name.strip().lower() for name in kb_entries[j].alternative_names.split("|")] if kb_entries[j].alternative_names else []
+            ref_j = kb_entries[j].referenced_entity_name.strip().lower() if kb_entries[j].referenced_entity_name else None
+
+            if name_i == name_j or (
+                    ref_i and ref_i == name_j) or (
+                    ref_j and name_i == ref_j) or (
+                    ref_i and ref_j and ref_i == ref_j) or any(
+                    name_i == alt_name for alt_name in alt_j) or any(
+                    name_j == alt_name for alt_name in alt_i):
+                G.add_edge(i, j)
+
+    groups = list(nx.connected_components(G))
+
+    merged_kb_entries = {}
+
+    for i, group in enumerate(groups):
+        names = [kb_entries[node_index].entity_name for node_index in group]
+        referenced_names = [kb_entries[node_index].referenced_entity_name for node_index in group if kb_entries[node_index].referenced_entity_name]
+        alternative_names = [name.strip() for node_index in group for name in (kb_entries[node_index].alternative_names.split('|') if kb_entries[node_index].alternative_names else [])]
+        categories = [kb_entries[node_index].category for node_index in group]
+
+        most_used_name = Counter(names + referenced_names).most_common(1)[0][0]
+        most_used_category = Counter(categories).most_common(1)[0][0]
+
+        merged_kb_entries[most_used_name] = {
+            "alternative_names": list(set(names + referenced_names + alternative_names) - {most_used_name}),
+            "category": most_used_category,
+            "entries": [kb_entries[node_index] for node_index in group]
+        }
+
+    return merged_kb_entries
+
+
+def get_groups(merged_kb_entries: dict) -> list[list[int]]:
+    """Entries of each group, compared by identity and in increasing order.
+
+    The pairwise version listed the entries of a group in the iteration order of a networkx set, which only decides
+    between names or categories used as many times, so the groups are compared and not the chosen names.
+    """
+    return sorted(sorted(id(entry) for entry in merged['entries']) for merged in merged_kb_entries.values())
+
+
+def benchmark(count: int, repeat: int):
+    kb_entries = generate_entries(count)
+    durations, outputs = {}, {}
+    for name, group in [('pairwise', group_knowledge_base_entries_pairwise), ('union-find', group_knowledge_base_entries)]:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            outputs[name] = group(kb_entries)
+        durations[name] = (time.perf_counter() - start) / repeat
+
+    print(f'{count} entries, {len(outputs["union-find"])} groups : '
+          + ', '.join(f'{name} {duration * 1000:.1f} ms' for name, duration in durations.items())
+          + f', speedup x{durations["pairwise"] / durations["union-find"]:.0f}'
+          + f', identical groups : {get_groups(outputs["pairwise"]) == get_groups(outputs["union-find"])}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the grouping of knowledge base entries')
+    parser.add_argument('--entries', type=int, nargs='*', default=[500, 2000, 5000], help='Numbers of generated entries')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs per version')
+    args = parser.parse_args()
+
+    for count in args.entries:
+        benchmark(count, args.repeat)
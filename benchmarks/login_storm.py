@@ -0,0 +1,89 @@
+"""Benchmark of the latency of an unrelated endpoint during a storm of logins.
+
+Start the API, then run from the repository root :
+    uvicorn backend.main:app --port 8000
+    python -m benchmarks.login_storm [--url http://localhost:8000] [--clients 8] [--duration 10]
+
+GET /api/books/ is polled every --interval seconds, first alone and then while --clients clients log in in a loop.
+The pool running bcrypt is set on the server with PASSWORD_HASHING_EXECUTOR and PASSWORD_HASHING_CONCURRENCY,
+the inline hashing is measured by running the server from the commit before the pool. The benchmark users are
+registered with a benchmark_ name.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+
+PASSWORD = 'benchmark-password'
+
+
+async def register(client: httpx.AsyncClient) -> str:
+    name = 'benchmark_' + uuid.uuid4().hex[:12]
+    response = await client.post('/api/auth/register', json={'name': name, 'email': f'{name}@example.com', 'password': PASSWORD, 'password_confirm': PASSWORD})
+    response.raise_for_status()
+    return name
+
+
+async def login(client: httpx.AsyncClient, name: str) -> str:
+    response = await client.post('/api/auth/login', data={'username': name, 'password': PASSWORD})
+    response.raise_for_status()
+    return response.json()['access_token']
+
+
+async def poll(client: httpx.AsyncClient, token: str, interval: float, stop: asyncio.Event) -> list[float]:
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get('/api/books/', headers={'Authorization': f'Bearer {token}'})
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def log_in_loop(client: httpx.AsyncClient, name: str, stop: asyncio.Event) -> int:
+    logins = 0
+    while not stop.is_set():
+        await login(client, name)
+        logins += 1
+    return logins
+
+
+def format_latencies(latencies: list[float]) -> str:
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return f'p50 {statistics.median(latencies) * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms, max {latencies[-1] * 1000:.1f} ms, {len(latencies)} pings'
+
+
+async def run(url: str, clients: int, duration: float, interval: float):
+    async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+        names = [await register(client) for _ in range(clients + 1)]
+        token = await login(client, names[0])
+
+        stop = asyncio.Event()
+        idle = asyncio.create_task(poll(client, token, interval, stop))
+        await asyncio.sleep(duration)
+        stop.set()
+        print(f'/api/books/ alone            : {format_latencies(await idle)}')
+
+        stop = asyncio.Event()
+        storm = asyncio.create_task(poll(client, token, interval, stop))
+        logins = [asyncio.create_task(log_in_loop(client, name, stop)) for name in names[1:]]
+        await asyncio.sleep(duration)
+        stop.set()
+        print(f'/api/books/ during the storm : {format_latencies(await storm)}')
+        print(f'{clients} clients, {sum(await asyncio.gather(*logins)) / duration:.1f} logins/s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the latency of the API during a storm of logins')
+    parser.add_argument('--url', default='http://localhost:8000', help='URL of the running API')
+    parser.add_argument('--clients', type=int, default=8, help='Number of clients logging in in a loop')
+    parser.add_argument('--duration', type=float, default=10, help='Duration of each phase in seconds')
+    parser.add_argument('--interval', type=float, default=0.02, help='Delay between two polls in seconds')
+    args = parser.parse_args()
+
+    asyncio.run(run(args.url, args.clients, args.duration, args.interval))
@@ -0,0 +1,156 @@
+"""Benchmark of the name index of the entity extraction against the previous AhoCorasick.
+
+Run from the repository root :
+    python -m benchmarks.name_index [--parts 40] [--sub-parts 20] [--names 8]
+
+The extraction is simulated on generated text : every sub part of every part is scanned, then the names found in it
+are added, like KnowledgeBaseIndex does with the new entries of a sub part. The whole book is then scanned once, like
+find_entity_mentions does. The matches of both versions are compared.
+"""
+import argparse
+import random
+import time
+from collections import deque
+from typing import Any, Iterator
+
+from core.matching import AhoCorasick, is_word_char
+
+
+class AhoCorasickPrevious:
+    """Previous AhoCorasick, the failure links of the whole automaton are rebuilt at the first search after an add."""
+
+    def __init__(self):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        # pattern index ending at each node, -1 if none
+        self._terminal: list[int] = [-1]
+        # nearest terminal node reachable through the failure links
+        self._output_link: list[int] = [0]
+        self._patterns: list[str] = []
+        self._values: list[list[Any]] = []
+        self._pattern_index: dict[str, int] = {}
+        self._is_built = True
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def __contains__(self, pattern: str) -> bool:
+        return pattern in self._pattern_index
+
+    def add(self, pattern: str, value: Any = None):
+        if pattern == '':
+            raise ValueError("Cannot add an empty pattern")
+
+        if pattern in self._pattern_index:
+            self._values[self._pattern_index[pattern]].append(value)
+            return
+
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._terminal.append(-1)
+                self._output_link.append(0)
+                self._goto[node][char] = next_node
+                self._is_built = False
+            node = next_node
+
+        self._pattern_index[pattern] = len(self._patterns)
+        self._terminal[node] = len(self._patterns)
+        self._patterns.append(pattern)
+        self._values.append([value])
+        # the new terminal can be the output link of other nodes
+        self._is_built = False
+
+    def _build(self):
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            self._output_link[child] = 0
+            queue.append(child)
+
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[child] = fail
+                self._output_link[child] = fail if self._terminal[fail] != -1 else self._output_link[fail]
+                queue.append(child)
+
+        self._is_built = True
+
+    def iter_matches(self, text: str, whole_words: bool = False) -> Iterator[tuple[int, int, list[Any]]]:
+        if not self._is_built:
+            self._build()
+
+        goto, fail, terminal, output_link = self._goto, self._fail, self._terminal, self._output_link
+        text_length = len(text)
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+
+            match_node = node if terminal[node] != -1 else output_link[node]
+            while match_node:
+                pattern_index = terminal[match_node]
+                end = position + 1
+                start = end - len(self._patterns[pattern_index])
+                if (not whole_words
+                        or ((start == 0 or not is_word_char(text[start - 1]))
+                            and (end == text_length or not is_word_char(text[end])))):
+                    yield start, end, self._values[pattern_index]
+                match_node = output_link[match_node]
+
+
+def generate_sub_parts(parts: int, sub_parts: int, names: int, seed: int = 0) -> list[list[tuple[str, list[str]]]]:
+    """Text of each sub part with the names extracted from it, a third of them are new names."""
+    rng = random.Random(seed)
+    words = ['the', 'night', 'was', 'dark', 'and', 'he', 'walked', 'through', 'ministry', 'of', 'truth', 'again']
+    known_names = ['winston']
+    book = []
+    for _ in range(parts * sub_parts):
+        sub_part_names = [rng.choice(known_names) if rng.random() < 0.66 else f'{rng.choice(words)} {rng.randrange(10 ** 6)}' for _ in range(names)]
+        known_names.extend(sub_part_names)
+        text = ' '.join(rng.choice(words + sub_part_names) for _ in range(180))
+        book.append((text, sub_part_names))
+    return [book[i:i + sub_parts] for i in range(0, len(book), sub_parts)]
+
+
+def run_extraction(automaton_class, book: list[list[tuple[str, list[str]]]]) -> tuple[float, float, list]:
+    start = time.perf_counter()
+    automaton = automaton_class()
+    matches = []
+    for part in book:
+        for text, names in part:
+            matches.append(sorted((match_start, match_end) for match_start, match_end, _ in automaton.iter_matches(text, whole_words=True)))
+            for name in names:
+                automaton.add(name, name)
+    extraction_duration = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for part in book:
+        for text, _ in part:
+            matches.append(sorted((match_start, match_end) for match_start, match_end, _ in automaton.iter_matches(text, whole_words=True)))
+    return extraction_duration, time.perf_counter() - start, matches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the name index of the entity extraction')
+    parser.add_argument('--parts', type=int, default=40, help='Number of parts of the book')
+    parser.add_argument('--sub-parts', type=int, default=20, help='Number of sub parts of each part')
+    parser.add_argument('--names', type=int, default=8, help='Number of names extracted from each sub part')
+    args = parser.parse_args()
+
+    book = generate_sub_parts(args.parts, args.sub_parts, args.names)
+    results = {name: run_extraction(automaton_class, book) for name, automaton_class in [('previous', AhoCorasickPrevious), ('current', AhoCorasick)]}
+    for name, (extraction_duration, scan_duration, _) in results.items():
+        print(f'{name} : extraction {extraction_duration * 1000:.0f} ms, final scan of the book {scan_duration * 1000:.0f} ms')
+    print(f'{args.parts * args.sub_parts} sub parts, speedup of the extraction x{results["previous"][0] / results["current"][0]:.1f}, '
+          f'identical matches : {results["previous"][2] == results["current"][2]}')
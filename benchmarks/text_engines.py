@@ -0,0 +1,65 @@
+"""Benchmark of the text extraction engines of core.parsing on EPUB items.
+
+Run from the repository root :
+    python -m benchmarks.text_engines [--epub path/to/book.epub ...] [--repeat 5]
+
+Without EPUB files, a generated chapter of 2000 paragraphs is used. The outputs of both engines are compared.
+"""
+import argparse
+import random
+import time
+import ebooklib
+from ebooklib import epub
+
+from core.config import parsing as parsing_config
+from core.parsing import get_item_body_content, parse_item
+
+ENGINES = ['bs4', 'lxml']
+
+
+class GeneratedBook:
+    """Book with a single generated chapter, served like the items of an EPUB file."""
+
+    def __init__(self, paragraphs: int = 2000, seed: int = 0):
+        rng = random.Random(seed)
+        words = ['the', 'night', 'was', 'dark', 'and', 'Winston', 'walked', 'through', 'ministry', 'of', 'truth', '’s', 'quiet']
+        body = ''.join(
+            f'<p class="text">{" ".join(rng.choices(words, k=rng.randint(40, 120)))} <i>{rng.choice(words)}</i> <span>{rng.choice(words)}</span>.</p>\n'
+            for _ in range(paragraphs)
+        )
+        self.content = f'<?xml version="1.0" encoding="utf-8"?><html xmlns="http://www.w3.org/1999/xhtml"><head><title>Generated</title></head><body><h1>Chapter</h1>{body}</body></html>'.encode('utf-8')
+
+    def get_item_with_href(self, href: str):
+        return self
+
+    def get_body_content(self) -> bytes:
+        return self.content
+
+
+def benchmark_book(name: str, book, item_hrefs: list[str], repeat: int):
+    size = sum(len(get_item_body_content(book, item_href)) for item_href in item_hrefs)
+    durations, outputs = {}, {}
+    for engine in ENGINES:
+        parsing_config['engine'] = engine
+        start = time.perf_counter()
+        for _ in range(repeat):
+            outputs[engine] = [parse_item(book, item_href, '') for item_href in item_hrefs]
+        durations[engine] = (time.perf_counter() - start) / repeat
+
+    print(f'{name} : {len(item_hrefs)} items, {size / 1024:.0f} KiB, '
+          + ', '.join(f'{engine} {durations[engine] * 1000:.1f} ms' for engine in ENGINES)
+          + f', speedup x{durations["bs4"] / durations["lxml"]:.1f}, identical output : {outputs["bs4"] == outputs["lxml"]}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the bs4 and lxml text extraction engines')
+    parser.add_argument('--epub', nargs='*', default=[], help='EPUB files whose documents are parsed')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs per engine')
+    args = parser.parse_args()
+
+    default_engine = parsing_config['engine']
+    benchmark_book('generated chapter', GeneratedBook(), ['chapter.xhtml'], args.repeat)
+    for path in args.epub:
+        book = epub.read_epub(path)
+        benchmark_book(path, book, [item.get_name() for item in book.get_items_of_type(ebooklib.ITEM_DOCUMENT)], args.repeat)
+    parsing_config['engine'] = default_engine
@@ -0,0 +1,81 @@
+"""Benchmark of the text normalization of core.parsing against its previous version.
+
+Run from the repository root :
+    python -m benchmarks.text_normalization [--epub path/to/book.epub ...] [--repeat 20]
+
+The chapter texts are extracted from the documents of the EPUB files, their first line is used as the label removed
+by remove_title, like the headings that repeat the label of a chapter. Without EPUB files, the generated chapter of
+benchmarks.text_engines is used. The outputs of both versions are compared.
+"""
+import argparse
+import re
+import time
+import ebooklib
+from ebooklib import epub
+
+from benchmarks.text_engines import GeneratedBook
+from core.config import parsing as parsing_config
+from core.parsing import clean_item_text, get_item_body_content, merge_item_text_fast
+
+
+def remove_title_previous(text_part: str, title: str) -> str:
+    """Previous remove_title, the text is copied for every matched character of the title."""
+    text_part = text_part.strip()
+    title = title.strip()
+
+    while len(title) > 0 and len(text_part) > 0:
+        if text_part[0].lower() == title[0].lower():
+            text_part = text_part[1:].strip()
+            title = title[1:].strip()
+        else:
+            break
+
+    return text_part
+
+
+def clean_item_text_previous(parsed_content: str, label: str) -> str:
+    """Previous clean_item_text, every replacement goes through re.sub."""
+    if parsing_config['remove_title']:
+        parsed_content = remove_title_previous(parsed_content.strip(), label)
+
+    for replacement in parsing_config['replace']:
+        parsed_content = re.sub(replacement[0], replacement[1], parsed_content)
+
+    return parsed_content
+
+
+def get_chapters(book, item_hrefs: list[str]) -> list[tuple[str, str]]:
+    """Extracted text and label of the documents of a book, before normalization."""
+    chapters = []
+    for item_href in item_hrefs:
+        text, _ = merge_item_text_fast(get_item_body_content(book, item_href))
+        if text.strip():
+            chapters.append((text, text.strip().split('\n', 1)[0]))
+    return chapters
+
+
+def benchmark_chapters(name: str, chapters: list[tuple[str, str]], repeat: int):
+    size = sum(len(text) for text, _ in chapters)
+    durations, outputs = {}, {}
+    for version, clean in [('previous', clean_item_text_previous), ('current', clean_item_text)]:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            outputs[version] = [clean(text, label) for text, label in chapters]
+        durations[version] = (time.perf_counter() - start) / repeat
+
+    print(f'{name} : {len(chapters)} chapters, {size / 1000:.0f}k characters, '
+          + ', '.join(f'{version} {duration * 1000:.2f} ms' for version, duration in durations.items())
+          + f', speedup x{durations["previous"] / durations["current"]:.1f}, identical output : {outputs["previous"] == outputs["current"]}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the normalization of the chapter texts')
+    parser.add_argument('--epub', nargs='*', default=[], help='EPUB files whose documents are normalized')
+    parser.add_argument('--repeat', type=int, default=20, help='Number of runs per version')
+    args = parser.parse_args()
+
+    generated_book = GeneratedBook()
+    benchmark_chapters('generated chapter', get_chapters(generated_book, ['chapter.xhtml']), args.repeat)
+    for path in args.epub:
+        book = epub.read_epub(path)
+        benchmark_chapters(path, get_chapters(book, [item.get_name() for item in book.get_items_of_type(ebooklib.ITEM_DOCUMENT)]), args.repeat)
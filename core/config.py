@@ -3,5 +3,7 @@ parsing = {
         [r'(\n{3,})', r'\n\n\n'],
         ['’', '\'']
     ],
-    'remove_title': True
+    'remove_title': True,
+    # text extraction engine : 'lxml' (single pass over the parsing events) or 'bs4' (BeautifulSoup tree walk)
+    'engine': 'lxml'
 }
@@ -0,0 +1,84 @@
+from collections import Counter
+
+
+class DisjointSet:
+    """Union-find over the integers 0..size-1, with path halving and union by size."""
+
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+        self.size = [1] * size
+
+    def find(self, i: int) -> int:
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i: int, j: int):
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i == root_j:
+            return
+        if self.size[root_i] < self.size[root_j]:
+            root_i, root_j = root_j, root_i
+        self.parent[root_j] = root_i
+        self.size[root_i] += self.size[root_j]
+
+    def groups(self) -> list[list[int]]:
+        """Return the groups ordered by their smallest element, each group being sorted."""
+        groups = {}
+        for i in range(len(self.parent)):
+            groups.setdefault(self.find(i), []).append(i)
+        return list(groups.values())
+
+
+def group_knowledge_base_entries(kb_entries: list) -> dict[str, dict]:
+    """Group the entries that refer to the same entity.
+
+    Two entries are linked when they share a name or a referenced name, when one references the other's name
+    or when one's name is an alternative name of the other. Entries are indexed by these keys so the grouping
+    is near linear in the number of names instead of comparing every pair of entries. The entries are knowledge base
+    entries, or any objects with their entity_name, alternative_names, referenced_entity_name and category fields.
+    """
+    names = [kb_entry.entity_name.strip().lower() for kb_entry in kb_entries]
+    referenced_names = [kb_entry.referenced_entity_name.strip().lower() if kb_entry.referenced_entity_name else None for kb_entry in kb_entries]
+
+    disjoint_set = DisjointSet(len(kb_entries))
+
+    # first entry seen for each name and each referenced name
+    name_owners = {}
+    referenced_name_owners = {}
+    for i, (name, referenced_name) in enumerate(zip(names, referenced_names)):
+        disjoint_set.union(i, name_owners.setdefault(name, i))
+        if referenced_name:
+            disjoint_set.union(i, referenced_name_owners.setdefault(referenced_name, i))
+
+    for i, kb_entry in enumerate(kb_entries):
+        if referenced_names[i] and referenced_names[i] in name_owners:
+            disjoint_set.union(i, name_owners[referenced_names[i]])
+        if kb_entry.alternative_names:
+            for alternative_name in kb_entry.alternative_names.split("|"):
+                alternative_name = alternative_name.strip().lower()
+                if alternative_name in name_owners:
+                    disjoint_set.union(i, name_owners[alternative_name])
+
+    groups = disjoint_set.groups()
+
+    merged_kb_entries = {}
+
+    for i, group in enumerate(groups):
+        names = [kb_entries[node_index].entity_name for node_index in group]
+        referenced_names = [kb_entries[node_index].referenced_entity_name for node_index in group if kb_entries[node_index].referenced_entity_name]
+        alternative_names = [name.strip() for node_index in group for name in (kb_entries[node_index].alternative_names.split('|') if kb_entries[node_index].alternative_names else [])]
+        categories = [kb_entries[node_index].category for node_index in group]
+
+        most_used_name = Counter(names + referenced_names).most_common(1)[0][0]
+        most_used_category = Counter(categories).most_common(1)[0][0]
+
+        merged_kb_entries[most_used_name] = {
+            "alternative_names": list(set(names + referenced_names + alternative_names) - {most_used_name}),
+            "category": most_used_category,
+            "entries": [kb_entries[node_index] for node_index in group]
+        }
+
+    return merged_kb_entries
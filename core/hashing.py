@@ -0,0 +1,11 @@
+import hashlib
+from typing import BinaryIO
+
+
+def hash_stream(stream: BinaryIO, chunk_size: int = 1024 * 1024) -> str:
+    """Compute the sha256 of a stream read in chunks from its start, the key of its content in the blob store."""
+    stream.seek(0)
+    sha256 = hashlib.sha256()
+    while chunk := stream.read(chunk_size):
+        sha256.update(chunk)
+    return sha256.hexdigest()
@@ -0,0 +1,165 @@
+from collections import deque
+import heapq
+from operator import itemgetter
+from typing import Any, Iterator
+
+
+def is_word_char(char: str) -> bool:
+    return char.isalnum() or char == '_'
+
+
+class _Automaton:
+    """Aho-Corasick automaton of a fixed set of patterns, built once."""
+
+    def __init__(self, patterns: list[str], values: list[list[Any]], pattern_indexes: list[int]):
+        # shared with the AhoCorasick owning the automaton
+        self.patterns = patterns
+        self.values = values
+        self.pattern_indexes = pattern_indexes
+        self.goto: list[dict[str, int]] = [{}]
+        # pattern index ending at each node, -1 if none
+        self.terminal: list[int] = [-1]
+
+        for pattern_index in pattern_indexes:
+            node = 0
+            for char in patterns[pattern_index]:
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto.append({})
+                    self.terminal.append(-1)
+                    self.goto[node][char] = next_node
+                node = next_node
+            self.terminal[node] = pattern_index
+
+        self.fail: list[int] = [0] * len(self.goto)
+        # nearest terminal node reachable through the failure links
+        self.output_link: list[int] = [0] * len(self.goto)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                fail = self.fail[node]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+                self.fail[child] = fail
+                self.output_link[child] = fail if self.terminal[fail] != -1 else self.output_link[fail]
+                queue.append(child)
+
+    def iter_matches(self, text: str, whole_words: bool = False) -> Iterator[tuple[int, int, list[Any]]]:
+        goto, fail, terminal, output_link = self.goto, self.fail, self.terminal, self.output_link
+        text_length = len(text)
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+
+            match_node = node if terminal[node] != -1 else output_link[node]
+            while match_node:
+                pattern_index = terminal[match_node]
+                end = position + 1
+                start = end - len(self.patterns[pattern_index])
+                if (not whole_words
+                        or ((start == 0 or not is_word_char(text[start - 1]))
+                            and (end == text_length or not is_word_char(text[end])))):
+                    yield start, end, self.values[pattern_index]
+                match_node = output_link[match_node]
+
+
+class AhoCorasick:
+    """Multi-pattern string matcher based on the Aho-Corasick automaton.
+
+    Patterns can be added at any time. The patterns added since the main automaton was built are searched with a
+    second automaton, rebuilt before the next search, so a search following an add only builds the automaton of the
+    recent patterns. The main automaton is rebuilt with every pattern once the characters scanned by the recent
+    automaton outweigh the characters of the patterns to rebuild, which bounds the work to about twice the best of
+    rebuilding at each search and scanning with two automatons. Each pattern carries a list of values, adding the
+    same pattern twice appends to that list.
+    """
+
+    def __init__(self):
+        self._patterns: list[str] = []
+        self._values: list[list[Any]] = []
+        self._pattern_index: dict[str, int] = {}
+        self._main = _Automaton(self._patterns, self._values, [])
+        # number of characters of the patterns of the main automaton
+        self._main_size = 0
+        self._recent_pattern_indexes: list[int] = []
+        # automaton of the recent patterns, None until the next search after an add
+        self._recent: _Automaton | None = None
+        # characters scanned by the recent automatons since the main automaton was built
+        self._recent_scanned = 0
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def __contains__(self, pattern: str) -> bool:
+        return pattern in self._pattern_index
+
+    def add(self, pattern: str, value: Any = None):
+        """Add a non empty pattern to the automaton.
+
+        Parameters
+        ----------
+        pattern : str
+            The pattern to search for, matching is case sensitive.
+        value : Any
+            Value returned alongside each match of the pattern.
+        """
+
+        if pattern == '':
+            raise ValueError("Cannot add an empty pattern")
+
+        if pattern in self._pattern_index:
+            # the values are shared by the automatons, a known pattern doesn't change them
+            self._values[self._pattern_index[pattern]].append(value)
+            return
+
+        self._pattern_index[pattern] = len(self._patterns)
+        self._recent_pattern_indexes.append(len(self._patterns))
+        self._patterns.append(pattern)
+        self._values.append([value])
+        self._recent = None
+
+    def _build(self, text_length: int):
+        """Build the automatons needed to scan a text of text_length characters."""
+
+        if not self._recent_pattern_indexes:
+            return
+
+        self._recent_scanned += text_length
+        if self._recent_scanned >= self._main_size:
+            pattern_indexes = self._main.pattern_indexes + self._recent_pattern_indexes
+            self._main = _Automaton(self._patterns, self._values, pattern_indexes)
+            self._main_size += sum(len(self._patterns[pattern_index]) for pattern_index in self._recent_pattern_indexes)
+            self._recent_pattern_indexes = []
+            self._recent = None
+            self._recent_scanned = 0
+        elif self._recent is None:
+            self._recent = _Automaton(self._patterns, self._values, self._recent_pattern_indexes)
+
+    def iter_matches(self, text: str, whole_words: bool = False) -> Iterator[tuple[int, int, list[Any]]]:
+        """Scan the text once per automaton and yield every pattern occurrence, overlapping ones included.
+
+        Parameters
+        ----------
+        text : str
+            The text to scan.
+        whole_words : bool
+            If True, only yield occurrences that are not directly preceded or followed by a word character.
+
+        Yields
+        ------
+        tuple[int, int, list]
+            Start offset, end offset (exclusive) and values of the matched pattern, by increasing end offset.
+        """
+
+        self._build(len(text))
+
+        if self._recent is None:
+            yield from self._main.iter_matches(text, whole_words)
+        else:
+            yield from heapq.merge(self._main.iter_matches(text, whole_words), self._recent.iter_matches(text, whole_words), key=itemgetter(1))
@@ -1,15 +1,25 @@
+import argparse
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 import json
 import os
 import re
+import time
 import urllib
 import ebooklib
 from ebooklib import epub
 import bs4
 from bs4 import BeautifulSoup
+from bs4.dammit import EncodingDetector
+from lxml import etree
 import base64
+from functools import partial
+from operator import methodcaller
 
 
 from core.config import parsing as parsing_config
+from core.hashing import hash_stream
 
 
 def extract_book_metadata(book: ebooklib.epub.EpubBook) -> dict[str, str | list[str]]:
@@ -108,6 +118,21 @@ def extract_structured_toc(book: ebooklib.epub.EpubBook) -> list[dict[str, str |
         if child.name == 'navPoint':
             table_of_content.append(process_navpoint_recursive(child))
 
+    # every document is parsed once, and split at the anchors referenced by the TOC
+    anchors = {}
+
+    def collect_anchors_recursive(node: dict):
+        anchors.setdefault(node['content_path'], set())
+        if node['content_id']:
+            anchors[node['content_path']].add(node['content_id'])
+        for child in node['children']:
+            collect_anchors_recursive(child)
+
+    for part in table_of_content:
+        collect_anchors_recursive(part)
+
+    parsed_items = ParsedItemCache(book, anchors)
+
     # breadth-first validation and potential merging, also fetches content
     def check_for_duplicate_recursive(node: dict):
         returned_node = {
@@ -116,56 +141,49 @@ def extract_structured_toc(book: ebooklib.epub.EpubBook) -> list[dict[str, str |
             'label': node['label'],
             'content_path': node['content_path'],
             'content_id': node['content_id'],
-            'content': parse_item(book, node['content_path'], node['label']),
+            'content': parsed_items.get_content(node['content_path'], node['content_id'].split('|')[0], node['label'].split('|')[0]),
             'children': node['children']
         }
-        if node['children'] == []:
-            return returned_node
-        else:
-            # Merge children that share the same content_path
-            merged_children = []
-            content_paths = set()
-            for child in node['children']:
-                content_path = child['content_path']
-                if content_path not in content_paths:
-                    # new unseen content_path
-                    content_paths.add(content_path)
-                    merged_child = {
-                        'id': child['id'],
-                        'playorder': child['playorder'],
-                        'label': child['label'],
-                        'content_path': content_path,
-                        'content_id': child['content_id'],
-                        'content': parse_item(book, child['content_path'], child['label']),
-                        'children': child['children']
-                    }
-                    for other_child in node['children']:
-                        if other_child['content_path'] == content_path and other_child['id'] != child['id']:
-                            merged_child['id'] += '|' + other_child['id']
-                            merged_child['playorder'] += '|' + \
-                                other_child['playorder']
-                            merged_child['label'] += '|' + other_child['label']
-                            merged_child['content_id'] += '|' + \
-                                other_child['content_id']
-                            merged_child['children'].extend(
-                                other_child['children'])
-
-                    if '|' in merged_child['id'] and merged_child['children']:
-                        # a merge can't have children
-                        raise RuntimeError(
-                            f"Merged child {merged_child['id']} has children"
-                        )
-
-                    merged_children.append(merged_child)
-
-            if len(merged_children) != len(node['children']):
-                returned_node['children'] = merged_children
-                return returned_node
-            else:
-                # recursively merge children
-                returned_node['children'] = [check_for_duplicate_recursive(
-                    child) for child in returned_node['children']]
-                return returned_node
+
+        # Merge children that point to the same fragment of the same content_path
+        merged_children = []
+        fragments = set()
+        for child in node['children']:
+            fragment = (child['content_path'], child['content_id'])
+            if fragment not in fragments:
+                # new unseen fragment
+                fragments.add(fragment)
+                merged_child = {
+                    'id': child['id'],
+                    'playorder': child['playorder'],
+                    'label': child['label'],
+                    'content_path': child['content_path'],
+                    'content_id': child['content_id'],
+                    'children': child['children']
+                }
+                for other_child in node['children']:
+                    if (other_child['content_path'], other_child['content_id']) == fragment and other_child['id'] != child['id']:
+                        merged_child['id'] += '|' + other_child['id']
+                        merged_child['playorder'] += '|' + \
+                            other_child['playorder']
+                        merged_child['label'] += '|' + other_child['label']
+                        merged_child['content_id'] += '|' + \
+                            other_child['content_id']
+                        merged_child['children'].extend(
+                            other_child['children'])
+
+                if '|' in merged_child['id'] and merged_child['children']:
+                    # a merge can't have children
+                    raise RuntimeError(
+                        f"Merged child {merged_child['id']} has children"
+                    )
+
+                merged_children.append(merged_child)
+
+        # recursively fetch the content of the children
+        returned_node['children'] = [check_for_duplicate_recursive(
+            child) for child in merged_children]
+        return returned_node
 
     for i, part in enumerate(table_of_content):
         table_of_content[i] = check_for_duplicate_recursive(part)
@@ -173,31 +191,81 @@ def extract_structured_toc(book: ebooklib.epub.EpubBook) -> list[dict[str, str |
     return table_of_content
 
 
-def parse_item(book: ebooklib.epub.EpubBook, item_href: str, label: str) -> str:
-    """Parse content of a specific item within an EPUB book.
+class ParsedItemCache:
+    """Parse each item of an EPUB book at most once and split its text into fragments.
+
+    A fragment starts at one of the anchors referenced by the TOC and stops at the next one,
+    the fragment with an empty anchor starts at the beginning of the document.
 
     Parameters
     ----------
     book : ebooklib.epub.EpubBook
         The EPUB book object.
-    item_href : str
-        Href of the item to parse.
-    label : str
-        Label of the text part
-
-    Returns
-    -------
-    str
-        Parsed content of the item.
+    anchors : dict[str, set[str]]
+        The anchors referenced for each content path.
     """
 
+    ANCHOR_MARKER = '\x00{}\x00'
+    ANCHOR_MARKER_PATTERN = re.compile(r'\x00(\d+)\x00')
+
+    def __init__(self, book: ebooklib.epub.EpubBook, anchors: dict[str, set[str]]):
+        self.book = book
+        self.anchors = anchors
+        self.fragments: dict[str, dict[str, str]] = {}
+
+    def get_fragments(self, item_href: str) -> dict[str, str]:
+        """Return the raw text of each fragment of an item, keyed by anchor."""
+
+        if item_href in self.fragments:
+            return self.fragments[item_href]
+
+        anchors = sorted(self.anchors.get(item_href, ()))
+        if parsing_config['engine'] == 'lxml':
+            # the markers are inserted while parsing
+            text, marked_anchors = merge_item_text_fast(get_item_body_content(self.book, item_href), anchors, self.ANCHOR_MARKER)
+        else:
+            item_soup = get_item_soup(self.book, item_href)
+
+            # mark the start of each referenced anchor in the document
+            marked_anchors = []
+            for anchor in anchors:
+                element = item_soup.body.find(id=anchor)
+                if element is not None:
+                    element.insert_before(bs4.element.NavigableString(self.ANCHOR_MARKER.format(len(marked_anchors))))
+                    marked_anchors.append(anchor)
+
+            text = merge_item_text(item_soup)
+        parts = self.ANCHOR_MARKER_PATTERN.split(text)
+
+        # anchors missing from the document fall back to the whole text
+        whole_text = self.ANCHOR_MARKER_PATTERN.sub('', text)
+        fragments = {anchor: whole_text for anchor in self.anchors.get(item_href, ())}
+        fragments[''] = parts[0]
+        for i in range(1, len(parts), 2):
+            fragments[marked_anchors[int(parts[i])]] = parts[i + 1]
+
+        self.fragments[item_href] = fragments
+        return fragments
+
+    def get_content(self, item_href: str, anchor: str, label: str) -> str:
+        """Return the parsed content of the fragment of an item that starts at anchor."""
+
+        return clean_item_text(self.get_fragments(item_href)[anchor], label)
+
+
+def get_item_body_content(book: ebooklib.epub.EpubBook, item_href: str) -> bytes:
     item = book.get_item_with_href(item_href)
     if item is None:
         raise ValueError(f"No item found for : {item_href}")
 
-    item_body_content = item.get_body_content()
-    item_soup = BeautifulSoup(item_body_content, "lxml")
+    return item.get_body_content()
+
 
+def get_item_soup(book: ebooklib.epub.EpubBook, item_href: str) -> BeautifulSoup:
+    return BeautifulSoup(get_item_body_content(book, item_href), "lxml")
+
+
+def merge_item_text(item_soup: BeautifulSoup) -> str:
     def merge_tag_recursive(elem: bs4.element.Tag | bs4.element.NavigableString):
         if isinstance(elem, bs4.element.NavigableString):
             return elem.get_text(strip=True)
@@ -211,18 +279,223 @@ def parse_item(book: ebooklib.epub.EpubBook, item_href: str, label: str) -> str:
         else:
             raise TypeError('Element is not of type Tag or NavigableString')
 
-    parsed_content = '\n'.join([merge_tag_recursive(child)
-                               for child in item_soup.body.children])
+    return '\n'.join([merge_tag_recursive(child)
+                      for child in item_soup.body.children])
+
+
+class MergeTextTarget:
+    """lxml parser target computing the same text as merge_item_text, in a single pass over the parsing events.
+
+    BeautifulSoup builds its tree from the very same events, so the strings and tags seen here are the ones
+    merge_item_text would walk : consecutive data events form one string, comments are strings that merge to
+    an empty line, and the strings inside script, style, template, rt and rp tags are ignored by get_text.
+
+    Parameters
+    ----------
+    anchors : list[str]
+        Ids of the elements before which a marker string is inserted, like ParsedItemCache does.
+    marker : str
+        Format of the markers, receives the index of the anchor in marked_anchors.
+    """
+
+    # tags whose strings are not of type NavigableString in BeautifulSoup
+    STRING_CONTAINER_TAGS = {'rt', 'rp', 'style', 'script', 'template'}
+
+    def __init__(self, anchors: list[str] = (), marker: str = ''):
+        self.anchors = set(anchors)
+        self.marker = marker
+        self.marked_anchors = []
+        self.pending_data = []
+        self.depth = 0
+        self.containers_depth = 0
+        self.body_depth = None
+        self.body_done = False
+        # merged children of each open element of the body, paragraphs excluded
+        self.children_stack = []
+        # depth and stripped strings of the outermost open paragraph
+        self.paragraph_depth = None
+        self.paragraph_strings = []
+        self.text = None
+
+    def add_string(self, string: str, is_content: bool):
+        if self.body_depth is None:
+            return
+        if self.paragraph_depth is not None:
+            if is_content:
+                string = string.strip()
+                if string:
+                    self.paragraph_strings.append(string)
+        else:
+            self.children_stack[-1].append(string.strip() if is_content else '')
+
+    def flush_data(self):
+        if self.pending_data:
+            self.add_string(''.join(self.pending_data), self.containers_depth == 0)
+            self.pending_data = []
+
+    def start(self, tag, attrib):
+        self.flush_data()
+        self.depth += 1
+        if tag in self.STRING_CONTAINER_TAGS:
+            self.containers_depth += 1
+
+        if self.body_depth is None:
+            if tag == 'body' and not self.body_done:
+                self.body_depth = self.depth
+                self.children_stack.append([])
+            return
+
+        anchor = attrib.get('id')
+        if anchor in self.anchors:
+            self.anchors.remove(anchor)
+            self.add_string(self.marker.format(len(self.marked_anchors)), True)
+            self.marked_anchors.append(anchor)
+
+        if self.paragraph_depth is None:
+            if tag == 'p':
+                self.paragraph_depth = self.depth
+                self.paragraph_strings = []
+            else:
+                self.children_stack.append([])
+
+    def end(self, tag):
+        self.flush_data()
+
+        if self.body_depth is not None:
+            if self.depth == self.body_depth:
+                self.text = '\n'.join(self.children_stack.pop())
+                self.body_depth = None
+                self.body_done = True
+            elif self.paragraph_depth is None:
+                merged = '\n'.join(self.children_stack.pop())
+                self.children_stack[-1].append(merged)
+            elif self.depth == self.paragraph_depth:
+                merged = ' '.join(self.paragraph_strings)
+                self.children_stack[-1].append(merged.replace('\n', ' ').replace('  ', ' '))
+                self.paragraph_depth = None
+
+        if tag in self.STRING_CONTAINER_TAGS:
+            self.containers_depth -= 1
+        self.depth -= 1
+
+    def data(self, data):
+        self.pending_data.append(data)
+
+    def comment(self, text):
+        self.flush_data()
+        self.add_string(text, False)
+
+    def pi(self, target, data):
+        self.flush_data()
+        self.add_string(target + ' ' + data, False)
+
+    def doctype(self, *args):
+        self.flush_data()
+        self.add_string('', False)
+
+    def close(self):
+        self.flush_data()
+        if self.text is None:
+            raise ValueError('The item has no body')
+        return self.text
+
+
+def merge_item_text_fast(item_body_content: bytes, anchors: list[str] = (), marker: str = '') -> tuple[str, list[str]]:
+    """Compute the text of merge_item_text directly from lxml parsing events, without building any tree.
+
+    Parameters
+    ----------
+    item_body_content : bytes
+        The body content of the item.
+    anchors : list[str]
+        Ids of the elements before which a marker is inserted.
+    marker : str
+        Format of the markers, receives the index of the anchor in the returned list.
+
+    Returns
+    -------
+    tuple[str, list[str]]
+        The merged text and the anchors that were found, in the order of their marker index.
+    """
+
+    # same encoding and parser options as the lxml builder of BeautifulSoup
+    detector = EncodingDetector(item_body_content, is_html=True)
+    encoding = next(iter(detector.encodings), None)
+
+    target = MergeTextTarget(anchors, marker)
+    parser = etree.HTMLParser(target=target, recover=True, huge_tree=False, encoding=encoding)
+    parser.feed(detector.markup)
+    text = parser.close()
+    return text, target.marked_anchors
+
+
+REGEX_SPECIAL_CHARACTERS = set('.^$*+?{}[]\\|()')
 
+
+def compile_replacements(replacements: list[list[str]]) -> list:
+    """Build the normalization pipeline of a list of [pattern, replacement] pairs, applied in order like re.sub.
+
+    Patterns are compiled once, and literal patterns use str.replace which is several times faster than re.sub.
+
+    Parameters
+    ----------
+    replacements : list[list[str]]
+        The [pattern, replacement] pairs, like parsing_config['replace'].
+
+    Returns
+    -------
+    list
+        The steps of the pipeline, callables from str to str.
+    """
+
+    steps = []
+    for pattern, replacement in replacements:
+        if not REGEX_SPECIAL_CHARACTERS.intersection(pattern) and '\\' not in replacement:
+            steps.append(methodcaller('replace', pattern, replacement))
+        else:
+            steps.append(partial(re.compile(pattern).sub, replacement))
+    return steps
+
+
+replacement_steps = compile_replacements(parsing_config['replace'])
+
+
+def clean_item_text(parsed_content: str, label: str) -> str:
     if parsing_config['remove_title']:
         parsed_content = remove_title(parsed_content.strip(), label)
 
-    for replacement in parsing_config['replace']:
-        parsed_content = re.sub(replacement[0], replacement[1], parsed_content)
+    for step in replacement_steps:
+        parsed_content = step(parsed_content)
 
     return parsed_content
 
 
+def parse_item(book: ebooklib.epub.EpubBook, item_href: str, label: str) -> str:
+    """Parse content of a specific item within an EPUB book.
+
+    Parameters
+    ----------
+    book : ebooklib.epub.EpubBook
+        The EPUB book object.
+    item_href : str
+        Href of the item to parse.
+    label : str
+        Label of the text part
+
+    Returns
+    -------
+    str
+        Parsed content of the item.
+    """
+
+    if parsing_config['engine'] == 'lxml':
+        text, _ = merge_item_text_fast(get_item_body_content(book, item_href))
+    else:
+        text = merge_item_text(get_item_soup(book, item_href))
+
+    return clean_item_text(text, label)
+
+
 def remove_title(text_part: str, title: str) -> str:
     """Remove, if possible, the text contained in the 'title' parameter from the beginning of the text
 
@@ -241,46 +514,243 @@ def remove_title(text_part: str, title: str) -> str:
     text_part = text_part.strip()
     title = title.strip()
 
-    while len(title) > 0 and len(text_part) > 0:
-        if text_part[0].lower() == title[0].lower():
-            text_part = text_part[1:].strip()
-            title = title[1:].strip()
-        else:
+    # compare the characters one by one, skipping the whitespaces, and slice the text once at the end
+    i, j = 0, 0
+    while i < len(title) and j < len(text_part):
+        if text_part[j].lower() != title[i].lower():
             break
+        i += 1
+        j += 1
+        while i < len(title) and title[i].isspace():
+            i += 1
+        while j < len(text_part) and text_part[j].isspace():
+            j += 1
+
+    return text_part[j:]
+
+
+OUTPUT_FORMATS = {'json': '.json', 'jsonl': '.jsonl', 'msgpack': '.msgpack'}
 
-    return text_part
 
+def get_extracted_book_data(book: ebooklib.epub.EpubBook) -> dict:
+    return {
+        'metadata': extract_book_metadata(book),
+        'data': extract_structured_toc(book)
+    }
 
-def write_extracted_book_data(book: ebooklib.epub.EpubBook, path: str) -> None:
-    """Write extracted metadata and structured TOC of an EPUB book to a JSON file.
+
+def write_extracted_book_data(book: ebooklib.epub.EpubBook, path: str, output_format: str = 'json') -> None:
+    """Write extracted metadata and structured TOC of an EPUB book to a file.
 
     Parameters
     ----------
     book : ebooklib.epub.EpubBook
         The EPUB book object.
     path : str
-        The path to write the JSON file.
+        The path of the file to write.
+    output_format : str
+        'json' (indented), 'jsonl' (a single compact line) or 'msgpack' (requires the msgpack package).
 
     Returns
     -------
     None
     """
 
-    extracted_book = {
-        'metadata': extract_book_metadata(book),
-        'data': extract_structured_toc(book)
-    }
+    extracted_book = get_extracted_book_data(book)
+
+    # write to a temporary file first so that an output is either complete or missing
+    temp_path = path + '.tmp'
+    try:
+        if output_format == 'msgpack':
+            import msgpack
+            with open(temp_path, 'wb') as f:
+                msgpack.pack(extracted_book, f)
+        elif output_format == 'jsonl':
+            with open(temp_path, 'w') as f:
+                f.write(json.dumps(extracted_book, ensure_ascii=False, separators=(',', ':')) + '\n')
+        else:
+            with open(temp_path, 'w') as f:
+                json.dump(extracted_book, f, ensure_ascii=False, indent=4)
+        os.replace(temp_path, path)
+    finally:
+        # left by a failed write, the output is replaced by the next extraction
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def hash_file(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hash_stream(f)
+
+
+def extract_book_file(file_path: str, output_path: str, output_format: str) -> dict:
+    """Extract a single EPUB file, run in the worker processes of extract_book_directory.
+
+    Errors are returned instead of raised so that a broken file doesn't stop the batch.
+    """
+
+    start = time.perf_counter()
+    try:
+        book = epub.read_epub(file_path)
+        write_extracted_book_data(book, output_path, output_format)
+        error = None
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+    return {'error': error, 'duration': time.perf_counter() - start}
+
+
+def extract_book_file_isolated(file_path: str, output_path: str, output_format: str) -> dict:
+    """Extract a single EPUB file in a dedicated worker process, a crash of the process only fails this file."""
+
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        try:
+            return executor.submit(extract_book_file, file_path, output_path, output_format).result()
+        except BrokenProcessPool as e:
+            # the temporary output of a process killed while writing is left behind
+            if os.path.exists(output_path + '.tmp'):
+                os.remove(output_path + '.tmp')
+            return {'error': f'The worker process died : {e}', 'duration': None}
+
+
+def read_extraction_manifest(manifest_path: str) -> dict[str, str]:
+    """Return the content hash of the last successful extraction of each file of a manifest."""
+
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # last line of an interrupted run
+                    continue
+                manifest[entry['file_name']] = entry['data_hash']
+    return manifest
+
+
+def extract_book_directory(input_dir: str, output_dir: str, workers: int | None = None, output_format: str = 'json',
+                           force: bool = False, progress_every: int = 10) -> dict[str, int]:
+    """Extract every EPUB file of a directory with a pool of worker processes.
+
+    Files whose content hash matches the one of their last successful extraction are skipped, the hashes are
+    kept in a manifest.jsonl file appended to as the extractions complete, so an interrupted run can be resumed.
+    When a worker process dies (e.g. out of memory or a crash of lxml) the pool is rebuilt, the files that were in
+    flight are extracted again one at a time so that only the file that killed the worker fails.
 
-    with open(path, 'w') as f:
-        json.dump(extracted_book, f, ensure_ascii=False, indent=4)
+    Parameters
+    ----------
+    input_dir : str
+        The directory containing the EPUB files.
+    output_dir : str
+        The directory to write the extracted files to, one file per book.
+    workers : int | None
+        Number of worker processes, defaults to the number of CPUs.
+    output_format : str
+        'json', 'jsonl' or 'msgpack', see write_extracted_book_data.
+    force : bool
+        Extract all files, even the ones that were already extracted.
+    progress_every : int
+        Print the progress every progress_every processed files.
+
+    Returns
+    -------
+    dict[str, int]
+        Number of extracted, skipped and failed files.
+    """
+
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format : {output_format}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest_path = os.path.join(output_dir, 'manifest.jsonl')
+    manifest = {} if force else read_extraction_manifest(manifest_path)
+
+    stats = {'extracted': 0, 'skipped': 0, 'failed': 0}
+    jobs = {}
+    for file_name in sorted(os.listdir(input_dir)):
+        if not file_name.endswith('.epub'):
+            continue
+        file_path = os.path.join(input_dir, file_name)
+        output_path = os.path.join(output_dir, file_name.removesuffix('.epub') + OUTPUT_FORMATS[output_format])
+        data_hash = hash_file(file_path)
+        if manifest.get(file_name) == data_hash and os.path.exists(output_path):
+            stats['skipped'] += 1
+            continue
+        jobs[file_name] = (file_path, output_path, data_hash, os.path.getsize(file_path))
+
+    print(f'[Book extraction] {len(jobs)} files to extract, {stats["skipped"]} already extracted')
+
+    start = time.perf_counter()
+    processed_bytes = 0
+    processed = 0
+    workers = workers or os.cpu_count() or 1
+    pending = deque(jobs)
+
+    def record_result(manifest_file, file_name: str, result: dict):
+        nonlocal processed_bytes, processed
+        _, _, data_hash, file_size = jobs[file_name]
+        if result['error'] is None:
+            stats['extracted'] += 1
+            manifest_file.write(json.dumps({'file_name': file_name, 'data_hash': data_hash}) + '\n')
+            manifest_file.flush()
+        else:
+            stats['failed'] += 1
+            print(f'[Book extraction] Failed to extract {file_name} : {result["error"]}')
+
+        processed += 1
+        processed_bytes += file_size
+        if processed % progress_every == 0 or processed == len(jobs):
+            elapsed = time.perf_counter() - start
+            print(f'[Book extraction] {processed}/{len(jobs)} files, {processed / elapsed:.1f} files/s, '
+                  f'{processed_bytes / elapsed / 1024 / 1024:.1f} MB/s, {stats["failed"]} failed')
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        with open(manifest_path, 'a') as manifest_file:
+            # a bounded number of files are in flight, they are the suspects when a worker dies
+            futures = {}
+            while pending or futures:
+                while pending and len(futures) < 2 * workers:
+                    file_name = pending.popleft()
+                    file_path, output_path, _, _ = jobs[file_name]
+                    futures[executor.submit(extract_book_file, file_path, output_path, output_format)] = file_name
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        broken = True
+                        continue
+                    except Exception as e:
+                        result = {'error': f'{type(e).__name__}: {e}', 'duration': None}
+                    record_result(manifest_file, futures.pop(future), result)
+
+                if broken:
+                    # every future of a broken pool fails, the files in flight are extracted again one at a time
+                    suspects = list(futures.values())
+                    futures = {}
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    print(f'[Book extraction] A worker process died, extracting {len(suspects)} files one at a time')
+                    for file_name in suspects:
+                        file_path, output_path, _, _ = jobs[file_name]
+                        record_result(manifest_file, file_name, extract_book_file_isolated(file_path, output_path, output_format))
+                    executor = ProcessPoolExecutor(max_workers=workers)
+    finally:
+        executor.shutdown()
+
+    return stats
 
 
 if __name__ == '__main__':
-    if not os.path.exists('data/extracted_books'):
-        os.makedirs('data/extracted_books')
-    for file_name in os.listdir('data/epubs'):
-        print(f'Extracting {file_name}')
-        book = epub.read_epub(f'data/epubs/{file_name}')
-        write_extracted_book_data(
-            book, f'data/extracted_books/{file_name.replace('.epub', '.json')}'
-        )
+    parser = argparse.ArgumentParser(description='Extract the metadata and structured TOC of a directory of EPUB files')
+    parser.add_argument('--input-dir', default='data/epubs', help='Directory containing the EPUB files')
+    parser.add_argument('--output-dir', default='data/extracted_books', help='Directory to write the extracted books to')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes, defaults to the number of CPUs')
+    parser.add_argument('--format', choices=list(OUTPUT_FORMATS), default='json', help='Output format')
+    parser.add_argument('--force', action='store_true', help='Extract the files that were already extracted')
+    args = parser.parse_args()
+
+    stats = extract_book_directory(args.input_dir, args.output_dir, args.workers, args.format, args.force)
+    print(f'[Book extraction] {stats["extracted"]} extracted, {stats["skipped"]} skipped, {stats["failed"]} failed')
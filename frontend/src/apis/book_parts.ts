@@ -1,7 +1,7 @@
 import axios from 'axios';
 import useAuthHeader from 'react-auth-kit/hooks/useAuthHeader';
 import globalConfig from "../config.json";
-import { BookPartResponseSchema, BookPartUpdateSchema } from '../types/book_parts';
+import { BookPartContentResponseSchema, BookPartResponseSchema, BookPartTocEntrySchema, BookPartUpdateSchema } from '../types/book_parts';
 
 
 export const useGetBookPart = () => {
@@ -38,6 +38,41 @@ export const useGetBookParts = () => {
     return { getBookParts };
 };
 
+export const useGetBookToc = () => {
+    const authHeader = useAuthHeader();
+
+    const getBookToc = async (bookId: string): Promise<BookPartTocEntrySchema[]> => {
+        const config = {
+            headers: {
+                'Authorization': authHeader,
+            },
+        };
+
+        const response = await axios.get<BookPartTocEntrySchema[]>(globalConfig.API_URL + `/book_parts/toc/${bookId}`, config);
+        return response.data;
+    };
+
+    return { getBookToc };
+};
+
+export const useGetBookPartContent = () => {
+    const authHeader = useAuthHeader();
+
+    const getBookPartContent = async (bookPartId: string, offset: number = 0, limit?: number): Promise<BookPartContentResponseSchema> => {
+        const config = {
+            headers: {
+                'Authorization': authHeader,
+            },
+            params: { offset, limit },
+        };
+
+        const response = await axios.get<BookPartContentResponseSchema>(globalConfig.API_URL + `/book_parts/content/${bookPartId}`, config);
+        return response.data;
+    };
+
+    return { getBookPartContent };
+};
+
 
 export const useUpdateBookPart = () => {
     const authHeader = useAuthHeader();
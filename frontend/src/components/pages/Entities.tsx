@@ -4,7 +4,7 @@ import { RiCopperCoinFill } from "react-icons/ri";
 import Nav from '../navigation/Nav';
 import MobileNav from '../navigation/MobileNav';
 import { useGetUserBooks } from '../../apis/books';
-import { useGetBookParts, useUpdateBookPart } from '../../apis/book_parts';
+import { useGetBookToc, useUpdateBookPart } from '../../apis/book_parts';
 import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query';
 import BookSelector from '../state/BookSelector';
 import { useGetEntityExtractionProcess, useTriggerExtraction } from '../../apis/book_processes';
@@ -20,7 +20,7 @@ const Entities = () => {
   const { isOpen, onOpen, onClose } = useDisclosure();
 
   const { getUserBooks } = useGetUserBooks();
-  const { getBookParts } = useGetBookParts();
+  const { getBookToc } = useGetBookToc();
   const { getBookEntities } = useGetBookEntities();
   const { triggerExtraction } = useTriggerExtraction();
   const { getEntityExtractionProcess } = useGetEntityExtractionProcess();
@@ -53,10 +53,7 @@ const Entities = () => {
 
   const { data: bookParts, isLoading: isLoadingBookParts } = useQuery({
     queryKey: ['bookParts', selectedBookId],
-    queryFn: () => selectedBookId ? getBookParts(selectedBookId).then(parts => parts.map(part => ({
-      ...part,
-      content: part.content.split(' ').slice(0, 100).join(' ')
-    }))) : null,
+    queryFn: () => selectedBookId ? getBookToc(selectedBookId) : null,
     enabled: !!selectedBookId,
   });
 
@@ -1,9 +1,9 @@
 import { useState } from 'react';
 import { Box, Text, Tag, Flex } from '@chakra-ui/react';
-import { BookPartResponseSchema } from '../../types/book_parts';
+import { BookPartTocEntrySchema } from '../../types/book_parts';
 
 type TableOfContentProps = {
-    bookParts: BookPartResponseSchema[];
+    bookParts: BookPartTocEntrySchema[];
     onTocEntryClick: (bookPartId: string, isStoryPart: boolean) => void;
 };
 
@@ -31,8 +31,9 @@ const TableOfContent = ({ bookParts, onTocEntryClick }: TableOfContentProps) =>
                             }}
                         >
                             <Text fontSize={"sm"} bg="gray.100" px={2} borderRadius={6} border={"solid #bbb 1px"}>{bookPart.label}</Text>
+                            {/* the preview comes with the table of contents */}
                             <Text fontSize={"xs"} flex="1" mx={2} whiteSpace="nowrap" overflow="hidden" textOverflow="ellipsis">
-                                {bookPart.content}
+                                {bookPart.preview}
                             </Text>
                             <Tag
                                 size={"sm"}
@@ -14,6 +14,21 @@ export interface BookPartResponseSchema extends LightBookPartResponseSchema {
     content: string;
 }
 
+export interface BookPartTocEntrySchema extends LightBookPartResponseSchema {
+    sub_parts_count: number;
+    length: number;
+    preview: string;
+}
+
+export interface BookPartContentResponseSchema {
+    id: string;
+    book_id: string;
+    offset: number;
+    content: string;
+    length: number;
+    next_offset: number | null;
+}
+
 export interface BookPartUpdateSchema {
     is_story_part: boolean;
 }
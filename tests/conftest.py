@@ -0,0 +1,112 @@
+import uuid
+import zipfile
+from collections import Counter
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+
+CONTAINER = '''<?xml version="1.0" encoding="utf-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles><rootfile full-path="EPUB/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>'''
+
+
+def write_epub(path, chapters: list[tuple[str, str]], title: str = 'Title', author: str = 'Author'):
+    """Write an EPUB file with one document per (label, body html) chapter and a flat NCX table of contents."""
+    manifest = ''.join(f'<item href="chapter_{i}.xhtml" id="chapter_{i}" media-type="application/xhtml+xml"/>' for i in range(len(chapters)))
+    spine = ''.join(f'<itemref idref="chapter_{i}"/>' for i in range(len(chapters)))
+    opf = f'''<?xml version="1.0" encoding="utf-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" unique-identifier="id" version="2.0">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:identifier id="id">{title}</dc:identifier><dc:title>{title}</dc:title><dc:language>en</dc:language><dc:creator>{author}</dc:creator>
+  </metadata>
+  <manifest>{manifest}<item href="toc.ncx" id="ncx" media-type="application/x-dtbncx+xml"/></manifest>
+  <spine toc="ncx">{spine}</spine>
+</package>'''
+    nav_points = ''.join(
+        f'<navPoint id="navpoint_{i}" playOrder="{i + 1}"><navLabel><text>{label}</text></navLabel><content src="chapter_{i}.xhtml"/></navPoint>'
+        for i, (label, _) in enumerate(chapters)
+    )
+    ncx = f'''<?xml version="1.0" encoding="utf-8"?>
+<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">
+  <head><meta content="{title}" name="dtb:uid"/></head>
+  <docTitle><text>{title}</text></docTitle>
+  <navMap>{nav_points}</navMap>
+</ncx>'''
+
+    with zipfile.ZipFile(path, 'w') as f:
+        f.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        f.writestr('META-INF/container.xml', CONTAINER)
+        f.writestr('EPUB/content.opf', opf)
+        f.writestr('EPUB/toc.ncx', ncx)
+        for i, (label, body) in enumerate(chapters):
+            f.writestr(f'EPUB/chapter_{i}.xhtml', f'<?xml version="1.0" encoding="utf-8"?>\n<html xmlns="http://www.w3.org/1999/xhtml"><head><title>{label}</title></head><body>{body}</body></html>')
+
+
+@pytest.fixture
+def db():
+    """Session of the database configured in the environment, the tests using it are skipped when it is not reachable."""
+    try:
+        from backend.database import SessionLocal
+    except ValueError:
+        # the connection url is built from unset variables
+        pytest.skip('The database is not configured')
+
+    session = SessionLocal()
+    try:
+        session.execute(text('SELECT 1'))
+    except OperationalError:
+        session.close()
+        pytest.skip('The database is not available')
+    yield session
+    session.rollback()
+    session.close()
+
+
+@pytest.fixture
+def book(db):
+    """Book of a new user, deleted with its content and its user after the test."""
+    from backend.models.book_parts import BookPart
+    from backend.models.books import Book, FileType
+    from backend.models.checkpoints import ExtractionCheckpoint
+    from backend.models.entity_snapshots import EntityMention, EntitySnapshot
+    from backend.models.kb_entries import KnowledgeBaseEntry
+    from backend.models.users import User
+
+    user = User(name='test_' + uuid.uuid4().hex, email=uuid.uuid4().hex + '@example.com', password='x')
+    db.add(user)
+    db.flush()
+    book = Book(user_id=user.id, file_type=FileType.epub, original_file_name='book.epub', file_size=1, author='Author', title='Title',
+                data_hash=uuid.uuid4().hex, is_parsed=True)
+    db.add(book)
+    db.commit()
+    yield book
+
+    db.rollback()
+    db.query(EntityMention).filter(EntityMention.book_id == book.id).delete()
+    db.query(EntitySnapshot).filter(EntitySnapshot.book_id == book.id).delete()
+    db.query(KnowledgeBaseEntry).filter(KnowledgeBaseEntry.book_id == book.id).delete()
+    db.query(ExtractionCheckpoint).filter(ExtractionCheckpoint.book_part_id.in_(db.query(BookPart.id).filter(BookPart.book_id == book.id))).delete(synchronize_session=False)
+    db.query(BookPart).filter(BookPart.book_id == book.id).delete()
+    db.query(Book).filter(Book.id == book.id).delete()
+    db.query(User).filter(User.id == user.id).delete()
+    db.commit()
+
+
+@contextmanager
+def count_queries():
+    """Count the statements sent by the synchronous engine, by their first keyword."""
+    from backend.database import engine
+
+    counts = Counter()
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        counts[statement.split(None, 1)[0].upper()] += 1
+
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        yield counts
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
@@ -0,0 +1,54 @@
+import json
+import os
+
+import core.parsing
+from core.parsing import extract_book_directory, extract_book_file
+from conftest import write_epub
+
+
+def crashing_extract_book_file(file_path: str, output_path: str, output_format: str) -> dict:
+    # kills the worker process like a segfault of lxml or the OOM killer would, after starting to write
+    if 'poison' in file_path:
+        open(output_path + '.tmp', 'w').close()
+        os._exit(1)
+    return extract_book_file(file_path, output_path, output_format)
+
+
+def write_books(input_dir, names: list[str]):
+    os.makedirs(input_dir)
+    for name in names:
+        write_epub(input_dir / f'{name}.epub', [('Chapter 1', f'<h1>Chapter 1</h1><p>The story of {name}.</p>')], title=name)
+
+
+def test_extract_book_directory(tmp_path):
+    write_books(tmp_path / 'in', ['a', 'b', 'c'])
+
+    assert extract_book_directory(str(tmp_path / 'in'), str(tmp_path / 'out'), workers=2) == {'extracted': 3, 'skipped': 0, 'failed': 0}
+    with open(tmp_path / 'out' / 'b.json') as f:
+        assert json.load(f)['metadata']['title'] == 'b'
+
+    # the extracted files are skipped by the next run
+    assert extract_book_directory(str(tmp_path / 'in'), str(tmp_path / 'out'), workers=2) == {'extracted': 0, 'skipped': 3, 'failed': 0}
+
+
+def test_dead_worker_only_fails_its_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(core.parsing, 'extract_book_file', crashing_extract_book_file)
+    names = [f'book_{i}' for i in range(12)]
+    write_books(tmp_path / 'in', names[:5] + ['poison'] + names[5:])
+
+    stats = extract_book_directory(str(tmp_path / 'in'), str(tmp_path / 'out'), workers=2)
+
+    assert stats == {'extracted': 12, 'skipped': 0, 'failed': 1}
+    assert sorted(os.listdir(tmp_path / 'out')) == sorted([f'{name}.json' for name in names] + ['manifest.jsonl'])
+
+
+def test_failed_write_leaves_no_temporary_file(tmp_path, monkeypatch):
+    write_books(tmp_path / 'in', ['a'])
+    os.makedirs(tmp_path / 'out')
+    # not serializable, the write fails once the temporary file is open
+    monkeypatch.setattr(core.parsing, 'get_extracted_book_data', lambda book: {'data': object()})
+
+    result = extract_book_file(str(tmp_path / 'in' / 'a.epub'), str(tmp_path / 'out' / 'a.json'), 'json')
+
+    assert result['error'].startswith('TypeError')
+    assert os.listdir(tmp_path / 'out') == []
@@ -0,0 +1,62 @@
+import asyncio
+
+import httpx
+import pytest
+from sqlalchemy import event
+
+try:
+    from backend.database import async_engine
+    from backend.main import app
+    from backend.models.book_parts import BookPart
+    from backend.models.entity_snapshots import EntitySnapshot
+    from backend.models.kb_entries import KnowledgeBaseEntry
+    from backend.models.users import User
+    from backend.routers.auth import create_access_token
+except ValueError:
+    # the connection url is built from unset variables
+    pytest.skip('The database is not configured', allow_module_level=True)
+
+
+def add_book_content(db, book) -> list[BookPart]:
+    book_parts = [BookPart(book_id=book.id, toc_id=str(i), label=f'Chapter {i}', content='Winston met Julia. ' * (i + 1), sibling_index=i, depth=0, reading_order=i)
+                  for i in range(3)]
+    db.add_all(book_parts)
+    db.flush()
+    db.add_all([KnowledgeBaseEntry(book_id=book.id, book_part_id=book_part.id, entity_name=name, category='PERSON', fact=f'{name} is in {book_part.label}')
+                for book_part in book_parts for name in ['Winston', 'Julia']])
+    db.commit()
+    return book_parts
+
+
+def test_heatmap_and_mentions_do_not_load_the_entities(db, book):
+    book_parts = add_book_content(db, book)
+    user_name = db.query(User.name).filter(User.id == book.user_id).scalar()
+    headers = {'Authorization': 'Bearer ' + create_access_token({'sub': user_name})}
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    async def run():
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+                # the first request of a book without snapshot creates it
+                first = await client.get(f'/api/entities/heatmap/{book.id}', params={'name': 'Winston'}, headers=headers)
+
+                event.listen(async_engine.sync_engine, 'before_cursor_execute', record)
+                try:
+                    heatmap = await client.get(f'/api/entities/heatmap/{book.id}', params={'name': 'Winston'}, headers=headers)
+                    mentions = await client.get(f'/api/entities/mentions/{book_parts[1].id}', params={'name': 'Julia'}, headers=headers)
+                finally:
+                    event.remove(async_engine.sync_engine, 'before_cursor_execute', record)
+                return first, heatmap, mentions
+        finally:
+            await async_engine.dispose()
+
+    first, heatmap, mentions = asyncio.run(run())
+
+    assert first.json() == heatmap.json()
+    assert [entry['occurrences'] for entry in heatmap.json()] == [1, 2, 3]
+    assert [(entry['name'], len(entry['starts'])) for entry in mentions.json()] == [('Julia', 2)]
+    assert db.query(EntitySnapshot).filter(EntitySnapshot.book_id == book.id).count() == 1
+    assert statements and not any('entity_snapshots.entities' in statement or 'INSERT' in statement for statement in statements)
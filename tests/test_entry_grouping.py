@@ -0,0 +1,34 @@
+import random
+
+import pytest
+
+pytest.importorskip('networkx')
+
+from benchmarks.entry_grouping import Entry, generate_entries, get_groups, group_knowledge_base_entries_pairwise
+from core.grouping import group_knowledge_base_entries
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_groups_match_pairwise_version(seed):
+    kb_entries = generate_entries(random.Random(seed).randint(1, 120), seed)
+
+    assert get_groups(group_knowledge_base_entries(kb_entries)) == get_groups(group_knowledge_base_entries_pairwise(kb_entries))
+
+
+def test_every_link_kind():
+    kb_entries = [
+        Entry('Winston', None, None, 'PERSON'),
+        Entry(' winston ', None, None, 'PERSON'),
+        Entry('Smith', 'WINSTON', None, 'PERSON'),
+        Entry('Big Brother', None, 'The Party', 'PERSON'),
+        Entry('the party', None, None, 'ORGANIZATION'),
+        Entry('Ingsoc', None, 'THE PARTY', 'ORGANIZATION'),
+        Entry('Julia', None, None, 'PERSON'),
+        Entry('The girl', None, None, 'PERSON'),
+        Entry('Dark-haired girl', 'the girl|Julia', None, 'PERSON'),
+    ]
+
+    merged = group_knowledge_base_entries(kb_entries)
+
+    assert get_groups(merged) == get_groups(group_knowledge_base_entries_pairwise(kb_entries))
+    assert [[kb_entries.index(entry) for entry in v['entries']] for v in merged.values()] == [[0, 1, 2], [3, 4, 5], [6, 7, 8]]
@@ -0,0 +1,108 @@
+import json
+import uuid
+
+import pytest
+
+from conftest import count_queries
+
+try:
+    from backend.models.book_parts import BookPart
+    from backend.models.kb_entries import KnowledgeBaseEntry
+    import backend.tasks.knowledge_base_building as kbb
+except ValueError:
+    # the connection url is built from unset variables
+    pytest.skip('The database is not configured', allow_module_level=True)
+
+
+@pytest.fixture(autouse=True)
+def chunk_size(monkeypatch):
+    monkeypatch.setenv('CHUNK_SIZE', '200')
+    monkeypatch.setenv('CHUNK_OVERLAP', '0')
+
+
+NAMES = ['Winston', 'Julia', "O'Brien", 'Parsons', 'Syme', 'Charrington']
+
+
+def add_book_parts(db, book, count: int) -> list[BookPart]:
+    book_parts = []
+    for i in range(count):
+        content = ' '.join(f'{NAMES[(i + j) % len(NAMES)]} walked through the ministry.' for j in range(20))
+        book_part = BookPart(book_id=book.id, toc_id=str(i), label=f' Chapter {i} ', content=content, sibling_index=i, depth=0, reading_order=i, is_story_part=True)
+        book_parts.append(book_part)
+    db.add_all(book_parts)
+    db.commit()
+    return book_parts
+
+
+def add_kb_entries(db, book, book_parts: list[BookPart]) -> list[KnowledgeBaseEntry]:
+    """Add a fact on every name in every part and return the entries loaded like build_knowledge_base does."""
+    kb_entries = [
+        KnowledgeBaseEntry(book_id=book.id, book_part_id=book_part.id, entity_name=name, alternative_names=name.lower() + 'y',
+                           category='PERSON', fact=f'{name} appears in {book_part.label.strip()}', sibling_index=0, sibling_total=1)
+        for book_part in book_parts for name in NAMES
+    ]
+    db.add_all(kb_entries)
+    db.commit()
+    return kbb.query_knowledge_base_entries(db, book.id)
+
+
+def test_prompt_context_needs_no_query(db, book):
+    book_parts = add_book_parts(db, book, 30)
+    kb_entries = add_kb_entries(db, book, book_parts)
+    book_part_labels = kbb.get_book_part_labels(db, book.id)
+
+    with count_queries() as counts:
+        kb_str = kbb.format_knowledge_base_entities(kbb.group_knowledge_base_entries(kb_entries), max_entries_per_name=5, book_part_labels=book_part_labels)
+
+    assert sum(counts.values()) == 0
+    assert 'Chapter 29' in kb_str and ' Chapter 29 ' not in kb_str
+
+
+def test_prompt_context_without_labels_uses_one_query(db, book):
+    book_parts = add_book_parts(db, book, 30)
+    kb_entries = add_kb_entries(db, book, book_parts)
+
+    with count_queries() as counts:
+        kb_str = kbb.format_knowledge_base_entities(kbb.group_knowledge_base_entries(kb_entries), max_entries_per_name=5)
+
+    # a single IN query, whatever the number of facts
+    assert counts == {'SELECT': 1}
+    assert kb_str == kbb.format_knowledge_base_entities(kbb.group_knowledge_base_entries(kb_entries), max_entries_per_name=5, book_part_labels=kbb.get_book_part_labels(db, book.id))
+
+
+class FakePrompt:
+    name = 'sub_part_entity_extraction'
+    version = 1
+
+    def __init__(self):
+        self.knowledge_bases = []
+
+    def compile(self, knowledge_base: str, text_part: str) -> str:
+        self.knowledge_bases.append(knowledge_base)
+        return text_part
+
+
+def test_sub_part_prompts_need_no_select(db, book, monkeypatch):
+    book_parts = add_book_parts(db, book, 10)
+    add_kb_entries(db, book, book_parts[:-1])
+    book_part = book_parts[-1]
+
+    prompt = FakePrompt()
+    monkeypatch.setattr(kbb.languse, 'get_prompt', lambda *args, **kwargs: prompt)
+    monkeypatch.setattr(kbb, 'chat_completion', lambda *args, **kwargs: json.dumps({'entities': [
+        {'entity_name': f'New {uuid.uuid4().hex[:6]}', 'alternative_names': [], 'category': 'PERSON', 'summary': 'A new entity'}
+    ]}))
+
+    # loaded once per run by build_knowledge_base
+    book_part_labels = kbb.get_book_part_labels(db, book.id)
+    kb_index = kbb.KnowledgeBaseIndex(kbb.query_knowledge_base_entries(db, book.id))
+    db.refresh(book_part)
+
+    with count_queries() as counts:
+        kbb.extract_entities_from_sub_parts(book_part, kb_index, book_part_labels)
+
+    sub_parts_count = len(kbb.get_book_part_chunks(book_part))
+    assert sub_parts_count > 1 and len(prompt.knowledge_bases) == sub_parts_count
+    # the prompts show the facts of the previous chapters, the only statements are the writes of each sub part
+    assert all('Chapter 8' in knowledge_base for knowledge_base in prompt.knowledge_bases)
+    assert counts['SELECT'] == 0
@@ -0,0 +1,68 @@
+import os
+import sqlite3
+from types import SimpleNamespace
+
+# the OpenAI client is created at import, no request is sent by these tests
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+
+import backend.tasks.llm as llm
+from backend.tasks.llm import LLMResponseCache
+
+
+def make_cache(path) -> LLMResponseCache:
+    return LLMResponseCache(str(path), max_size_bytes=1024 * 1024, max_age_seconds=3600, busy_timeout_ms=50)
+
+
+def lock(path) -> sqlite3.Connection:
+    """Hold the write lock of the database from another connection, like another process storing a completion."""
+    connection = sqlite3.connect(str(path), isolation_level=None)
+    connection.execute('BEGIN IMMEDIATE')
+    return connection
+
+
+def test_cache_uses_wal(tmp_path):
+    make_cache(tmp_path / 'cache.sqlite')
+
+    assert sqlite3.connect(str(tmp_path / 'cache.sqlite')).execute('PRAGMA journal_mode').fetchone() == ('wal',)
+
+
+def test_locked_database_is_a_skipped_store_and_a_hit(tmp_path):
+    llm_cache = make_cache(tmp_path / 'cache.sqlite')
+    llm_cache.set('stored', 'response')
+    connection = lock(tmp_path / 'cache.sqlite')
+
+    llm_cache.set('key', 'response')
+    # readers are not blocked by the writer, the access time is not updated
+    assert llm_cache.get('stored') == 'response'
+    connection.rollback()
+
+    assert llm_cache.get('key') is None
+    assert llm_cache.stats()['entries'] == 1
+
+
+def test_locked_cache_does_not_fail_the_completion(tmp_path, monkeypatch):
+    llm_cache = make_cache(tmp_path / 'cache.sqlite')
+    monkeypatch.setattr(llm, 'get_llm_cache', lambda: llm_cache)
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content='answer'))])
+
+    monkeypatch.setattr(llm.client.chat.completions, 'create', create)
+    connection = lock(tmp_path / 'cache.sqlite')
+
+    assert llm.chat_completion('prompt') == 'answer'
+    connection.rollback()
+    assert len(calls) == 1
+
+
+def test_stats_since(tmp_path):
+    llm_cache = make_cache(tmp_path / 'cache.sqlite')
+    llm_cache.set('key', 'response')
+    llm_cache.get('key')
+    llm_cache.get('other')
+    stats = llm_cache.stats()
+
+    llm_cache.get('key')
+    assert llm_cache.stats(since=stats) | {'size_bytes': 0} == {'hits': 1, 'misses': 0, 'hit_ratio': 1, 'entries': 1, 'size_bytes': 0}
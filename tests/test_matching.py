@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+from core.matching import AhoCorasick
+
+
+def find_all(patterns: dict[str, list], text: str) -> list[tuple[int, int, list]]:
+    return sorted(
+        (start, start + len(pattern), values)
+        for pattern, values in patterns.items()
+        for start in range(len(text) - len(pattern) + 1) if text.startswith(pattern, start)
+    )
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_matches_after_interleaved_adds(seed):
+    rng = random.Random(seed)
+    automaton = AhoCorasick()
+    patterns = {}
+    value = 0
+    for _ in range(30):
+        # a few patterns per sub part, sharing prefixes and suffixes over a small alphabet
+        for _ in range(rng.randint(0, 6)):
+            pattern = ''.join(rng.choices('abc', k=rng.randint(1, 5)))
+            automaton.add(pattern, value)
+            patterns.setdefault(pattern, []).append(value)
+            value += 1
+        text = ''.join(rng.choices('abcd', k=rng.randint(0, 60)))
+
+        assert sorted(automaton.iter_matches(text)) == find_all(patterns, text)
+
+
+def test_whole_words():
+    automaton = AhoCorasick()
+    automaton.add('win', 1)
+    list(automaton.iter_matches(''))
+    automaton.add('winston', 2)
+    automaton.add('ston', 3)
+
+    assert list(automaton.iter_matches('winston, win_ winston', whole_words=True)) == [(0, 7, [2]), (14, 21, [2])]
+
+
+def test_main_automaton_is_rebuilt_once_the_scans_outweigh_it():
+    automaton = AhoCorasick()
+    for i in range(100):
+        automaton.add(f'name {i}', i)
+    list(automaton.iter_matches('name'))
+    main = automaton._main
+
+    # short texts are scanned with the automaton of the recent patterns
+    automaton.add('julia', 100)
+    for _ in range(10):
+        assert list(automaton.iter_matches('julia and name 7')) == [(0, 5, [100]), (10, 16, [7])]
+    assert automaton._main is main and automaton._recent is not None
+
+    # a search without new patterns builds nothing
+    recent = automaton._recent
+    list(automaton.iter_matches('julia'))
+    assert automaton._recent is recent
+
+    # a long text costs more than rebuilding the main automaton
+    assert len(list(automaton.iter_matches('julia ' * 200))) == 200
+    assert automaton._main is not main and automaton._recent is None and len(automaton._main.pattern_indexes) == 101
+
+
+def test_known_pattern_keeps_the_automatons():
+    automaton = AhoCorasick()
+    automaton.add('julia', 1)
+    list(automaton.iter_matches('julia'))
+    main = automaton._main
+    automaton.add('julia', 2)
+
+    assert list(automaton.iter_matches('julia')) == [(0, 5, [1, 2])]
+    assert automaton._main is main and automaton._recent is None
+    assert len(automaton) == 1 and 'julia' in automaton
+
+
+def test_empty_pattern():
+    with pytest.raises(ValueError):
+        AhoCorasick().add('')
@@ -0,0 +1,83 @@
+import time
+import fakeredis
+
+from backend.tasks.queue import JobQueue, JobStatus
+
+
+def make_queue(**kwargs) -> JobQueue:
+    return JobQueue(fakeredis.FakeRedis(), **kwargs)
+
+
+def expire(job_queue: JobQueue, job_id: str):
+    job_queue.client.zadd(job_queue.deadlines_key, {job_id: time.time() - 1})
+
+
+def test_expired_job_is_requeued_once_by_concurrent_reapers():
+    job_queue = make_queue()
+    job_id = job_queue.enqueue('build_knowledge_base', {'book_id': 'b'})
+    job_queue.reserve(timeout=1)
+    expire(job_queue, job_id)
+
+    # two workers read the same expired deadline before either releases the job
+    assert job_queue.fail(job_id, 'Visibility timeout expired', expired_before=time.time())
+    assert not job_queue.fail(job_id, 'Visibility timeout expired', expired_before=time.time())
+
+    assert job_queue.client.lrange(job_queue.pending_key, 0, -1) == [job_id.encode()]
+    assert job_queue.get_job(job_id)['status'] == JobStatus.QUEUED
+
+
+def test_reaper_does_not_release_a_job_reserved_again():
+    job_queue = make_queue()
+    job_id = job_queue.enqueue('build_knowledge_base', {'book_id': 'b'})
+    job_queue.reserve(timeout=1)
+    expire(job_queue, job_id)
+    reaped_at = time.time()
+    assert job_queue.reap_expired_jobs() == [job_id]
+
+    # another worker reserves the requeued job, a late reaper still holding the old deadline must not requeue it
+    job_queue.reserve(timeout=1)
+    assert not job_queue.fail(job_id, 'Visibility timeout expired', expired_before=reaped_at)
+    assert job_queue.client.llen(job_queue.pending_key) == 0
+    assert job_queue.get_job(job_id)['status'] == JobStatus.RUNNING
+
+
+def test_job_requeued_by_the_reaper_is_not_completed_by_its_first_worker():
+    job_queue = make_queue()
+    job_id = job_queue.enqueue('build_knowledge_base', {'book_id': 'b'})
+    job_queue.reserve(timeout=1)
+    expire(job_queue, job_id)
+    assert job_queue.reap_expired_jobs() == [job_id]
+
+    # the first worker finishes late, the requeued job must still run and keep the book active
+    assert not job_queue.complete(job_id)
+    assert job_queue.client.lrange(job_queue.pending_key, 0, -1) == [job_id.encode()]
+    assert job_queue.get_job(job_id)['status'] == JobStatus.QUEUED
+    assert job_queue.get_active_job_ids('b') == [job_id]
+
+
+def test_failed_job_is_not_requeued_after_its_last_attempt():
+    job_queue = make_queue(max_retries=0)
+    job_id = job_queue.enqueue('extract_book_parts', {'book_id': 'b'})
+    job_queue.reserve(timeout=1)
+
+    assert job_queue.fail(job_id, 'error')
+    assert job_queue.client.llen(job_queue.pending_key) == 0
+    assert job_queue.get_job(job_id)['status'] == JobStatus.FAILED
+
+
+def test_active_jobs_of_a_book():
+    job_queue = make_queue(max_retries=1)
+    job_id = job_queue.enqueue('build_knowledge_base', {'book_id': 'b'})
+    other_job_id = job_queue.enqueue('extract_book_parts', {'book_id': 'b'})
+    assert sorted(job_queue.get_active_job_ids('b')) == sorted([job_id, other_job_id])
+
+    job_queue.reserve(timeout=1)
+    job_queue.complete(job_id)
+    # a job that is retried is still active
+    job_queue.reserve(timeout=1)
+    job_queue.fail(other_job_id, 'error')
+    assert job_queue.get_active_job_ids('b') == [other_job_id]
+
+    job_queue.reserve(timeout=1)
+    job_queue.fail(other_job_id, 'error')
+    assert job_queue.get_active_job_ids('b') == []
@@ -0,0 +1,123 @@
+import io
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from backend.storage import FileSystemBlobStore, S3BlobStore
+from core.hashing import hash_stream
+
+DATA = os.urandom(3 * 1024 * 1024 + 17)
+KEY = hash_stream(io.BytesIO(DATA))
+
+
+class FailingStream(io.BytesIO):
+    """Stream whose read fails after the first chunk, like a client disconnecting during an upload."""
+
+    def read(self, size=-1):
+        if self.tell() > 0:
+            raise ConnectionError('Client disconnected')
+        return super().read(size)
+
+
+def test_filesystem_store(tmp_path):
+    blob_store = FileSystemBlobStore(str(tmp_path))
+    assert not blob_store.exists(KEY)
+
+    blob_store.write_stream(KEY, io.BytesIO(DATA))
+    assert blob_store.exists(KEY)
+    assert os.path.exists(tmp_path / KEY[:2] / KEY[2:4] / KEY)
+    with blob_store.open(KEY) as f:
+        assert f.read() == DATA
+
+    # an existing key is not written again
+    blob_store.write_stream(KEY, io.BytesIO(b'other content'))
+    with blob_store.open(KEY) as f:
+        assert hash_stream(f) == KEY
+
+    blob_store.delete(KEY)
+    assert not blob_store.exists(KEY)
+    # deleting a missing blob is a no-op
+    blob_store.delete(KEY)
+
+
+def test_filesystem_store_failed_write_leaves_nothing(tmp_path):
+    blob_store = FileSystemBlobStore(str(tmp_path))
+
+    with pytest.raises(ConnectionError):
+        blob_store.write_stream(KEY, FailingStream(DATA))
+
+    assert not blob_store.exists(KEY)
+    assert os.listdir(tmp_path / KEY[:2] / KEY[2:4]) == []
+
+    blob_store.write_stream(KEY, io.BytesIO(DATA))
+    with blob_store.open(KEY) as f:
+        assert f.read() == DATA
+
+
+def test_filesystem_store_open_missing_blob(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        with FileSystemBlobStore(str(tmp_path)).open(KEY):
+            pass
+
+
+class ClientError(Exception):
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+class StubS3Client:
+    """The calls of the boto3 S3 client used by S3BlobStore, over a dict of objects."""
+
+    exceptions = SimpleNamespace(ClientError=ClientError)
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = 0
+        self.error_code = None
+
+    def head_object(self, Bucket: str, Key: str):
+        if self.error_code:
+            raise ClientError(self.error_code)
+        if (Bucket, Key) not in self.objects:
+            raise ClientError('404')
+        return {'ContentLength': len(self.objects[Bucket, Key])}
+
+    def upload_fileobj(self, Fileobj, Bucket: str, Key: str):
+        self.uploads += 1
+        self.objects[Bucket, Key] = Fileobj.read()
+
+    def download_fileobj(self, Bucket: str, Key: str, Fileobj):
+        if (Bucket, Key) not in self.objects:
+            raise ClientError('404')
+        Fileobj.write(self.objects[Bucket, Key])
+
+    def delete_object(self, Bucket: str, Key: str):
+        self.objects.pop((Bucket, Key), None)
+
+
+def test_s3_store():
+    client = StubS3Client()
+    blob_store = S3BlobStore('books', client=client, spool_max_size=1024)
+    assert not blob_store.exists(KEY)
+
+    blob_store.write_stream(KEY, io.BytesIO(DATA))
+    blob_store.write_stream(KEY, io.BytesIO(b'other content'))
+    assert client.uploads == 1
+    assert blob_store.exists(KEY)
+
+    # larger than spool_max_size, the blob is spooled to disk and readable from its start
+    with blob_store.open(KEY) as f:
+        assert f.read() == DATA
+
+    blob_store.delete(KEY)
+    assert not blob_store.exists(KEY)
+
+
+def test_s3_store_raises_other_errors():
+    client = StubS3Client()
+    client.error_code = 'AccessDenied'
+
+    with pytest.raises(ClientError):
+        S3BlobStore('books', client=client).exists(KEY)
@@ -0,0 +1,124 @@
+import json
+import os
+import random
+
+import pytest
+
+from core.config import parsing as parsing_config
+from core.parsing import ParsedItemCache, parse_item
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'items')
+FIXTURES = sorted(file_name for file_name in os.listdir(FIXTURES_DIR) if file_name.endswith('.xhtml'))
+ENGINES = ['bs4', 'lxml']
+# anchors referenced by the TOC in each fixture, the ones missing from the document get the whole text
+ANCHORS = {
+    'anchors.xhtml': ['chapter_1', 'chapter_2', 'chapter_3', 'chapter_4', 'chapter_4_nested', 'missing'],
+    'structure.xhtml': ['missing'],
+}
+
+
+class RawItem:
+    def __init__(self, content: bytes):
+        self.content = content
+
+    def get_body_content(self) -> bytes:
+        return self.content
+
+
+class RawItemsBook:
+    """Book serving raw documents, the engines see the bytes as they are stored in the EPUB file."""
+
+    def __init__(self, items: dict[str, bytes]):
+        self.items = items
+
+    def get_item_with_href(self, href: str) -> RawItem | None:
+        return RawItem(self.items[href]) if href in self.items else None
+
+
+def get_fragments(content: bytes, anchors: list[str], engine: str) -> dict[str, str]:
+    parsing_config['engine'], previous_engine = engine, parsing_config['engine']
+    try:
+        return ParsedItemCache(RawItemsBook({'item.xhtml': content}), {'item.xhtml': set(anchors)}).get_fragments('item.xhtml')
+    finally:
+        parsing_config['engine'] = previous_engine
+
+
+def read_fixture(file_name: str) -> bytes:
+    with open(os.path.join(FIXTURES_DIR, file_name), 'rb') as f:
+        return f.read()
+
+
+def golden_path(file_name: str) -> str:
+    return os.path.join(FIXTURES_DIR, file_name.removesuffix('.xhtml') + '.json')
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('file_name', FIXTURES)
+def test_fragments_match_golden_file(file_name, engine):
+    with open(golden_path(file_name), encoding='utf-8') as f:
+        golden = json.load(f)
+
+    assert get_fragments(read_fixture(file_name), ANCHORS.get(file_name, []), engine) == golden
+
+
+@pytest.mark.parametrize('file_name', FIXTURES)
+def test_parsed_item_is_identical(file_name, monkeypatch):
+    book = RawItemsBook({'item.xhtml': read_fixture(file_name)})
+    parsed = {}
+    for engine in ENGINES:
+        monkeypatch.setitem(parsing_config, 'engine', engine)
+        parsed[engine] = parse_item(book, 'item.xhtml', 'Chapter One')
+
+    assert parsed['bs4'] == parsed['lxml']
+
+
+TAGS = ['p', 'div', 'span', 'b', 'i', 'h1', 'h2', 'br', 'script', 'style', 'rt', 'rp', 'ruby', 'template', 'table', 'tr', 'td',
+        'ul', 'li', 'pre', 'a', 'sup', 'body', 'html', 'head', 'title', 'img', 'hr', 'section', 'blockquote', 'textarea']
+TEXTS = ['hello', ' world ', '\n', '  ', '\n\n  \n', 'é’ça', '&amp;', '&nbsp;', 'x  y', 'a\nb', '\t', '<!-- c -->', '<?pi x?>',
+         '<![CDATA[z]]>', '&#160;', ' ', '<', '>']
+
+
+def random_markup(rng: random.Random, depth: int = 0) -> str:
+    """Random and often malformed markup : unclosed and stray tags, comments, entities, anchors."""
+    markup = []
+    for _ in range(rng.randint(0, 5)):
+        r = rng.random()
+        if r < 0.45 and depth < 6:
+            tag = rng.choice(TAGS)
+            id_attribute = f' id="a{rng.randint(0, 6)}"' if rng.random() < 0.3 else ''
+            if rng.random() < 0.1:
+                markup.append(f'<{tag}{id_attribute}/>')
+            else:
+                markup.append(f'<{tag}{id_attribute}>' + random_markup(rng, depth + 1) + (f'</{tag}>' if rng.random() < 0.85 else ''))
+        elif r < 0.5:
+            markup.append(f'</{rng.choice(TAGS)}>')
+        else:
+            markup.append(rng.choice(TEXTS))
+    return ''.join(markup)
+
+
+def test_engines_agree_on_random_markup():
+    rng = random.Random(1)
+    for _ in range(2000):
+        markup = random_markup(rng)
+        if rng.random() < 0.5:
+            markup = '<body>' + markup + '</body>'
+        anchors = sorted({f'a{rng.randint(0, 6)}' for _ in range(rng.randint(0, 3))})
+
+        fragments = {}
+        for engine in ENGINES:
+            try:
+                fragments[engine] = get_fragments(markup.encode('utf-8'), anchors, engine)
+            except (AttributeError, ValueError):
+                # no body : bs4 fails on soup.body, lxml raises ValueError
+                fragments[engine] = None
+        assert fragments['bs4'] == fragments['lxml'], (markup, anchors)
+
+
+if __name__ == '__main__':
+    # write the golden files from the BeautifulSoup engine, the reference implementation
+    for file_name in FIXTURES:
+        with open(golden_path(file_name), 'w', encoding='utf-8') as f:
+            json.dump(get_fragments(read_fixture(file_name), ANCHORS.get(file_name, []), 'bs4'), f, ensure_ascii=False, indent=4, sort_keys=True)
+            f.write('\n')
+        print(f'Written {golden_path(file_name)}')
@@ -0,0 +1,128 @@
+import asyncio
+import random
+import time
+import uuid
+
+import fakeredis
+import httpx
+import pytest
+
+from conftest import write_epub
+
+try:
+    from backend.database import async_engine
+    from backend.main import app
+    from backend.models.books import Book
+    from backend.models.users import User
+    from backend.routers.auth import create_access_token
+    from backend.routers.books import inspect_epub
+    from backend.storage import FileSystemBlobStore, get_blob_store, hash_stream
+    from backend.tasks.queue import JobQueue, get_job_queue
+except ValueError:
+    # the connection url is built from unset variables
+    pytest.skip('The database is not configured', allow_module_level=True)
+
+UPLOADS = 3
+
+
+def write_large_epub(path, seed: int):
+    """EPUB file of about 30 MB, stored uncompressed."""
+    rng = random.Random(seed)
+    words = ['the', 'night', 'was', 'dark', 'and', 'Winston', 'walked', 'through', 'ministry', 'of', 'truth']
+    chapters = [(f'Chapter {i}', ''.join(f'<p>{" ".join(rng.choices(words, k=100))}</p>' for _ in range(2500))) for i in range(20)]
+    write_epub(path, chapters, title=f'Book {seed}')
+
+
+def get_blocking_duration(path) -> float:
+    """Time taken by the hashing and the inspection of a file, the event loop would be blocked as long if they ran on it."""
+    with open(path, 'rb') as f:
+        start = time.perf_counter()
+        hash_stream(f)
+        inspect_epub(f)
+        return time.perf_counter() - start
+
+
+@pytest.fixture
+def users(db):
+    users = [User(name='test_' + uuid.uuid4().hex, email=uuid.uuid4().hex + '@example.com', password='x') for _ in range(UPLOADS + 1)]
+    db.add_all(users)
+    db.commit()
+    yield users
+
+    db.rollback()
+    user_ids = [user.id for user in users]
+    data_hashes = [data_hash for data_hash, in db.query(Book.data_hash).filter(Book.user_id.in_(user_ids))]
+    db.query(Book).filter(Book.user_id.in_(user_ids)).delete()
+    db.query(Book).filter(Book.user_id.is_(None), Book.data_hash.in_(data_hashes)).delete()
+    db.query(User).filter(User.id.in_(user_ids)).delete()
+    db.commit()
+
+
+@pytest.fixture
+def client_app(tmp_path):
+    app.dependency_overrides[get_job_queue] = lambda: JobQueue(fakeredis.FakeRedis())
+    app.dependency_overrides[get_blob_store] = lambda: FileSystemBlobStore(str(tmp_path / 'blobs'))
+    yield app
+    app.dependency_overrides.clear()
+
+
+def get_headers(user: User) -> dict:
+    return {'Authorization': 'Bearer ' + create_access_token({'sub': user.name})}
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval: float = 0.005) -> float:
+    """Largest delay of a timer of the event loop until stop is set."""
+    max_lag = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        max_lag = max(max_lag, time.perf_counter() - start - interval)
+    return max_lag
+
+
+async def poll_books(client: httpx.AsyncClient, headers: dict, stop: asyncio.Event) -> list[float]:
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get('/api/books/', headers=headers)
+        assert response.status_code == 200
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def test_event_loop_stays_responsive_during_uploads(client_app, users, tmp_path):
+    paths = []
+    for i in range(UPLOADS):
+        paths.append(tmp_path / f'book_{i}.epub')
+        write_large_epub(paths[-1], i)
+    blocking_duration = get_blocking_duration(paths[0])
+
+    async def run():
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=client_app), base_url='http://test') as client:
+                # warm up the connections and the user cache before measuring
+                await client.get('/api/books/', headers=get_headers(users[-1]))
+
+                stop = asyncio.Event()
+                lag = asyncio.create_task(measure_loop_lag(stop))
+                poll = asyncio.create_task(poll_books(client, get_headers(users[-1]), stop))
+                # the files are sent in chunks, like the body received by the server from a real connection
+                files = [open(path, 'rb') for path in paths]
+                uploads = await asyncio.gather(*[
+                    client.post('/api/books/upload/', headers=get_headers(user), files={'uploaded_file': ('book.epub', file, 'application/epub+zip')})
+                    for user, file in zip(users, files)
+                ])
+                for file in files:
+                    file.close()
+                stop.set()
+                return uploads, await lag, await poll
+        finally:
+            await async_engine.dispose()
+
+    uploads, max_lag, latencies = asyncio.run(run())
+
+    assert [response.status_code for response in uploads] == [200] * UPLOADS
+    assert len({response.json()['title'] for response in uploads}) == UPLOADS
+    assert latencies
+    # the work of an upload runs in the threadpool, the longest pause of the event loop is a fraction of it
+    assert max_lag < blocking_duration / 2, f'event loop blocked for {max_lag * 1000:.0f} ms, the work of one upload takes {blocking_duration * 1000:.0f} ms'